@@ -0,0 +1,65 @@
+# benchmarks/bench_agent_codes.py
+"""
+كلفة تسجيل عملية كود وكيل حسب حجم السجل:
+- rewrite  السلوك السابق: تحميل secret_codes.json كاملًا، إضافة عملية، إعادة كتابته بـ indent=2
+- append   agent_codes_service.record (سطر JSON واحد + fsync)
+
+التشغيل (من جذر المشروع):
+    python -m benchmarks.bench_agent_codes --history 1000,10000,50000 --ops 200
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from services import agent_codes_service
+
+
+def _op(i):
+    return {"user": f"user{i % 97}", "amount": 1000 + i, "date": "2025-01-01 10:00"}
+
+
+def bench_rewrite(path, history, ops):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"363836369": [_op(i) for i in range(history)]}, f)
+    t0 = time.perf_counter()
+    for i in range(ops):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        data.setdefault("363836369", []).append(_op(i))
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    return (time.perf_counter() - t0) / ops
+
+
+def bench_append(path, history, ops):
+    agent_codes_service._codes.clear()
+    agent_codes_service._log = None
+    agent_codes_service._lines = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(history):
+            f.write(json.dumps(dict(_op(i), code="363836369"), ensure_ascii=False) + "\n")
+    with agent_codes_service._lock:
+        agent_codes_service._open(path)
+    t0 = time.perf_counter()
+    for i in range(ops):
+        agent_codes_service.record("363836369", f"user{i}", 1000 + i, "2025-01-01 10:00")
+    return (time.perf_counter() - t0) / ops
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent code log benchmark")
+    parser.add_argument("--history", default="1000,10000,50000")
+    parser.add_argument("--ops", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for history in (int(h) for h in args.history.split(",")):
+            rewrite = bench_rewrite(os.path.join(tmp, f"codes_{history}.json"), history, args.ops)
+            append = bench_append(os.path.join(tmp, f"codes_{history}.jsonl"), history, args.ops)
+            print(f"history={history:<7} rewrite={rewrite * 1000:8.2f} ms/op  append={append * 1000:6.3f} ms/op")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# benchmarks/bench_inactive_sweep.py
+"""
+مقارنة مسح المستخدمين غير النشطين على بيانات اصطناعية (DB_BACKEND=local):
+- legacy: الطريقة القديمة (select * ثم استعلامان وحتى 3 حذف لكل مستخدم)
+  تُقاس على عينة لأنها بطيئة، ثم تُقدَّر للحجم الكامل.
+- set-based: user_last_activity بصفحات keyset + purge_users على دفعات.
+
+يُطبع عدد الرحلات (round trips) أيضًا، لأن الكلفة الحقيقية على Supabase
+هي زمن الشبكة لكل رحلة وليست زمن المعالجة المحلي.
+
+التشغيل (من جذر المشروع):
+    python -m benchmarks.bench_inactive_sweep [عدد_المستخدمين]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DB_BACKEND", "local")
+
+from database import db  # noqa: E402
+from database.local_backend import LocalClient  # noqa: E402
+from services import cleanup_service  # noqa: E402
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+LEGACY_SAMPLE = 2_000
+DELETE_AFTER_DAYS = 35
+WARN_BEFORE_DAYS = 5
+ASSUMED_RTT_MS = 20
+
+
+class CountingClient(LocalClient):
+    """LocalClient يعدّ الرحلات إلى قاعدة البيانات."""
+
+    def __init__(self):
+        super().__init__()
+        self.round_trips = 0
+
+    def execute(self, query):
+        self.round_trips += 1
+        return super().execute(query)
+
+    def call(self, name, params):
+        self.round_trips += 1
+        return super().call(name, params)
+
+
+def populate(client, users, seed=7):
+    rnd = random.Random(seed)
+    now = datetime.utcnow()
+    houssin, txns, purchases = client.get("houssin363"), client.get("transactions"), client.get("purchases")
+    for user_id in range(1, users + 1):
+        created = now - timedelta(days=rnd.randint(0, 90), seconds=rnd.randint(0, 86400))
+        houssin.insert({"user_id": user_id, "name": "u", "created_at": created.isoformat()})
+        for _ in range(rnd.randint(0, 3)):
+            ts = created + timedelta(days=rnd.randint(0, max(0, (now - created).days)))
+            txns.insert({"user_id": user_id, "amount": 1000, "description": "إيداع", "timestamp": ts.isoformat()})
+        for _ in range(rnd.randint(0, 2)):
+            ts = created + timedelta(days=rnd.randint(0, max(0, (now - created).days)))
+            purchases.insert({"user_id": user_id, "product_id": 1, "price": 1000, "created_at": ts.isoformat()})
+
+
+def legacy_sweep(client):
+    now = datetime.utcnow()
+    deleted = warned = 0
+    for user in client.table("houssin363").select("*").execute().data:
+        user_id = user["user_id"]
+        last = user["created_at"]
+        t = client.table("transactions").select("timestamp").eq("user_id", user_id) \
+            .order("timestamp", desc=True).limit(1).execute()
+        p = client.table("purchases").select("created_at").eq("user_id", user_id) \
+            .order("created_at", desc=True).limit(1).execute()
+        if t.data:
+            last = max(last, t.data[0]["timestamp"])
+        if p.data:
+            last = max(last, p.data[0]["created_at"])
+        days = (now - datetime.strptime(last[:19], "%Y-%m-%dT%H:%M:%S")).days
+        if DELETE_AFTER_DAYS - WARN_BEFORE_DAYS <= days < DELETE_AFTER_DAYS:
+            warned += 1
+        elif days >= DELETE_AFTER_DAYS:
+            for table in ("houssin363", "transactions", "purchases"):
+                client.table(table).delete().eq("user_id", user_id).execute()
+            deleted += 1
+    return deleted, warned
+
+
+def set_based_sweep():
+    now = datetime.utcnow()
+    warn_from = now - timedelta(days=DELETE_AFTER_DAYS - WARN_BEFORE_DAYS)
+    deleted = warned = 0
+    to_delete = []
+    for row in cleanup_service.iter_inactive_users(warn_from):
+        days = (now - datetime.strptime(row["last_activity"][:19], "%Y-%m-%dT%H:%M:%S")).days
+        if days >= DELETE_AFTER_DAYS:
+            to_delete.append(row["user_id"])
+            if len(to_delete) >= cleanup_service.DELETE_CHUNK_SIZE:
+                deleted += cleanup_service.purge_users(to_delete)
+                to_delete = []
+        elif days >= DELETE_AFTER_DAYS - WARN_BEFORE_DAYS:
+            warned += 1
+    if to_delete:
+        deleted += cleanup_service.purge_users(to_delete)
+    return deleted, warned
+
+
+def report(name, users, elapsed, trips, deleted, warned):
+    net = trips * ASSUMED_RTT_MS / 1000
+    print(f"{name:<22} users={users:>7}  local={elapsed:>7.2f}s  round_trips={trips:>8}  "
+          f"@{ASSUMED_RTT_MS}ms RTT≈{net:>8.1f}s  deleted={deleted} warned={warned}")
+
+
+def main():
+    sample = min(LEGACY_SAMPLE, USERS)
+    legacy = CountingClient()
+    populate(legacy, sample)
+    start = time.perf_counter()
+    deleted, warned = legacy_sweep(legacy)
+    elapsed = time.perf_counter() - start
+    report("legacy (sample)", sample, elapsed, legacy.round_trips, deleted, warned)
+    scale = USERS / sample
+    report("legacy (extrapolated)", USERS, elapsed * scale, int(legacy.round_trips * scale),
+           int(deleted * scale), int(warned * scale))
+
+    client = CountingClient()
+    db.client = client
+    populate(client, USERS)
+    start = time.perf_counter()
+    deleted, warned = set_based_sweep()
+    elapsed = time.perf_counter() - start
+    report("set-based", USERS, elapsed, client.round_trips, deleted, warned)
+
+
+if __name__ == "__main__":
+    main()
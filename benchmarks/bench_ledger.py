@@ -0,0 +1,63 @@
+# benchmarks/bench_ledger.py
+"""
+مقارنة كتابة صفوف السجل (transactions) عبر PostgREST محلي بتأخير مصطنع:
+- sync          إدراج صف واحد لكل حركة داخل طلب المستخدم (السلوك السابق)
+- write-behind  ledger_writer.append (journal + fsync) ثم إدراج على دفعات
+
+يُطبع زمن append الذي ينتظره المستخدم، والزمن حتى إدراج كل الصفوف لكل حجم دفعة.
+
+التشغيل (من جذر المشروع):
+    python -m benchmarks.bench_ledger --rows 1000 --db-latency-ms 20
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.fake_postgrest import FakePostgrest
+
+
+def _row(i):
+    return {"user_id": 1000 + i % 50, "amount": -1000, "description": f"bench {i}",
+            "timestamp": "2025-01-01T00:00:00"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ledger write-behind benchmark")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--db-latency-ms", type=float, default=20.0)
+    parser.add_argument("--batch-sizes", default="10,50,200")
+    args = parser.parse_args()
+
+    fake_db = FakePostgrest(latency_ms=args.db_latency_ms).start()
+    os.environ["SUPABASE_URL"] = fake_db.url
+    os.environ["DB_BACKEND"] = "supabase"
+    from database.db import get_table
+    from services import ledger_writer
+
+    sync_rows = min(args.rows, 200)
+    t0 = time.perf_counter()
+    for i in range(sync_rows):
+        get_table("transactions").insert(_row(i)).execute()
+    per_row = (time.perf_counter() - t0) / sync_rows
+    print(f"sync          append={per_row * 1000:8.2f} ms/row  "
+          f"≈{1 / per_row:8.0f} rows/s  (sample {sync_rows})")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ledger_writer.start(os.path.join(tmp, "ledger.jsonl"))
+        for size in (int(s) for s in args.batch_sizes.split(",")):
+            ledger_writer.LEDGER_BATCH_SIZE = size
+            t0 = time.perf_counter()
+            for i in range(args.rows):
+                ledger_writer.append("transactions", _row(i))
+            appended = time.perf_counter() - t0
+            while ledger_writer.pending():
+                ledger_writer.flush()
+            total = time.perf_counter() - t0
+            print(f"batch={size:<5} append={appended / args.rows * 1000:8.3f} ms/row  "
+                  f"all rows inserted in {total:6.2f}s ≈{args.rows / max(total, 1e-9):8.0f} rows/s")
+    print(f"PostgREST requests: {fake_db.requests}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_router.py
+"""
+قياس تكلفة توجيه التحديث الواحد مع ازدياد عدد المعالجات:
+- linear: معالجات telebot التقليدية (lambda msg: msg.text == "...")
+- router: نفس المعالجات عبر handlers.router (dict + trie)
+
+التشغيل (من جذر المشروع):
+    python -m benchmarks.bench_router
+"""
+import json
+import time
+
+import telebot
+from telebot import types
+
+from handlers import router
+
+SIZES = (10, 50, 100, 200, 400)
+ROUNDS = 2000
+
+
+def _message(text, i=0):
+    return types.Message.de_json(json.dumps({
+        "message_id": i,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "u"},
+        "text": text,
+    }))
+
+
+def _callback(data, i=0):
+    return types.CallbackQuery.de_json(json.dumps({
+        "id": str(i),
+        "chat_instance": "x",
+        "data": data,
+        "from": {"id": 1, "is_bot": False, "first_name": "u"},
+        "message": {
+            "message_id": i, "date": 0,
+            "chat": {"id": 1, "type": "private"},
+        },
+    }))
+
+
+def _noop(update):
+    pass
+
+
+def build_linear(n):
+    bot = telebot.TeleBot("123:abc", threaded=False)
+    for i in range(n):
+        text, prefix = f"btn_{i}", f"cb{i}_"
+        bot.message_handler(func=lambda m, t=text: m.text == t)(_noop)
+        bot.callback_query_handler(func=lambda c, p=prefix: c.data.startswith(p))(_noop)
+    return bot
+
+
+def build_routed(n):
+    bot = telebot.TeleBot("123:abc", threaded=False)
+    for i in range(n):
+        router.on_text(bot, f"btn_{i}")(_noop)
+        router.on_callback_prefix(bot, f"cb{i}_")(_noop)
+    return bot
+
+
+def _measure(bot, n):
+    # أسوأ حالة للمسح الخطي: آخر معالج مسجَّل
+    messages = [_message(f"btn_{n - 1}", i) for i in range(ROUNDS)]
+    calls = [_callback(f"cb{n - 1}_42", i) for i in range(ROUNDS)]
+
+    start = time.perf_counter()
+    bot.process_new_messages(messages)
+    msg_us = (time.perf_counter() - start) / ROUNDS * 1e6
+
+    start = time.perf_counter()
+    bot.process_new_callback_query(calls)
+    cb_us = (time.perf_counter() - start) / ROUNDS * 1e6
+    return msg_us, cb_us
+
+
+def main():
+    print(f"{'handlers':>9} | {'linear msg':>11} {'router msg':>11} | {'linear cb':>10} {'router cb':>10}  (µs/update)")
+    for n in SIZES:
+        lin_msg, lin_cb = _measure(build_linear(n), n)
+        rt_msg, rt_cb = _measure(build_routed(n), n)
+        print(f"{n:>9} | {lin_msg:>11.1f} {rt_msg:>11.1f} | {lin_cb:>10.1f} {rt_cb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
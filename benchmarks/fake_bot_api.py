@@ -0,0 +1,107 @@
+# benchmarks/fake_bot_api.py
+"""
+خادم HTTP محلي يحاكي Telegram Bot API بالقدر الذي تحتاجه المعالجات
+(sendMessage, editMessageText, answerCallbackQuery, sendPhoto, ...).
+يعيد نتائج بنفس شكل تيليجرام ويعدّ الاستدعاءات لكل طريقة.
+
+    fake = FakeBotApi().start()
+    telebot.apihelper.API_URL = fake.api_url
+"""
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+_BOT_USER = {"id": 123, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+
+class FakeBotApi:
+    def __init__(self, latency_ms=0.0, host="127.0.0.1", port=0):
+        self.latency = latency_ms / 1000.0
+        self.calls = Counter()
+        self._ids = itertools.count(1000)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def api_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="FakeBotApi", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+    def _message(self, params, **extra):
+        chat_id = int(params.get("chat_id") or 0)
+        with self._lock:
+            message_id = int(params.get("message_id") or next(self._ids))
+        msg = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": _BOT_USER,
+        }
+        msg.update(extra)
+        return msg
+
+    def handle(self, method, params):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[method] += 1
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params, text=params.get("text", ""))
+        if method in ("sendPhoto",):
+            return self._message(params, photo=[{"file_id": "f", "file_unique_id": "u", "width": 1, "height": 1}],
+                                 caption=params.get("caption", ""))
+        if method in ("editMessageReplyMarkup", "editMessageCaption"):
+            return self._message(params)
+        if method == "getMe":
+            return _BOT_USER
+        if method == "getChatMember":
+            return {"status": "member", "user": {"id": int(params.get("user_id") or 0), "is_bot": False, "first_name": "u"}}
+        return True
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _serve(self):
+                url = urlsplit(self.path)
+                method = url.path.rsplit("/", 1)[-1]
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if raw and self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                    params.update(parse_qsl(raw.decode()))
+                elif raw and self.headers.get("Content-Type", "").startswith("application/json"):
+                    params.update(json.loads(raw))
+                data = json.dumps({"ok": True, "result": api.handle(method, params)}, ensure_ascii=False).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _serve
+
+        return Handler
+
+
+if __name__ == "__main__":
+    fake = FakeBotApi(port=8089).start()
+    print(f"fake Bot API: {fake.api_url}")
+    threading.Event().wait()
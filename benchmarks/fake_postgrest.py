@@ -0,0 +1,161 @@
+# benchmarks/fake_postgrest.py
+"""
+خادم HTTP محلي يحاكي جزء PostgREST الذي يستخدمه عميل supabase-py في المشروع،
+مبني فوق database.local_backend.LocalClient (نفس الجداول ودوال RPC).
+
+    /rest/v1/<table>        GET (select) / POST (insert, upsert) / PATCH / DELETE
+    /rest/v1/rpc/<function> POST
+
+يكفي توجيه العميل إليه عبر متغير البيئة SUPABASE_URL قبل استيراد database.db.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from postgrest.exceptions import APIError
+
+from database.local_backend import LocalClient
+
+_OPS = ("eq", "neq", "gt", "gte", "lt", "lte", "in", "is")
+_INT = re.compile(r"^-?(0|[1-9]\d*)$")
+
+
+def _value(raw):
+    raw = raw.strip()
+    if len(raw) >= 2 and raw[0] == raw[-1] == '"':
+        return raw[1:-1]
+    if raw == "null":
+        return None
+    if raw in ("true", "false"):
+        return raw == "true"
+    if _INT.match(raw):
+        return int(raw)
+    return raw
+
+
+def _split_list(raw):
+    """in.(a,b,"c,d") ← قائمة قيم."""
+    return [_value(v) for v in re.findall(r'"[^"]*"|[^,]+', raw.strip()[1:-1])]
+
+
+class FakePostgrest:
+    """يشغّل الخادم في خيط خلفي؛ client هو LocalClient الداخلي للبذر والفحص."""
+
+    def __init__(self, client=None, latency_ms=0.0, host="127.0.0.1", port=0):
+        self.client = client or LocalClient()
+        self.latency = latency_ms / 1000.0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="FakePostgrest", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+    # ---------- تحويل الطلب إلى استعلام LocalClient ----------
+    def _query(self, table, params):
+        query = self.client.table(table)
+        for key, raw in params:
+            if key == "select":
+                query = query.select(raw)
+            elif key == "order":
+                for part in raw.split(","):
+                    bits = part.split(".")
+                    query = query.order(bits[0], desc=len(bits) > 1 and bits[1] == "desc")
+            elif key == "limit":
+                query = query.limit(int(raw))
+            elif key == "offset":
+                query._offset = int(raw)
+            elif key in ("columns", "on_conflict"):
+                continue
+            else:
+                op, _, value = raw.partition(".")
+                if op not in _OPS:
+                    raise APIError({"message": f"unsupported filter {raw}", "code": "PGRST100"})
+                if op == "in":
+                    query = query.in_(key, _split_list(value))
+                else:
+                    query = query._filter(key, op, _value(value))
+        return query
+
+    def handle(self, method, path, params, headers, body):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+        parts = path.strip("/").split("/")
+        if parts[:2] != ["rest", "v1"] or len(parts) < 3:
+            return 404, {"message": "not found"}
+        if parts[2] == "rpc":
+            return 200, self.client.rpc(parts[3], body or {}).execute().data
+
+        table = parts[2]
+        on_conflict = dict(params).get("on_conflict", "")
+        prefer = headers.get("Prefer", "")
+        if method == "GET":
+            return 200, self._query(table, params).execute().data
+        if method == "POST":
+            query = self.client.table(table)
+            if "resolution=merge-duplicates" in prefer:
+                query = query.upsert(body, on_conflict=on_conflict)
+            elif "resolution=ignore-duplicates" in prefer:
+                query = query.upsert(body, on_conflict=on_conflict, ignore_duplicates=True)
+            else:
+                query = query.insert(body)
+            return 201, query.execute().data
+        if method == "PATCH":
+            return 200, self._query(table, params).update(body).execute().data
+        if method == "DELETE":
+            return 200, self._query(table, params).delete().execute().data
+        return 405, {"message": "method not allowed"}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _serve(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                body = json.loads(raw) if raw else None
+                try:
+                    code, payload = server.handle(
+                        self.command, url.path, parse_qsl(url.query, keep_blank_values=True), self.headers, body
+                    )
+                except APIError as e:
+                    code, payload = 400, {"message": e.message, "code": e.code, "details": None, "hint": None}
+                except Exception as e:
+                    code, payload = 500, {"message": str(e), "code": "XX000", "details": None, "hint": None}
+                data = json.dumps(payload, ensure_ascii=False, default=str).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _serve
+
+        return Handler
+
+
+if __name__ == "__main__":
+    fake = FakePostgrest(port=54321).start()
+    print(f"fake PostgREST on {fake.url}")
+    threading.Event().wait()
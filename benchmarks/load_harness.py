@@ -0,0 +1,247 @@
+# benchmarks/load_harness.py
+"""
+حمل شامل (end-to-end) على المعالجات الحقيقية بدون شبكة:
+- Telegram Bot API  ← benchmarks/fake_bot_api.FakeBotApi
+- Supabase/PostgREST ← benchmarks/fake_postgrest.FakePostgrest (عبر SUPABASE_URL)
+- تسجيل نفس المعالجات وبنفس ترتيب main.py على TeleBot(threaded=False)
+
+مستخدمون افتراضيون متزامنون ينفذون رحلات (products, bill_and_units,
+cash_transfer, recharge)؛ يُقاس زمن معالجة كل تحديث ويُطبع p50/p95/p99
+وعدد التحديثات/ث لكل رحلة.
+
+التشغيل (من جذر المشروع):
+    python -m benchmarks.load_harness --users 20 --iterations 5 --api-latency-ms 20 --db-latency-ms 15
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_bot_api import FakeBotApi
+from benchmarks.fake_postgrest import FakePostgrest
+
+START_BALANCE = 10_000_000
+
+# كل خطوة: ("text", نص) أو ("callback", data) أو ("photo", None)
+JOURNEYS = {
+    "products": [
+        ("text", "🛒 المنتجات"),
+        ("text", "🎮 شحن ألعاب و تطبيقات"),
+        ("text", "🎯 شحن شدات ببجي العالمية"),
+        ("callback", "select_2"),
+        ("text", "5123456789"),
+        ("callback", "final_confirm_order"),
+    ],
+    "bill_and_units": [
+        ("text", "💳 تحويل وحدات فاتورة سوري"),
+        ("callback", "ubm:syr_units"),
+        ("callback", "syrunits:page:1"),
+        ("callback", "syrunits:sel:6"),
+        ("text", "0933123456"),
+        ("callback", "syr_unit_final_confirm"),
+    ],
+    "cash_transfer": [
+        ("text", "🧧 تحويل كاش من محفظتك"),
+        ("callback", "cash_sel_0"),
+        ("callback", "commission_confirm"),
+        ("text", "0933123456"),
+        ("callback", "number_confirm"),
+        ("text", "25000"),
+        ("callback", "cash_confirm"),
+    ],
+    "recharge": [
+        ("text", "💳 شحن محفظتي"),
+        ("text", "📲 سيرياتيل كاش"),
+        ("callback", "confirm_recharge_method"),
+        ("photo", None),
+        ("text", "REF-778899"),
+        ("text", "50000"),
+        ("callback", "user_confirm_recharge"),
+    ],
+}
+
+_update_ids = itertools.count(1)
+_ids_lock = threading.Lock()
+
+
+def _next_id():
+    with _ids_lock:
+        return next(_update_ids)
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"u{user_id}", "username": f"u{user_id}"}
+
+
+def make_update(kind, value, user_id):
+    from telebot import types
+
+    uid = _next_id()
+    chat = {"id": user_id, "type": "private"}
+    if kind == "callback":
+        payload = {"update_id": uid, "callback_query": {
+            "id": str(uid), "chat_instance": "bench", "data": value, "from": _user(user_id),
+            "message": {"message_id": uid, "date": int(time.time()), "chat": chat},
+        }}
+    else:
+        message = {"message_id": uid, "date": int(time.time()), "chat": chat, "from": _user(user_id)}
+        if kind == "photo":
+            message["photo"] = [{"file_id": f"photo-{uid}", "file_unique_id": str(uid), "width": 1, "height": 1}]
+        else:
+            message["text"] = value
+        payload = {"update_id": uid, "message": message}
+    return types.Update.de_json(json.dumps(payload))
+
+
+def build_bot():
+    """نفس تسجيل main.py (بدون تشغيل polling أو الخوادم)."""
+    import telebot
+    from handlers import (
+        start, wallet, support, admin, recharge, cash_transfer, companies_transfer,
+        products, media_services, wholesale, university_fees, internet_providers, bill_and_units, registry,
+    )
+    from services import metrics, send_scheduler
+    from services.queue_service import init_queue
+    from services.session_store import menu_state as user_state, history
+
+    bot = telebot.TeleBot("123:BENCH", threaded=False)
+    send_scheduler.install(bot)
+    start.register(bot, user_state)
+    wallet.register(bot, history)
+    support.register(bot, user_state)
+    admin.register(bot, user_state)
+    recharge.register(bot, user_state)
+    cash_transfer.register(bot, history)
+    companies_transfer.register_companies_transfer(bot, history)
+    bill_and_units.register(bot)
+    products.register(bot, user_state)
+    media_services.register(bot, user_state)
+    wholesale.register(bot, user_state)
+    university_fees.register_university_fees(bot, history)
+    internet_providers.register(bot)
+    products.setup_inline_handlers(bot, [])
+    registry.freeze(bot)
+    init_queue(bot)
+    metrics.install(bot)
+    return bot
+
+
+def seed_users(db, user_ids):
+    users = db.get("houssin363")
+    for user_id in user_ids:
+        users.insert({"user_id": user_id, "name": f"u{user_id}", "balance": START_BALANCE})
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def run(users, iterations, flows, api_latency_ms=0.0, db_latency_ms=0.0, telegram_limits=False):
+    if not telegram_limits:
+        # البديل المحلي لا يفرض حدود تيليجرام: الإرسال يمر بالمجدول لكن بلا انتظار دلاء
+        os.environ.setdefault("SEND_GLOBAL_RATE", "1e9")
+        os.environ.setdefault("SEND_PER_CHAT_RATE", "1e9")
+    fake_api = FakeBotApi(latency_ms=api_latency_ms).start()
+    fake_db = FakePostgrest(latency_ms=db_latency_ms).start()
+    os.environ["SUPABASE_URL"] = fake_db.url
+    os.environ["DB_BACKEND"] = "supabase"
+
+    import telebot
+    telebot.apihelper.API_URL = fake_api.api_url
+    bot = build_bot()
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    # كل رحلة بمستخدم جديد: لا تتداخل الحالات ولا "طلب قيد الانتظار"
+    journey_users = {
+        (vu, it, flow): 10_000_000 + (vu * iterations + it) * len(flows) + n
+        for vu in range(users) for it in range(iterations) for n, flow in enumerate(flows)
+    }
+    seed_users(fake_db.client, journey_users.values())
+
+    latencies = defaultdict(list)
+    busy = defaultdict(float)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def virtual_user(vu):
+        for it in range(iterations):
+            for flow in flows:
+                user_id = journey_users[(vu, it, flow)]
+                for kind, value in JOURNEYS[flow]:
+                    update = make_update(kind, value, user_id)
+                    t0 = time.perf_counter()
+                    try:
+                        bot.process_new_updates([update])
+                    except Exception:
+                        logging.exception(f"[BENCH] {flow} step {kind}:{value}")
+                        with lock:
+                            errors[flow] += 1
+                    dt = time.perf_counter() - t0
+                    with lock:
+                        latencies[flow].append(dt)
+                        busy[flow] += dt
+
+    wall = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(virtual_user, range(users)))
+    wall = time.perf_counter() - wall
+
+    print(f"\nusers={users} iterations={iterations} api_latency={api_latency_ms}ms "
+          f"db_latency={db_latency_ms}ms wall={wall:.2f}s")
+    print(f"{'flow':<16}{'updates':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'upd/s':>9}{'errors':>8}")
+    total = 0
+    for flow in flows:
+        values = latencies[flow]
+        total += len(values)
+        # upd/s: نصيب الرحلة من زمن الجدار بحسب زمن انشغالها
+        share = busy[flow] / max(sum(busy.values()), 1e-9) * wall
+        print(f"{flow:<16}{len(values):>8}"
+              f"{percentile(values, 50) * 1000:>9.1f}{percentile(values, 95) * 1000:>9.1f}"
+              f"{percentile(values, 99) * 1000:>9.1f}{len(values) / max(share, 1e-9):>9.1f}{errors[flow]:>8}")
+    all_values = [v for flow in flows for v in latencies[flow]]
+    print(f"{'ALL':<16}{total:>8}{percentile(all_values, 50) * 1000:>9.1f}"
+          f"{percentile(all_values, 95) * 1000:>9.1f}{percentile(all_values, 99) * 1000:>9.1f}"
+          f"{total / wall:>9.1f}{sum(errors.values()):>8}")
+    print(f"Bot API calls: {dict(fake_api.calls)}")
+    print(f"PostgREST requests: {fake_db.requests}")
+    from database.db import pool_stats
+    print(f"DB pool: {pool_stats()}")
+    from services import metrics
+    t0 = time.perf_counter()
+    text = metrics.render()
+    print(f"/metrics: {len(text.splitlines())} lines, {len(text)} bytes, "
+          f"render {1000 * (time.perf_counter() - t0):.2f}ms")
+    print(f"pending_requests created: {len(fake_db.client.get('pending_requests').rows)} "
+          f"(expected {users * iterations * len(flows)})")
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load harness")
+    parser.add_argument("--users", type=int, default=10, help="عدد المستخدمين الافتراضيين المتزامنين")
+    parser.add_argument("--iterations", type=int, default=3, help="عدد تكرار الرحلات لكل مستخدم")
+    parser.add_argument("--flows", default=",".join(JOURNEYS), help="الرحلات مفصولة بفواصل")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="تأخير مصطنع لكل استدعاء Bot API")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="تأخير مصطنع لكل طلب PostgREST")
+    parser.add_argument("--telegram-limits", action="store_true",
+                        help="دلاء send_scheduler الافتراضية (~30/ث للبوت و1/ث للمحادثة) بدل بلا حد")
+    args = parser.parse_args()
+    flows = [f.strip() for f in args.flows.split(",") if f.strip()]
+    unknown = set(flows) - set(JOURNEYS)
+    if unknown:
+        parser.error(f"رحلات غير معروفة: {', '.join(sorted(unknown))}")
+    run(args.users, args.iterations, flows, args.api_latency_ms, args.db_latency_ms, args.telegram_limits)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import os
 import logging
+import secrets
 
 # إعداد تسجيل الأخطاء Logging (يُنصح أن يكون في أعلى الملف دائماً)
 logging.basicConfig(
@@ -20,10 +21,20 @@ ADMIN_MAIN_USERNAME = "@Houssin363"
 # ✅ قناة الاشتراك الإجباري
 FORCE_SUB_CHANNEL_ID = -1002852510917
 FORCE_SUB_CHANNEL_USERNAME = "@shop100sho"
+# تيليجرام لا يرسل chat_member إلا إذا طُلب صراحةً في allowed_updates
+ALLOWED_UPDATES = ["message", "callback_query", "chat_member"]
 
 # ✅ رابط Webhook الخاص بـ Render
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://telegram-shop-bot-lo4t.onrender.com/")
 
+# ✅ طريقة استقبال التحديثات: polling (افتراضي) أو webhook على نفس منفذ HTTP
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+PORT = int(os.getenv("PORT", "8081"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram-webhook")
+# بدون WEBHOOK_SECRET يُولَّد سر عشوائي لكل تشغيل (set_webhook يسجله لدى تيليجرام عند الإقلاع)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+
 # ✅ إعدادات إضافية
 ADMINS = [
     {"id": 6935846121, "name": "حسين", "username": "@Houssin363", "shift": "أساسي"},
@@ -34,6 +45,19 @@ ADMINS = [
 LANG = "ar"
 ENCODING = "utf-8"
 
+# 🧵 عدد مسارات تنفيذ المعالجات (كل مستخدم على مسار ثابت ← ترتيب تحديثاته محفوظ)
+HANDLER_LANES = int(os.getenv("HANDLER_LANES", "8"))
+
+# ⏱️ ميزانية زمن الإقلاع حتى أول تحديث (ثوانٍ، 0 = بلا تحذير)
+BOOT_BUDGET_SECONDS = float(os.getenv("BOOT_BUDGET_SECONDS", "15"))
+
+# 🗑️ المهام اليومية الحاذفة (حذف العملاء غير النشطين وأرصدتهم، وحذف السجلات الأقدم من 7 أيام)
+# معطّلة افتراضيًا: لا تُفعَّل إلا صراحةً بـ SCHEDULED_CLEANUP=1
+SCHEDULED_CLEANUP = os.getenv("SCHEDULED_CLEANUP", "0") == "1"
+
+# 🔁 مطابقة طابور الطلبات مع الجدول كل N ثانية (0 = تعطيل)
+QUEUE_RECONCILE_SECONDS = int(os.getenv("QUEUE_RECONCILE_SECONDS", "600"))
+
 # ⚖️ سعر صرف PAYEER
 PAYEER_RATE = 9000  # كل 1 بايير = 9000 ل.س
 
@@ -0,0 +1,373 @@
+# database/local_backend.py
+"""
+بديل محلي (داخل الذاكرة) لعميل Supabase/PostgREST.
+يُفعَّل عبر متغير البيئة DB_BACKEND=local ويُستخدم للتطوير والقياس بدون شبكة.
+يدعم نفس أسلوب الاستعلام المستخدم في المشروع:
+    client.table("x").select("a", "b").eq("user_id", 1).order("id", desc=True).limit(5).execute()
+    client.rpc("apply_balance_delta", {...}).execute()
+كما يطبّق نسخة بايثون مكافئة لكل دالة SQL نستدعيها عبر RPC.
+"""
+import bisect
+import itertools
+import threading
+import uuid
+from datetime import datetime
+
+from postgrest.exceptions import APIError
+
+# أعمدة افتراضية لكل جدول (مطابقة لتعريف الجداول في wallet_service)
+_SCHEMA = {
+    "houssin363":       {"pk": "uuid", "unique": "user_id", "defaults": {"balance": 0}, "now": "created_at"},
+    "transactions":     {"pk": "id", "now": "timestamp"},
+    "purchases":        {"pk": "id", "now": "created_at"},
+    "products":         {"pk": "id", "now": "created_at"},
+    "pending_requests": {"pk": "id", "defaults": {"status": "pending"}, "now": "created_at"},
+}
+
+_OPS = {
+    "eq":  lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt":  lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+    "lt":  lambda a, b: a is not None and a < b,
+    "lte": lambda a, b: a is not None and a <= b,
+    "in":  lambda a, b: a in b,
+    "is":  lambda a, b: a is b,
+}
+
+
+class LocalResponse:
+    __slots__ = ("data", "count")
+
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _parse_columns(columns):
+    names = []
+    for col in columns:
+        names.extend(c.strip() for c in col.split(",") if c.strip())
+    return None if not names or "*" in names else names
+
+
+class _Table:
+    """صفوف جدول واحد مع فهارس hash تُبنى عند أول فلترة eq/in على العمود."""
+
+    def __init__(self, name):
+        self.name = name
+        self.schema = _SCHEMA.get(name, {"pk": "id"})
+        self.rows = {}          # rowid -> row
+        self.seq = {}           # rowid -> ترتيب الإدخال
+        self.indexes = {}       # column -> {value: set(rowid)}
+        self.sorted = {}        # column -> ([values], [rowids]) مرتبة؛ تُلغى عند أي تعديل
+        self.next_id = 1
+        self._counter = itertools.count()
+
+    def _index(self, column):
+        idx = self.indexes.get(column)
+        if idx is None:
+            idx = {}
+            for rid, row in self.rows.items():
+                idx.setdefault(row.get(column), set()).add(rid)
+            self.indexes[column] = idx
+        return idx
+
+    def sorted_by(self, column):
+        """(القيم، المعرّفات) مرتبة حسب العمود، للتصفح keyset عبر bisect."""
+        cached = self.sorted.get(column)
+        if cached is None:
+            pairs = sorted(
+                ((row.get(column), rid) for rid, row in self.rows.items() if row.get(column) is not None),
+                key=lambda p: p[0],
+            )
+            cached = self.sorted[column] = ([v for v, _ in pairs], [rid for _, rid in pairs])
+        return cached
+
+    def _index_add(self, rid, row):
+        self.sorted.clear()
+        for column, idx in self.indexes.items():
+            idx.setdefault(row.get(column), set()).add(rid)
+
+    def _index_remove(self, rid, row):
+        self.sorted.clear()
+        for column, idx in self.indexes.items():
+            bucket = idx.get(row.get(column))
+            if bucket is not None:
+                bucket.discard(rid)
+                if not bucket:
+                    del idx[row.get(column)]
+
+    def insert(self, row):
+        row = dict(row)
+        for key, value in self.schema.get("defaults", {}).items():
+            row.setdefault(key, value)
+        if self.schema.get("now"):
+            row.setdefault(self.schema["now"], datetime.utcnow().isoformat())
+        pk = self.schema["pk"]
+        if pk not in row:
+            if pk == "uuid":
+                row[pk] = str(uuid.uuid4())
+            else:
+                row[pk] = self.next_id
+                self.next_id += 1
+        elif isinstance(row[pk], int):
+            self.next_id = max(self.next_id, row[pk] + 1)
+        rid = row[pk]
+        self.rows[rid] = row
+        self.seq.setdefault(rid, next(self._counter))
+        self._index_add(rid, row)
+        return row
+
+    def update(self, rid, values):
+        row = self.rows[rid]
+        self._index_remove(rid, row)
+        row.update(values)
+        self._index_add(rid, row)
+        return row
+
+    def delete(self, rid):
+        row = self.rows.pop(rid)
+        self.seq.pop(rid, None)
+        self._index_remove(rid, row)
+        return row
+
+    def find(self, filters):
+        candidates = None
+        for column, op, value in filters:
+            if op == "eq":
+                ids = self._index(column).get(value, set())
+            elif op == "in":
+                idx = self._index(column)
+                ids = set()
+                for v in value:
+                    ids |= idx.get(v, set())
+            else:
+                continue
+            candidates = ids if candidates is None else candidates & ids
+        rids = self.rows.keys() if candidates is None else sorted(candidates, key=self.seq.__getitem__)
+        out = []
+        for rid in rids:
+            row = self.rows[rid]
+            if all(_OPS[op](row.get(column), value) for column, op, value in filters):
+                out.append(rid)
+        return out
+
+
+class _Query:
+    def __init__(self, db, table):
+        self._db = db
+        self._table = table
+        self._action = "select"
+        self._columns = None
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._offset = 0
+        self._payload = None
+        self._on_conflict = None
+        self._ignore_duplicates = False
+
+    # --- أنواع العمليات ---
+    def select(self, *columns, count=None, **_):
+        self._columns = _parse_columns(columns)
+        return self
+
+    def insert(self, rows, **_):
+        self._action, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict="", ignore_duplicates=False, **_):
+        self._action, self._payload, self._on_conflict = "upsert", rows, on_conflict
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values, **_):
+        self._action, self._payload = "update", values
+        return self
+
+    def delete(self, **_):
+        self._action = "delete"
+        return self
+
+    # --- الفلاتر ---
+    def _filter(self, column, op, value):
+        self._filters.append((column, op, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "neq", value)
+
+    def gt(self, column, value):
+        return self._filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._filter(column, "gte", value)
+
+    def lt(self, column, value):
+        return self._filter(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "lte", value)
+
+    def in_(self, column, values):
+        return self._filter(column, "in", set(values))
+
+    def is_(self, column, value):
+        return self._filter(column, "is", None if value in (None, "null") else value)
+
+    def order(self, column, desc=False, **_):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size, **_):
+        self._limit = size
+        return self
+
+    def range(self, start, end, **_):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def execute(self):
+        return self._db.execute(self)
+
+
+class _RpcCall:
+    def __init__(self, db, name, params):
+        self._db = db
+        self._name = name
+        self._params = params or {}
+
+    def execute(self):
+        return self._db.call(self._name, self._params)
+
+
+class LocalClient:
+    """واجهة مطابقة لـ supabase.Client فيما يخص table() و rpc() فقط."""
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.RLock()
+        self.functions = dict(_FUNCTIONS)
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params=None):
+        return _RpcCall(self, name, params)
+
+    def get(self, name):
+        with self._lock:
+            table = self._tables.get(name)
+            if table is None:
+                table = self._tables[name] = _Table(name)
+            return table
+
+    def call(self, name, params):
+        fn = self.functions.get(name)
+        if fn is None:
+            raise APIError({"message": f"function {name} does not exist", "code": "PGRST202"})
+        with self._lock:
+            return LocalResponse(fn(self, **params))
+
+    def execute(self, query):
+        with self._lock:
+            table = self.get(query._table)
+            action = query._action
+            if action == "insert":
+                rows = query._payload if isinstance(query._payload, list) else [query._payload]
+                return LocalResponse([dict(table.insert(r)) for r in rows])
+            if action == "upsert":
+                rows = query._payload if isinstance(query._payload, list) else [query._payload]
+                key = query._on_conflict or table.schema.get("unique") or table.schema["pk"]
+                out = []
+                for r in rows:
+                    existing = table.find([(key, "eq", r.get(key))])
+                    if existing and query._ignore_duplicates:
+                        continue
+                    if existing:
+                        out.append(dict(table.update(existing[0], r)))
+                    else:
+                        out.append(dict(table.insert(r)))
+                return LocalResponse(out)
+
+            rids = table.find(query._filters)
+            if action == "update":
+                return LocalResponse([dict(table.update(rid, query._payload)) for rid in rids])
+            if action == "delete":
+                return LocalResponse([table.delete(rid) for rid in rids])
+
+            rows = [table.rows[rid] for rid in rids]
+            for column, desc in reversed(query._order):
+                rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+            if query._offset:
+                rows = rows[query._offset:]
+            if query._limit is not None:
+                rows = rows[:query._limit]
+            if query._columns is None:
+                return LocalResponse([dict(r) for r in rows])
+            return LocalResponse([{c: r.get(c) for c in query._columns} for r in rows])
+
+
+# =====================================
+#   دوال RPC (مكافئة لدوال SQL)
+# =====================================
+def _fn_apply_balance_delta(db, p_user_id, p_delta, p_description=None):
+    users = db.get("houssin363")
+    rids = users.find([("user_id", "eq", p_user_id)])
+    if not rids:
+        raise APIError({"message": "user_not_found", "code": "P0002"})
+    row = users.rows[rids[0]]
+    new_balance = row.get("balance", 0) + p_delta
+    if p_delta < 0 and new_balance < 0:
+        raise APIError({"message": "insufficient_balance", "code": "P0001"})
+    users.update(rids[0], {"balance": new_balance})
+    db.get("transactions").insert({
+        "user_id": p_user_id,
+        "amount": p_delta,
+        "description": p_description,
+    })
+    return [{"new_balance": new_balance}]
+
+
+def _fn_transfer_balance(db, p_from_user_id, p_to_user_id, p_amount, p_fee=0):
+    users = db.get("houssin363")
+    if not users.find([("user_id", "eq", p_to_user_id)]):
+        raise APIError({"message": "user_not_found", "code": "P0002"})
+    # المرسل أولًا: إن رُفض لا يُكتب شيء (مثل إلغاء المعاملة في SQL)
+    sender = _fn_apply_balance_delta(
+        db, p_from_user_id, -(p_amount + p_fee), f"تحويل إلى {p_to_user_id} (شامل الرسوم)")
+    receiver = _fn_apply_balance_delta(db, p_to_user_id, p_amount, f"تحويل من {p_from_user_id}")
+    return [{"from_balance": sender[0]["new_balance"], "to_balance": receiver[0]["new_balance"]}]
+
+
+def _fn_user_last_activity(db, p_before, p_after_user_id=0, p_limit=1000):
+    users = db.get("houssin363")
+    txns = db.get("transactions")
+    purchases = db.get("purchases")
+    txn_idx = txns._index("user_id")
+    purchase_idx = purchases._index("user_id")
+    values, rids = users.sorted_by("user_id")
+    out = []
+    for pos in range(bisect.bisect_right(values, p_after_user_id), len(values)):
+        user = users.rows[rids[pos]]
+        user_id = user["user_id"]
+        stamps = [user.get("created_at")]
+        stamps += [txns.rows[r].get("timestamp") for r in txn_idx.get(user_id, ())]
+        stamps += [purchases.rows[r].get("created_at") for r in purchase_idx.get(user_id, ())]
+        last = max((s for s in stamps if s is not None), default=None)
+        if last is not None and last < p_before:
+            out.append({"user_id": user_id, "last_activity": last})
+            if len(out) >= p_limit:
+                break
+    return out
+
+
+_FUNCTIONS = {
+    "apply_balance_delta": _fn_apply_balance_delta,
+    "transfer_balance": _fn_transfer_balance,
+    "user_last_activity": _fn_user_last_activity,
+}
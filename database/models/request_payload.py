@@ -0,0 +1,112 @@
+# نماذج payload طلبات الطابور (عمود payload jsonb في pending_requests)
+#
+# كل نوع طلب له صنف بحقول ثابتة (__slots__) ورقم إصدار، فلا يحتاج الأدمن
+# لاستخراج السعر أو المنتج من نص الطلب:
+#     payload = OrderPayload(product_id=1, product_name="60 شدة", player_id="5123", price=9000)
+#     add_pending_request(..., payload=payload.to_dict())
+#     parse_payload(req["payload"])  -> OrderPayload
+
+PAYLOAD_VERSION = 1
+
+
+class RequestPayload:
+    type = None
+    __slots__ = ("reserved",)
+
+    def __init__(self, **fields):
+        for name in self._fields():
+            setattr(self, name, fields.get(name))
+        if self.reserved is None:
+            self.reserved = 0
+
+    @classmethod
+    def _fields(cls):
+        # كل الحقول عبر سلسلة الوراثة (تُحسب مرة واحدة لكل صنف)
+        fields = cls.__dict__.get("_field_cache")
+        if fields is None:
+            fields = tuple(
+                name for klass in reversed(cls.__mro__) for name in klass.__dict__.get("__slots__", ())
+            )
+            cls._field_cache = fields
+        return fields
+
+    def to_dict(self):
+        data = {"type": self.type, "version": PAYLOAD_VERSION}
+        for name in self._fields():
+            data[name] = getattr(self, name)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.to_dict()}>"
+
+
+class OrderPayload(RequestPayload):
+    """طلب منتج (شحن ألعاب وتطبيقات)."""
+    type = "order"
+    __slots__ = ("product_id", "product_name", "player_id", "price")
+
+
+class UnitPayload(RequestPayload):
+    __slots__ = ("number", "unit_name", "price")
+
+
+class SyrUnitPayload(UnitPayload):
+    type = "syr_unit"
+    __slots__ = ()
+
+
+class MtnUnitPayload(UnitPayload):
+    type = "mtn_unit"
+    __slots__ = ()
+
+
+class BillPayload(RequestPayload):
+    __slots__ = ("number", "amount", "total")
+
+
+class SyrBillPayload(BillPayload):
+    type = "syr_bill"
+    __slots__ = ()
+
+
+class MtnBillPayload(BillPayload):
+    type = "mtn_bill"
+    __slots__ = ()
+
+
+class InternetPayload(RequestPayload):
+    type = "internet"
+    __slots__ = ("provider", "speed", "phone", "price", "comm", "total")
+
+
+class CashTransferPayload(RequestPayload):
+    type = "cash_transfer"
+    __slots__ = ("number", "cash_type", "amount", "commission", "total")
+
+
+class CompaniesTransferPayload(RequestPayload):
+    type = "companies_transfer"
+    __slots__ = ("beneficiary_name", "beneficiary_number", "company", "amount", "commission", "total")
+
+
+PAYLOAD_TYPES = {
+    cls.type: cls
+    for cls in (
+        OrderPayload, SyrUnitPayload, MtnUnitPayload, SyrBillPayload, MtnBillPayload,
+        InternetPayload, CashTransferPayload, CompaniesTransferPayload,
+    )
+}
+
+
+def parse_payload(data):
+    """dict من الجدول ← صنف النوع المناسب، أو None إن لم يكن للطلب نوع معروف."""
+    if not data:
+        return None
+    cls = PAYLOAD_TYPES.get(data.get("type"))
+    if cls is None:
+        return None
+    return cls.from_dict(data)
@@ -1,7 +1,5 @@
 from services.queue_service import add_pending_request, process_queue, delete_pending_request
 import logging
-import json
-import os
 import re
 from datetime import datetime
 
@@ -11,39 +9,32 @@ from config import ADMINS, ADMIN_MAIN_ID
 from database.db import get_table
 from services.wallet_service import (
     register_user_if_not_exist,
-    deduct_balance,
     add_purchase,
+    record_purchase,
     add_balance,
     get_balance,
+    InsufficientBalanceError,
 )
 from services.queue_service import (
     add_pending_request,
     delete_pending_request,
     process_queue,
     postpone_request,
-    queue_cooldown_start,
+    release_queue,
+    get_request,
 )
 from services.cleanup_service import delete_inactive_users
 from services.recharge_service import validate_recharge_code
 
 from handlers.products import pending_orders  # هام
+from database.models.request_payload import parse_payload
 
-from handlers import cash_transfer
-from handlers import companies_transfer
-
-SECRET_CODES_FILE = "data/secret_codes.json"
-os.makedirs("data", exist_ok=True)
-if not os.path.isfile(SECRET_CODES_FILE):
-    with open(SECRET_CODES_FILE, "w", encoding="utf-8") as f:
-        json.dump({}, f)
-
-def load_code_operations():
-    with open(SECRET_CODES_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_code_operations(data):
-    with open(SECRET_CODES_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+from handlers import router
+from handlers import registry
+from services import send_scheduler
+from services import catalog_service
+from services import agent_codes_service
+from services.session_store import store, FLOW_TTL
 
 VALID_SECRET_CODES = [
     "363836369", "36313251", "646460923",
@@ -57,135 +48,159 @@ def clear_pending_request(user_id):
     except Exception:
         pass
 
-_cancel_pending = {}
-_accept_pending = {}
-
+# ========== تنفيذ الطلبات المقبولة حسب نوع payload ==========
+# كل دالة تعيد True عند التنفيذ، و False إن رُفض الطلب (مع إعلام الأدمن والعميل).
+
+def _accept_order(bot, call, user_id, p):
+    product_name = p.product_name
+    if not product_name:  # طلبات قديمة قبل حفظ اسم المنتج في payload
+        product = catalog_service.get_product(p.product_id)
+        product_name = product.name if product else ""
+
+    # لا نخصم مرة ثانية لأن الحجز تم مسبقًا
+    record_purchase(user_id, p.product_id, product_name, p.reserved, p.player_id)
+    send_scheduler.send_message(
+        bot, user_id,
+        f"✅ تم تنفيذ طلبك: {product_name}\nتم خصم {p.reserved:,} ل.س من محفظتك."
+    )
+    return True
+
+def _accept_unit(bot, call, user_id, p):
+    # لا نخصم مرة ثانية لأن الحجز تم مسبقًا
+    record_purchase(user_id, p.reserved, p.unit_name, p.reserved, p.number)
+    send_scheduler.send_message(bot, user_id, f"✅ تم تحويل {p.unit_name} بنجاح إلى {p.number}.\nتم خصم {p.reserved:,} ل.س.", parse_mode="HTML")
+    return True
+
+def _accept_bill(bot, call, user_id, p):
+    label = "فاتورة سيرياتيل" if p.type == "syr_bill" else "فاتورة MTN"
+    # لا نخصم مرة ثانية لأن الحجز تم مسبقًا
+    record_purchase(user_id, p.reserved, label, p.reserved, p.number)
+    send_scheduler.send_message(
+        bot, user_id,
+        f"✅ تم دفع {label} للرقم {p.number}.\n"
+        f"تم خصم {p.reserved:,} ل.س.",
+        parse_mode="HTML"
+    )
+    return True
+
+def _accept_internet(bot, call, user_id, p):
+    # لا نخصم مرة ثانية لأن الحجز تم مسبقًا
+    record_purchase(user_id, p.reserved, f"إنترنت {p.provider} {p.speed}", p.reserved, p.phone)
+    send_scheduler.send_message(
+        bot, user_id,
+        f"✅ تم شحن إنترنت {p.provider} بسرعة {p.speed} للرقم {p.phone}.\n"
+        f"تم خصم {p.reserved:,} ل.س.",
+        parse_mode="HTML"
+    )
+    return True
+
+def _refuse_insufficient(bot, call, user_id):
+    balance = get_balance(user_id)
+    bot.send_message(call.message.chat.id, f"❌ لا يوجد رصيد كافٍ لدى العميل (الرصيد: {balance:,} ل.س). الطلب تم حذفه.")
+    send_scheduler.send_message(bot, user_id, "❌ عذراً، لم يتم تنفيذ طلبك بسبب عدم كفاية الرصيد.")
+    return False
+
+def _accept_cash_transfer(bot, call, user_id, p):
+    # التحويلات لا تُحجز عند الإرسال: الخصم هنا عند القبول
+    try:
+        add_purchase(user_id, p.total, f"تحويل كاش {p.cash_type}", p.total, p.number)
+    except InsufficientBalanceError:
+        return _refuse_insufficient(bot, call, user_id)
+    send_scheduler.send_message(
+        bot, user_id,
+        f"✅ تم تنفيذ تحويل كاش {p.cash_type} للرقم {p.number}.\nتم خصم {p.total:,} ل.س.",
+        parse_mode="HTML"
+    )
+    return True
+
+def _accept_companies_transfer(bot, call, user_id, p):
+    try:
+        add_purchase(user_id, p.total, f"حوالة مالية عبر {p.company}", p.total, p.beneficiary_number)
+    except InsufficientBalanceError:
+        return _refuse_insufficient(bot, call, user_id)
+    send_scheduler.send_message(
+        bot, user_id,
+        f"✅ تم تنفيذ حوالة مالية عبر {p.company} للمستفيد {p.beneficiary_name}.\nتم خصم {p.total:,} ل.س.",
+        parse_mode="HTML"
+    )
+    return True
+
+ACCEPT_HANDLERS = {
+    "order": _accept_order,
+    "syr_unit": _accept_unit,
+    "mtn_unit": _accept_unit,
+    "syr_bill": _accept_bill,
+    "mtn_bill": _accept_bill,
+    "internet": _accept_internet,
+    "cash_transfer": _accept_cash_transfer,
+    "companies_transfer": _accept_companies_transfer,
+}
+
+# أزرار تنهي الطلب المعروض ← يُعرض التالي (رسالة/صورة للعميل لا تنهيه)
+_DECISION_ACTIONS = ("postpone", "cancel", "accept")
+
+_cancel_pending = store.flow("admin_cancel_reason", ttl=FLOW_TTL)
+_accept_pending = store.flow("admin_accept_message", ttl=FLOW_TTL)
+
+@registry.once
 def register(bot, history):
-    # تسجيل هاندلرات التحويلات الجديدة
-    cash_transfer.register(bot, history)
-    companies_transfer.register_companies_transfer(bot, history)
-
-    @bot.message_handler(func=lambda msg: msg.text and re.match(r'/done_(\d+)', msg.text))
+    @router.on_text_prefix(bot, "/done_", func=lambda msg: re.match(r'/done_(\d+)', msg.text))
     def handle_done(msg):
         req_id = int(re.match(r'/done_(\d+)', msg.text).group(1))
         delete_pending_request(req_id)
         bot.reply_to(msg, f"✅ تم إنهاء الطلب {req_id}")
+        process_queue(bot)
 
-    @bot.message_handler(func=lambda msg: msg.text and re.match(r'/cancel_(\d+)', msg.text))
+    @router.on_text_prefix(bot, "/cancel_", func=lambda msg: re.match(r'/cancel_(\d+)', msg.text))
     def handle_cancel(msg):
         req_id = int(re.match(r'/cancel_(\d+)', msg.text).group(1))
         delete_pending_request(req_id)
         bot.reply_to(msg, f"🚫 تم إلغاء الطلب {req_id}")
+        process_queue(bot)
 
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("admin_queue_"))
+    @router.on_callback_prefix(bot, "admin_queue_")
     def handle_queue_action(call):
         parts = call.data.split("_")
         action = parts[2]
         request_id = int(parts[3])
 
-        # Fetch request with payload
-        res = get_table("pending_requests") \
-            .select("user_id", "request_text", "payload") \
-            .eq("id", request_id) \
-            .execute()
-        if not getattr(res, 'data', None):
+        # الطلب من نسخة الطابور داخل الذاكرة
+        req = get_request(request_id)
+        if not req:
+            release_queue(bot, request_id)  # حُذف من الجدول وهو معروض ← لا نترك الطابور معلقًا
             return bot.answer_callback_query(call.id, "❌ الطلب غير موجود.")
-        req = res.data[0]
         user_id = req["user_id"]
-        payload = req.get("payload") or {}
-
+        payload = parse_payload(req.get("payload"))
+
+        try:
+            _dispatch_queue_action(call, action, request_id, user_id, payload)
+        except Exception:
+            release_queue(bot, request_id)  # فشل المعالج ← لا نترك الطابور معلقًا
+            raise
+        # رسالة/صورة للعميل لا تنهي الطلب: يبقى معروضًا بأزراره حتى القرار
+        if action in _DECISION_ACTIONS:
+            release_queue(bot, request_id)
+
+    def _dispatch_queue_action(call, action, request_id, user_id, payload):
         # Remove admin message
-        bot.delete_message(call.message.chat.id, call.message.message_id)
+        if action in _DECISION_ACTIONS:
+            bot.delete_message(call.message.chat.id, call.message.message_id)
 
         if action == "postpone":
             postpone_request(request_id)
             bot.answer_callback_query(call.id, "✅ تم تأجيل الطلب.")
-            bot.send_message(user_id, "⏳ نعتذر؛ طلبك أعيد إلى نهاية القائمة.")
-            queue_cooldown_start(bot)
+            send_scheduler.send_message(bot, user_id, "⏳ نعتذر؛ طلبك أعيد إلى نهاية القائمة.")
 
         elif action == "cancel":
             delete_pending_request(request_id)
             # إرجاع المبلغ المحجوز عند إلغاء الأدمن
-            reserved = payload.get("reserved", 0)
+            reserved = payload.reserved if payload else 0
             if reserved:
                 add_balance(user_id, reserved)
-                bot.send_message(user_id, f"🚫 تم إلغاء طلبك واسترجاع {reserved:,} ل.س.")
-            
-            bot.answer_callback_query(call.id, "🚫 تم إلغاء الطلب.")
-            queue_cooldown_start(bot)
-
-        elif action == "accept":
-            typ = payload.get("type")
-            if typ in ("syr_unit", "mtn_unit"):
-                price = payload.get("price", 0)
-                num = payload.get("number")
-                name = payload.get("unit_name")
-                deduct_balance(user_id, price)
-                add_purchase(user_id, price, name, price, num)
-                bot.send_message(user_id, f"✅ تم تحويل {name} بنجاح إلى {num}.\nتم خصم {price:,} ل.س.", parse_mode="HTML")
-            elif typ in ("syr_bill", "mtn_bill"):
-                reserved = payload.get("reserved", 0)
-                num = payload.get("number")
-                label = "فاتورة سيرياتيل" if typ == "syr_bill" else "فاتورة MTN"
-                # لا نخصم مرة ثانية لأن الحجز تم مسبقًا
-                add_purchase(user_id, reserved, label, reserved, num)
-                bot.send_message(
-                    user_id,
-                    f"✅ تم دفع {label} للرقم {num}.\n"
-                    f"تم خصم {reserved:,} ل.س.",
-                    parse_mode="HTML"
-                )
-                delete_pending_request(request_id)
-            elif typ == "internet":
-                reserved  = payload.get("reserved", 0)
-                provider  = payload.get("provider")
-                speed     = payload.get("speed")
-                phone     = payload.get("phone")
-                print(f"[DEBUG] Accepting internet order: reserved={reserved}, provider={provider}, speed={speed}, phone={phone}")
-                # لا نخصم مرة ثانية لأن الحجز تم مسبقًا
-                add_purchase(user_id, reserved, f"إنترنت {provider} {speed}", reserved, phone)
-                bot.send_message(
-                    user_id,
-                    f"✅ تم شحن إنترنت {provider} بسرعة {speed} للرقم {phone}.\n"
-                    f"تم خصم {reserved:,} ل.س.",
-                    parse_mode="HTML"
-                )
-                delete_pending_request(request_id)
-            elif typ == "cash_transfer":
-                reserved = payload.get("reserved", 0)
-                number = payload.get("number")
-                cash_type = payload.get("cash_type")
-                add_purchase(user_id, reserved, f"تحويل كاش {cash_type}", reserved, number)
-                bot.send_message(
-                    user_id,
-                    f"✅ تم تنفيذ تحويل كاش {cash_type} للرقم {number}.\nتم خصم {reserved:,} ل.س.",
-                    parse_mode="HTML"
-                )
-                delete_pending_request(request_id)
-            elif typ == "companies_transfer":
-                reserved = payload.get("reserved", 0)
-                beneficiary_name = payload.get("beneficiary_name")
-                beneficiary_number = payload.get("beneficiary_number")
-                company = payload.get("company")
-                add_purchase(user_id, reserved, f"حوالة مالية عبر {company}", reserved, beneficiary_number)
-                bot.send_message(
-                    user_id,
-                    f"✅ تم تنفيذ حوالة مالية عبر {company} للمستفيد {beneficiary_name}.\nتم خصم {reserved:,} ل.س.",
-                    parse_mode="HTML"
-                )
-                delete_pending_request(request_id)
-            else:
-                bot.answer_callback_query(call.id, "❌ نوع الطلب غير معروف.")
-                return
+                send_scheduler.send_message(bot, user_id, f"🚫 تم إلغاء طلبك واسترجاع {reserved:,} ل.س.")
 
-            bot.answer_callback_query(call.id, "✅ تم تنفيذ العملية")
-            queue_cooldown_start(bot)
-
-        else:
-            bot.answer_callback_query(call.id, "❌ حدث خطأ.")
+            bot.answer_callback_query(call.id, "🚫 تم إلغاء الطلب.")
 
-        # الإجرائات الإضافية لو تكررت الأكشنات، احفظها ضمن else لو لزم الأمر
-        if action == "cancel":
             bot.answer_callback_query(call.id, "🚫 يرجى كتابة سبب الإلغاء أو إرسال صورة (سيتم إرساله للعميل):")
             _cancel_pending[call.from_user.id] = {"request_id": request_id, "user_id": user_id}
             bot.send_message(call.message.chat.id, "✏️ أرسل سبب الإلغاء كتابياً أو أرسل صورة للعميل:")
@@ -195,51 +210,21 @@ def register(bot, history):
             )
 
         elif action == "accept":
-            # استخراج السعر والمنتج وplayer_id من نص الطلب
-            text = req.get("request_text", "")
-            m_price = re.search(r"💵 السعر: ([\d,]+) ل\.س", text)
-            price = int(m_price.group(1).replace(",", "")) if m_price else 0
-            m_prod = re.search(r"🔖 المنتج: (.+)", text)
-            product_name = m_prod.group(1) if m_prod else ""
-            m_player = re.search(r"آيدي اللاعب: <code>(.+?)</code>", text)
-            player_id = m_player.group(1) if m_player else ""
-
-            # التحقق من الرصيد مجدداً قبل الخصم
-            balance = get_balance(user_id)
-            if balance < price:
-                bot.send_message(call.message.chat.id, f"❌ لا يوجد رصيد كافٍ لدى العميل (الرصيد: {balance:,} ل.س). الطلب تم حذفه.")
-                bot.send_message(
-                    user_id,
-                    f"❌ عذراً، لم يتم تنفيذ طلبك بسبب عدم كفاية الرصيد."
-                )
-                delete_pending_request(request_id)
-                pending_orders.discard(user_id)
-                queue_cooldown_start(bot)
+            handler = ACCEPT_HANDLERS.get(payload.type) if payload else None
+            if handler is None:
+                bot.answer_callback_query(call.id, "❌ نوع الطلب غير معروف.")
                 return
-
-            # إضافة الشراء في سجل المشتريات (يخصم تلقائياً بعد الموافقة)
-            m_pid = re.search(r"select_(\d+)", text)
-            product_id = int(m_pid.group(1)) if m_pid else 0
-            add_purchase(user_id, product_id, product_name, price, player_id)
-            deduct_balance(user_id, price)
-
+            done = handler(bot, call, user_id, payload)
             delete_pending_request(request_id)
-            bot.answer_callback_query(call.id, "✅ تم قبول وتنفيذ الطلب.")
-
-            # إعلام العميل أن الطلب تم تنفيذه مع الخصم
-            bot.send_message(
-                user_id,
-                f"✅ تم تنفيذ طلبك: {product_name}\nتم خصم {price:,} ل.س من محفظتك."
-            )
-
-            _accept_pending[call.from_user.id] = user_id
-            bot.send_message(call.message.chat.id, "✉️ أرسل رسالة للعميل أو صورة (أرسل /skip لتخطي):")
-            bot.register_next_step_handler_by_chat_id(
-                call.message.chat.id,
-                lambda msg: handle_accept_message(msg, call)
-            )
             pending_orders.discard(user_id)
-            queue_cooldown_start(bot)
+            if done:
+                bot.answer_callback_query(call.id, "✅ تم تنفيذ العملية")
+                _accept_pending[call.from_user.id] = user_id
+                bot.send_message(call.message.chat.id, "✉️ أرسل رسالة للعميل أو صورة (أرسل /skip لتخطي):")
+                bot.register_next_step_handler_by_chat_id(
+                    call.message.chat.id,
+                    lambda msg: handle_accept_message(msg, call)
+                )
 
         elif action == "message":
             _accept_pending[call.from_user.id] = user_id
@@ -267,18 +252,18 @@ def register(bot, history):
         request_id = data["request_id"]
         if msg.content_type == 'text':
             reason_text = msg.text.strip()
-            bot.send_message(
-                user_id,
+            send_scheduler.send_message(
+                bot, user_id,
                 f"❌ تم إلغاء طلبك من الإدارة.\n📝 السبب: {reason_text}"
             )
         elif msg.content_type == 'photo':
-            bot.send_photo(user_id, msg.photo[-1].file_id, caption="❌ تم إلغاء طلبك من الإدارة.")
+            send_scheduler.send_photo(bot, user_id, msg.photo[-1].file_id, caption="❌ تم إلغاء طلبك من الإدارة.")
         else:
-            bot.send_message(user_id, "❌ تم إلغاء طلبك من الإدارة.")
+            send_scheduler.send_message(bot, user_id, "❌ تم إلغاء طلبك من الإدارة.")
         bot.send_message(msg.chat.id, "تم إرسال سبب الإلغاء للعميل وحذف الطلب.")
         delete_pending_request(request_id)
         pending_orders.discard(user_id)
-        queue_cooldown_start(bot)
+        release_queue(bot, request_id)
         _cancel_pending.pop(msg.from_user.id, None)
 
     def handle_accept_message(msg, call):
@@ -288,17 +273,17 @@ def register(bot, history):
         if msg.text and msg.text.strip() == "/skip":
             bot.send_message(msg.chat.id, "✅ تم تخطي إرسال رسالة للعميل.")
         elif msg.content_type == "text":
-            bot.send_message(user_id, f"📩 رسالة من الإدارة:\n{msg.text.strip()}")
+            send_scheduler.send_message(bot, user_id, f"📩 رسالة من الإدارة:\n{msg.text.strip()}")
             bot.send_message(msg.chat.id, "✅ تم إرسال الرسالة للعميل.")
         elif msg.content_type == "photo":
-            bot.send_photo(user_id, msg.photo[-1].file_id, caption="📩 صورة من الإدارة.")
+            send_scheduler.send_photo(bot, user_id, msg.photo[-1].file_id, caption="📩 صورة من الإدارة.")
             bot.send_message(msg.chat.id, "✅ تم إرسال الصورة للعميل.")
         else:
             bot.send_message(msg.chat.id, "❌ نوع الرسالة غير مدعوم.")
         _accept_pending.pop(msg.from_user.id, None)
 
     # ========== شحن المحفظة ==========
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("confirm_add_"))
+    @router.on_callback_prefix(bot, "confirm_add_")
     def confirm_wallet_add(call):
         _, _, user_id_str, amount_str = call.data.split("_")
         user_id = int(user_id_str)
@@ -310,7 +295,7 @@ def register(bot, history):
         bot.answer_callback_query(call.id, "✅ تمت الموافقة")
         bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
 
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("reject_add_"))
+    @router.on_callback_prefix(bot, "reject_add_")
     def reject_wallet_add(call):
         user_id = int(call.data.split("_")[-1])
         bot.send_message(call.message.chat.id, "📝 اكتب سبب الرفض:")
@@ -329,24 +314,37 @@ def register(bot, history):
         bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
         clear_pending_request(user_id)
 
+    # ========== إعادة تحميل الكتالوج ==========
+    @bot.message_handler(commands=["reload_catalog"])
+    def reload_catalog(msg):
+        if msg.from_user.id != ADMIN_MAIN_ID:
+            return
+        try:
+            snapshot = catalog_service.reload()
+        except Exception as e:
+            logging.exception("[ADMIN] reload_catalog")
+            bot.reply_to(msg, f"❌ فشل تحميل الكتالوج، بقيت النسخة الحالية.\n{e}")
+            return
+        bot.reply_to(msg, f"✅ الكتالوج v{snapshot.version} ({snapshot.source}): {len(snapshot)} منتج")
+
     # ========== تقرير الأكواد ==========
     @bot.message_handler(commands=["تقرير_الوكلاء"])
     def generate_report(msg):
         if msg.from_user.id not in ADMINS:
             return
-        data = load_code_operations()
+        data = agent_codes_service.report()
         if not data:
             bot.send_message(msg.chat.id, "📭 لا توجد أي عمليات عبر الأكواد.")
             return
         report = "📊 تقرير عمليات الأكواد:\n"
-        for code, ops in data.items():
-            report += f"\n🔐 الكود: `{code}`\n"
-            for entry in ops:
+        for code, agg in data.items():
+            report += f"\n🔐 الكود: `{code}` — {agg['count']} عملية | {agg['total']:,} ل.س\n"
+            for entry in agg["recent"]:
                 report += f"▪️ {entry['amount']:,} ل.س | {entry['date']} | {entry['user']}\n"
         bot.send_message(msg.chat.id, report, parse_mode="Markdown")
 
     # ========== وكلاء ==========
-    @bot.message_handler(func=lambda m: m.text == "🏪 وكلائنا")
+    @router.on_text(bot, "🏪 وكلائنا")
     def handle_agents_entry(msg):
         kb = types.ReplyKeyboardMarkup(resize_keyboard=True)
         kb.add("⬅️ رجوع", "✅ متابعة")
@@ -360,7 +358,7 @@ def register(bot, history):
             reply_markup=kb,
         )
 
-    @bot.message_handler(func=lambda m: m.text == "✅ متابعة")
+    @router.on_text(bot, "✅ متابعة")
     def ask_for_secret_code(msg):
         bot.send_message(msg.chat.id, "🔐 أدخل الكود السري:")
         bot.register_next_step_handler(msg, verify_code)
@@ -377,9 +375,7 @@ def register(bot, history):
         amount = int(msg.text.strip())
         user_id = msg.from_user.id
         now = datetime.now().strftime("%Y-%m-%d %H:%M")
-        ops = load_code_operations()
-        ops.setdefault(code, []).append({"user": msg.from_user.first_name, "amount": amount, "date": now})
-        save_code_operations(ops)
+        agent_codes_service.record(code, msg.from_user.first_name, amount, now)
         register_user_if_not_exist(user_id)
         add_balance(user_id, amount)
         bot.send_message(msg.chat.id, f"✅ تم تحويل {amount:,} ل.س إلى محفظتك.")
@@ -8,10 +8,15 @@ from services.wallet_service import (
     register_user_if_not_exist,
     add_purchase,
     has_sufficient_balance,
+    InsufficientBalanceError,
 )
 from config import ADMIN_MAIN_ID
-from services.queue_service import add_pending_request, process_queue, delete_pending_request
-from database.db import get_table         # ← هنا
+from services.queue_service import add_pending_request, process_queue, delete_pending_request, has_pending_request
+from handlers import router
+from handlers import registry
+from handlers import keyboards
+from database.models.request_payload import SyrUnitPayload, MtnUnitPayload, SyrBillPayload, MtnBillPayload
+from services.session_store import store, history, ADMIN_WAIT_TTL
 
 # --- قوائم المنتجات (وحدات) وأسعارها (لم يتم تعديل القيم) ---
 SYRIATEL_UNITS = [
@@ -38,10 +43,11 @@ MTN_UNITS = [
     {"name": "36000 وحدة", "price": 43200},
 ]
 
-user_states = {}
+user_states = store.flow("bill_and_units", ttl=ADMIN_WAIT_TTL)
 
 # -------------------- أدوات مساعدة عامة --------------------
 
+@keyboards.cached_markup
 def make_inline_buttons(*buttons):
     kb = types.InlineKeyboardMarkup()
     for text, data in buttons:
@@ -52,6 +58,7 @@ def _unit_label(unit: dict) -> str:
     return f"{unit['name']} - {unit['price']:,} ل.س"
 
 # لوحة Reply القديمة (للخلفية/التوافق)
+@keyboards.cached_markup
 def units_bills_menu():
     kb = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     kb.add(
@@ -64,6 +71,7 @@ def units_bills_menu():
     return kb
 
 # النسخة الجديدة: InlineKeyboard أساسي
+@keyboards.cached_markup
 def units_bills_menu_inline():
     kb = types.InlineKeyboardMarkup()
     kb.add(types.InlineKeyboardButton("🔴 وحدات سيرياتيل", callback_data="ubm:syr_units"))
@@ -73,11 +81,15 @@ def units_bills_menu_inline():
     kb.add(types.InlineKeyboardButton("⬅️ رجوع", callback_data="ubm:back"))
     return kb
 
-# باني كيبورد صفحات عام
+# باني كيبورد صفحات عام (كل صفحة تُبنى مرة لكل محتوى قائمة)
 def _build_paged_inline_keyboard(items, page: int = 0, page_size: int = 5, prefix: str = "pg", back_data: str | None = None):
-    total = len(items)
-    pages = max(1, math.ceil(total / page_size))
+    pages = max(1, math.ceil(len(items) / page_size))
     page = max(0, min(page, pages - 1))
+    return _paged_inline_keyboard(tuple(items), page, page_size, prefix, back_data), pages
+
+@keyboards.cached_markup
+def _paged_inline_keyboard(items, page, page_size, prefix, back_data):
+    pages = max(1, math.ceil(len(items) / page_size))
     start = page * page_size
     end = start + page_size
     slice_items = items[start:end]
@@ -99,7 +111,7 @@ def _build_paged_inline_keyboard(items, page: int = 0, page_size: int = 5, prefi
     if back_data:
         kb.add(types.InlineKeyboardButton("🔙 رجوع", callback_data=back_data))
 
-    return kb, pages
+    return kb
 
 
 def register_bill_and_units(bot, history):
@@ -109,7 +121,7 @@ def register_bill_and_units(bot, history):
     """
 
     # ===== القائمة الرئيسية للخدمة =====
-    @bot.message_handler(func=lambda msg: msg.text == "💳 تحويل وحدات فاتورة سوري")
+    @router.on_text(bot, "💳 تحويل وحدات فاتورة سوري")
     def open_main_menu(msg):
         user_id = msg.from_user.id
         history.setdefault(user_id, []).append("units_bills_menu")
@@ -118,7 +130,7 @@ def register_bill_and_units(bot, history):
         bot.send_message(msg.chat.id, "اختر الخدمة:", reply_markup=units_bills_menu_inline())
 
     # --------- Router له واجهة الإنلاين الرئيسية ---------
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("ubm:")) 
+    @router.on_callback_prefix(bot, "ubm:")
     def ubm_router(call):
         action = call.data.split(":", 1)[1]
         chat_id = call.message.chat.id
@@ -184,7 +196,7 @@ def register_bill_and_units(bot, history):
             bot.send_message(chat_id, text, reply_markup=kb)
 
     # ------ ملاحق كولباك للوحدات (سيرياتيل) ------
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("syrunits:"))
+    @router.on_callback_prefix(bot, "syrunits:")
     def syr_units_inline_handler(call):
         parts = call.data.split(":")
         action = parts[1]
@@ -214,7 +226,7 @@ def register_bill_and_units(bot, history):
         bot.answer_callback_query(call.id)
 
     # ------ ملاحق كولباك للوحدات (MTN) ------
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("mtnunits:"))
+    @router.on_callback_prefix(bot, "mtnunits:")
     def mtn_units_inline_handler(call):
         parts = call.data.split(":")
         action = parts[1]
@@ -244,7 +256,7 @@ def register_bill_and_units(bot, history):
         bot.answer_callback_query(call.id)
 
     ########## وحدات سيرياتيل ##########
-    @bot.message_handler(func=lambda msg: msg.text == "🔴 وحدات سيرياتيل")
+    @router.on_text(bot, "🔴 وحدات سيرياتيل")
     def syr_units_menu(msg):
         user_id = msg.from_user.id
         kb = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
@@ -283,15 +295,11 @@ def register_bill_and_units(bot, history):
             reply_markup=kb
         )
 
-    @bot.callback_query_handler(func=lambda call: call.data == "syr_unit_final_confirm")
+    @router.on_callback(bot, "syr_unit_final_confirm")
     def syr_unit_final_confirm(call):
         user_id = call.from_user.id
 
-        existing = get_table("pending_requests") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .execute()
-        if existing.data:
+        if has_pending_request(user_id):
             return bot.send_message(call.message.chat.id,
                 "❌ لديك طلب قيد الانتظار، الرجاء الانتظار حتى تتم معالجته."
             )
@@ -299,15 +307,15 @@ def register_bill_and_units(bot, history):
         state = user_states[user_id]
         price = state["unit"]["price"]
 
-        balance = get_balance(user_id)
-        if balance < price:
+        try:
+            deduct_balance(user_id, price)
+        except InsufficientBalanceError:
+            balance = get_balance(user_id)
             bot.send_message(call.message.chat.id,
                 f"❌ لا يوجد رصيد كافٍ في محفظتك.\nرصيدك: {balance:,} ل.س\nالمطلوب: {price:,} ل.س"
             )
             return
 
-        deduct_balance(user_id, price)
-
         state["step"] = "wait_admin_syr_unit"
         summary = (
             f"🔴 طلب وحدات سيرياتيل:\n"
@@ -321,18 +329,17 @@ def register_bill_and_units(bot, history):
             user_id=user_id,
             username=call.from_user.username,
             request_text=summary,
-            payload={
-                "type": "syr_unit",
-                "number": state["number"],
-                "unit_name": state["unit"]["name"],
-                "price": price,
-                "reserved": price,
-            }
+            payload=SyrUnitPayload(
+                number=state["number"],
+                unit_name=state["unit"]["name"],
+                price=price,
+                reserved=price,
+            ).to_dict()
         )
         bot.send_message(call.message.chat.id, "✅ تم إرسال طلبك للإدارة، بانتظار الموافقة.")
 
     ########## وحدات MTN ##########
-    @bot.message_handler(func=lambda msg: msg.text == "🟡 وحدات MTN")
+    @router.on_text(bot, "🟡 وحدات MTN")
     def mtn_units_menu(msg):
         user_id = msg.from_user.id
         kb = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
@@ -371,15 +378,11 @@ def register_bill_and_units(bot, history):
             reply_markup=kb
         )
 
-    @bot.callback_query_handler(func=lambda call: call.data == "mtn_unit_final_confirm")
+    @router.on_callback(bot, "mtn_unit_final_confirm")
     def mtn_unit_final_confirm(call):
         user_id = call.from_user.id
 
-        existing = get_table("pending_requests") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .execute()
-        if existing.data:
+        if has_pending_request(user_id):
             return bot.send_message(call.message.chat.id,
                 "❌ لديك طلب قيد الانتظار، الرجاء الانتظار حتى تتم معالجته."
             )
@@ -387,15 +390,15 @@ def register_bill_and_units(bot, history):
         state = user_states[user_id]
         price = state["unit"]["price"]
 
-        balance = get_balance(user_id)
-        if balance < price:
+        try:
+            deduct_balance(user_id, price)
+        except InsufficientBalanceError:
+            balance = get_balance(user_id)
             bot.send_message(call.message.chat.id,
                 f"❌ لا يوجد رصيد كافٍ في محفظتك.\nرصيدك: {balance:,} ل.س\nالمطلوب: {price:,} ل.س"
             )
             return
 
-        deduct_balance(user_id, price)
-
         state["step"] = "wait_admin_mtn_unit"
         summary = (
             f"🟡 طلب وحدات MTN:\n"
@@ -408,18 +411,17 @@ def register_bill_and_units(bot, history):
             user_id=user_id,
             username=call.from_user.username,
             request_text=summary,
-            payload={
-                "type": "mtn_unit",
-                "number": state["number"],
-                "unit_name": state["unit"]["name"],
-                "price": price,
-                "reserved": price,
-            }
+            payload=MtnUnitPayload(
+                number=state["number"],
+                unit_name=state["unit"]["name"],
+                price=price,
+                reserved=price,
+            ).to_dict()
         )
         bot.send_message(call.message.chat.id, "✅ تم إرسال طلبك للإدارة، بانتظار الموافقة.")
 
     ########## فاتورة سيرياتيل ##########
-    @bot.message_handler(func=lambda msg: msg.text == "🔴 فاتورة سيرياتيل")
+    @router.on_text(bot, "🔴 فاتورة سيرياتيل")
     def syr_bill_entry(msg):
         user_id = msg.from_user.id
         user_states[user_id] = {"step": "syr_bill_number"}
@@ -439,13 +441,13 @@ def register_bill_and_units(bot, history):
         )
         bot.send_message(msg.chat.id, f"هل الرقم التالي صحيح؟\n{number}", reply_markup=kb)
 
-    @bot.callback_query_handler(func=lambda call: call.data == "edit_syr_bill_number")
+    @router.on_callback(bot, "edit_syr_bill_number")
     def edit_syr_bill_number(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "syr_bill_number"
         bot.send_message(call.message.chat.id, "📱 أعد إدخال رقم الموبايل:")
 
-    @bot.callback_query_handler(func=lambda call: call.data == "confirm_syr_bill_number")
+    @router.on_callback(bot, "confirm_syr_bill_number")
     def confirm_syr_bill_number(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "syr_bill_amount"
@@ -474,13 +476,13 @@ def register_bill_and_units(bot, history):
             f"هل المبلغ التالي صحيح؟\n{amount:,} ل.س", reply_markup=kb
         )
 
-    @bot.callback_query_handler(func=lambda call: call.data == "edit_syr_bill_amount")
+    @router.on_callback(bot, "edit_syr_bill_amount")
     def edit_syr_bill_amount(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "syr_bill_amount"
         bot.send_message(call.message.chat.id, "💵 أعد إرسال مبلغ الفاتورة:")
 
-    @bot.callback_query_handler(func=lambda call: call.data == "confirm_syr_bill_amount")
+    @router.on_callback(bot, "confirm_syr_bill_amount")
     def confirm_syr_bill_amount(call):
         user_id = call.from_user.id
         amount = user_states[user_id]["amount"]
@@ -501,22 +503,20 @@ def register_bill_and_units(bot, history):
             reply_markup=kb
         )
 
-    @bot.callback_query_handler(func=lambda call: call.data == "final_confirm_syr_bill")
+    @router.on_callback(bot, "final_confirm_syr_bill")
     def final_confirm_syr_bill(call):
         user_id = call.from_user.id
 
-        existing = get_table("pending_requests") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .execute()
-        if existing.data:
+        if has_pending_request(user_id):
             return bot.send_message(call.message.chat.id,
                 "❌ لديك طلب قيد الانتظار، الرجاء الانتظار حتى تتم معالجته."
             )
 
         total = user_states[user_id]["amount_with_fee"]
-        balance = get_balance(user_id)
-        if balance < total:
+        try:
+            deduct_balance(user_id, total)
+        except InsufficientBalanceError:
+            balance = get_balance(user_id)
             kb = make_inline_buttons(
                 ("❌ إلغاء", "cancel_all"),
                 ("💼 المحفظة", "go_wallet")
@@ -529,8 +529,6 @@ def register_bill_and_units(bot, history):
             )
             return
 
-        deduct_balance(user_id, total)
-
         state = user_states[user_id]
         state["step"] = "wait_admin_syr_bill"
         summary = (
@@ -544,18 +542,17 @@ def register_bill_and_units(bot, history):
             user_id=user_id,
             username=call.from_user.username,
             request_text=summary,
-            payload={
-                "type": "syr_bill",
-                "number": state["number"],
-                "amount": state["amount"],
-                "total": total,
-                "reserved": total,
-            }
+            payload=SyrBillPayload(
+                number=state["number"],
+                amount=state["amount"],
+                total=total,
+                reserved=total,
+            ).to_dict()
         )
         bot.send_message(call.message.chat.id, "✅ تم إرسال طلبك للإدارة، بانتظار الموافقة.")
 
     ########## فاتورة MTN ##########
-    @bot.message_handler(func=lambda msg: msg.text == "🟡 فاتورة MTN")
+    @router.on_text(bot, "🟡 فاتورة MTN")
     def mtn_bill_entry(msg):
         user_id = msg.from_user.id
         user_states[user_id] = {"step": "mtn_bill_number"}
@@ -575,13 +572,13 @@ def register_bill_and_units(bot, history):
         )
         bot.send_message(msg.chat.id, f"هل الرقم التالي صحيح؟\n{number}", reply_markup=kb)
 
-    @bot.callback_query_handler(func=lambda call: call.data == "edit_mtn_bill_number")
+    @router.on_callback(bot, "edit_mtn_bill_number")
     def edit_mtn_bill_number(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "mtn_bill_number"
         bot.send_message(call.message.chat.id, "📱 أعد إدخال رقم الموبايل:")
 
-    @bot.callback_query_handler(func=lambda call: call.data == "confirm_mtn_bill_number")
+    @router.on_callback(bot, "confirm_mtn_bill_number")
     def confirm_mtn_bill_number(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "mtn_bill_amount"
@@ -610,13 +607,13 @@ def register_bill_and_units(bot, history):
             f"هل المبلغ التالي صحيح؟\n{amount:,} ل.س", reply_markup=kb
         )
 
-    @bot.callback_query_handler(func=lambda call: call.data == "edit_mtn_bill_amount")
+    @router.on_callback(bot, "edit_mtn_bill_amount")
     def edit_mtn_bill_amount(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "mtn_bill_amount"
         bot.send_message(call.message.chat.id, "💵 أعد إرسال مبلغ الفاتورة:")
 
-    @bot.callback_query_handler(func=lambda call: call.data == "confirm_mtn_bill_amount")
+    @router.on_callback(bot, "confirm_mtn_bill_amount")
     def confirm_mtn_bill_amount(call):
         user_id = call.from_user.id
         amount = user_states[user_id]["amount"]
@@ -637,22 +634,20 @@ def register_bill_and_units(bot, history):
             reply_markup=kb
         )
 
-    @bot.callback_query_handler(func=lambda call: call.data == "final_confirm_mtn_bill")
+    @router.on_callback(bot, "final_confirm_mtn_bill")
     def final_confirm_mtn_bill(call):
         user_id = call.from_user.id
 
-        existing = get_table("pending_requests") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .execute()
-        if existing.data:
+        if has_pending_request(user_id):
             return bot.send_message(call.message.chat.id,
                 "❌ لديك طلب قيد الانتظار، الرجاء الانتظار حتى تتم معالجته."
             )
 
         total = user_states[user_id]["amount_with_fee"]
-        balance = get_balance(user_id)
-        if balance < total:
+        try:
+            deduct_balance(user_id, total)
+        except InsufficientBalanceError:
+            balance = get_balance(user_id)
             kb = make_inline_buttons(
                 ("❌ إلغاء", "cancel_all"),
                 ("💼 المحفظة", "go_wallet")
@@ -665,8 +660,6 @@ def register_bill_and_units(bot, history):
             )
             return
 
-        deduct_balance(user_id, total)
-
         state = user_states[user_id]
         state["step"] = "wait_admin_mtn_bill"
         summary = (
@@ -680,25 +673,25 @@ def register_bill_and_units(bot, history):
             user_id=user_id,
             username=call.from_user.username,
             request_text=summary,
-            payload={
-                "type": "mtn_bill",
-                "number": state["number"],
-                "amount": state["amount"],
-                "total": total,
-                "reserved": total,
-            }
+            payload=MtnBillPayload(
+                number=state["number"],
+                amount=state["amount"],
+                total=total,
+                reserved=total,
+            ).to_dict()
         )
         bot.send_message(call.message.chat.id, "✅ تم إرسال طلبك للإدارة، بانتظار الموافقة.")
 
     # زر الذهاب للمحفظة في حال الرصيد غير كافٍ
-    @bot.callback_query_handler(func=lambda call: call.data == "go_wallet")
+    @router.on_callback(bot, "go_wallet")
     def go_wallet(call):
         user_states.pop(call.from_user.id, None)
         bot.send_message(call.message.chat.id, "💼 للذهاب للمحفظة، اضغط على زر المحفظة في القائمة الرئيسية.") 
 
 
+@registry.once
 def register(bot):
     """
     تستدعى من main.py لتسجيل جميع هاندلرات bill_and_units
     """
-    register_bill_and_units(bot, {})
+    register_bill_and_units(bot, history)
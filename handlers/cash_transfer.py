@@ -1,14 +1,17 @@
 from telebot import types
-from services.wallet_service import add_purchase, get_balance, has_sufficient_balance, deduct_balance
-from database.db import get_table
+from services.wallet_service import add_purchase, get_balance, has_sufficient_balance, deduct_balance, InsufficientBalanceError
 from config import ADMIN_MAIN_ID
 from services.wallet_service import register_user_if_not_exist
 from handlers import keyboards
-from services.queue_service import add_pending_request
+from handlers import router
+from handlers import registry
+from services.queue_service import add_pending_request, has_pending_request
+from database.models.request_payload import CashTransferPayload
 import math  # لإدارة صفحات الكيبورد
 import logging
+from services.session_store import store, ADMIN_WAIT_TTL
 
-user_states = {}
+user_states = store.flow("cash_transfer", ttl=ADMIN_WAIT_TTL)
 
 CASH_TYPES = [
     "تحويل إلى سيرياتيل كاش",
@@ -73,9 +76,10 @@ def deduct_balance(user_id, amount):
     from services.wallet_service import deduct_balance as deduct_bal
     deduct_bal(user_id, amount)
 
+@registry.once
 def register(bot, history):
 
-    @bot.callback_query_handler(func=lambda c: c.data.startswith("cash_page_"))
+    @router.on_callback_prefix(bot, "cash_page_")
     def _paginate_cash_menu(call):
         page = int(call.data.split("_")[-1])
         bot.edit_message_reply_markup(
@@ -85,7 +89,7 @@ def register(bot, history):
         )
         bot.answer_callback_query(call.id)
 
-    @bot.callback_query_handler(func=lambda c: c.data.startswith("cash_sel_"))
+    @router.on_callback_prefix(bot, "cash_sel_")
     def _cash_type_selected(call):
         idx = int(call.data.split("_")[-1])
         if idx < 0 or idx >= len(CASH_TYPES):
@@ -96,8 +100,7 @@ def register(bot, history):
         user_id = call.from_user.id
 
         # تحقق طلب معلق مسبق
-        existing = get_table("pending_requests").select("id").eq("user_id", user_id).execute()
-        if existing.data:
+        if has_pending_request(user_id):
             bot.answer_callback_query(call.id, "❌ لديك طلب قيد الانتظار، الرجاء الانتظار حتى الانتهاء.", show_alert=True)
             return
 
@@ -121,17 +124,16 @@ def register(bot, history):
         )
         bot.answer_callback_query(call.id)
 
-    @bot.message_handler(func=lambda msg: msg.text == "🧧 تحويل كاش من محفظتك")
+    @router.on_text(bot, "🧧 تحويل كاش من محفظتك")
     def open_cash_menu(msg):
         start_cash_transfer(bot, msg, history)
 
-    @bot.message_handler(func=lambda msg: msg.text in CASH_TYPES)
+    @router.on_text(bot, *CASH_TYPES)
     def handle_cash_type(msg):
         user_id = msg.from_user.id
 
         # تحقق طلب معلق مسبق
-        existing = get_table("pending_requests").select("id").eq("user_id", user_id).execute()
-        if existing.data:
+        if has_pending_request(user_id):
             bot.send_message(msg.chat.id, "❌ لديك طلب قيد الانتظار، الرجاء الانتظار حتى الانتهاء.")
             return
 
@@ -150,14 +152,14 @@ def register(bot, history):
         )
         bot.send_message(msg.chat.id, text, reply_markup=kb)
 
-    @bot.callback_query_handler(func=lambda call: call.data == "commission_cancel")
+    @router.on_callback(bot, "commission_cancel")
     def commission_cancel(call):
         user_id = call.from_user.id
         logging.info(f"[CASH][{user_id}] ألغى عملية التحويل")
         bot.edit_message_text("❌ تم إلغاء العملية.", call.message.chat.id, call.message.message_id)
         user_states.pop(user_id, None)
 
-    @bot.callback_query_handler(func=lambda call: call.data == "commission_confirm")
+    @router.on_callback(bot, "commission_confirm")
     def commission_confirmed(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "awaiting_number"
@@ -183,13 +185,13 @@ def register(bot, history):
             reply_markup=kb
         )
 
-    @bot.callback_query_handler(func=lambda call: call.data == "edit_number")
+    @router.on_callback(bot, "edit_number")
     def edit_number(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "awaiting_number"
         bot.send_message(call.message.chat.id, "📲 أعد كتابة الرقم المراد التحويل له:")
 
-    @bot.callback_query_handler(func=lambda call: call.data == "number_confirm")
+    @router.on_callback(bot, "number_confirm")
     def number_confirm(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "awaiting_amount"
@@ -218,8 +220,7 @@ def register(bot, history):
         state["total"] = total
 
         # تحقق طلب معلق مسبق عند تأكيد المبلغ
-        existing = get_table("pending_requests").select("id").eq("user_id", user_id).execute()
-        if existing.data:
+        if has_pending_request(user_id):
             bot.send_message(msg.chat.id, "❌ لديك طلب قيد الانتظار، الرجاء الانتظار حتى الانتهاء.")
             return
 
@@ -241,13 +242,13 @@ def register(bot, history):
         )
         bot.send_message(msg.chat.id, summary, reply_markup=kb)
 
-    @bot.callback_query_handler(func=lambda call: call.data == "edit_amount")
+    @router.on_callback(bot, "edit_amount")
     def edit_amount(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "awaiting_amount"
         bot.send_message(call.message.chat.id, "💰 أعد كتابة المبلغ:")
 
-    @bot.callback_query_handler(func=lambda call: call.data == "cash_confirm")
+    @router.on_callback(bot, "cash_confirm")
     def confirm_transfer(call):
         user_id = call.from_user.id
         data = user_states.get(user_id, {})
@@ -304,38 +305,38 @@ def register(bot, history):
                 f"🧾 العمولة: {commission:,} ل.س\n"
                 f"✅ الإجمالي: {total:,} ل.س",
             ),
-            payload={
-                "type": "cash_transfer",
-                "number": data.get('number'),
-                "cash_type": data.get('cash_type'),
-                "amount": amount,
-                "commission": commission,
-                "total": total,
-                "reserved": total,
-            }
+            payload=CashTransferPayload(
+                number=data.get('number'),
+                cash_type=data.get('cash_type'),
+                amount=amount,
+                commission=commission,
+                total=total,
+            ).to_dict()
         )
         msg_admin = bot.send_message(ADMIN_MAIN_ID, message, reply_markup=kb_admin)
         user_states[user_id]["admin_message_id"] = msg_admin.message_id
         user_states[user_id]["admin_chat_id"] = ADMIN_MAIN_ID
 
-    @bot.callback_query_handler(func=lambda call: call.data == "recharge_wallet")
+    @router.on_callback(bot, "recharge_wallet")
     def show_recharge_methods(call):
         bot.send_message(call.message.chat.id, "💳 اختر طريقة شحن المحفظة:", reply_markup=keyboards.recharge_menu())
 
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("admin_cash_accept_"))
+    @router.on_callback_prefix(bot, "admin_cash_accept_")
     def admin_accept_cash_transfer(call):
         try:
             parts = call.data.split("_")
             user_id = int(parts[-2])
             total = int(parts[-1])
             data = user_states.get(user_id, {})
-            if not has_sufficient_balance(user_id, total):
+            # الخصم الذري يرفض إن لم يكفِ الرصيد (لا فحص مسبق منفصل)
+            try:
+                deduct_balance(user_id, total)
+            except InsufficientBalanceError:
                 logging.warning(f"[CASH][ADMIN][{user_id}] فشل التحويل، لا يوجد رصيد كافٍ")
                 bot.send_message(user_id, f"❌ فشل تحويل الكاش: لا يوجد رصيد كافٍ في محفظتك.")
                 bot.answer_callback_query(call.id, "❌ لا يوجد رصيد كافٍ لدى العميل.")
                 bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
                 return
-            deduct_balance(user_id, total)
             logging.info(f"[CASH][ADMIN][{user_id}] تم الخصم وقبول التحويل، الإجمالي: {total}")
             bot.send_message(
                 user_id,
@@ -356,7 +357,7 @@ def register(bot, history):
             logging.error(f"[CASH][ADMIN][{user_id}] خطأ أثناء تأكيد التحويل: {e}", exc_info=True)
             bot.send_message(call.message.chat.id, f"❌ حدث خطأ: {e}")
 
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("admin_cash_reject_"))
+    @router.on_callback_prefix(bot, "admin_cash_reject_")
     def admin_reject_cash_transfer(call):
         try:
             user_id = int(call.data.split("_")[-1])
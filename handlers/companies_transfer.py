@@ -1,13 +1,16 @@
 from telebot import types
-from services.wallet_service import add_purchase, get_balance, has_sufficient_balance, deduct_balance
-from database.db import get_table
+from services.wallet_service import add_purchase, get_balance, has_sufficient_balance, deduct_balance, InsufficientBalanceError
 from config import ADMIN_MAIN_ID
 from services.wallet_service import register_user_if_not_exist
 from handlers import keyboards
-from services.queue_service import add_pending_request
+from handlers import router
+from handlers import registry
+from services.queue_service import add_pending_request, has_pending_request
+from database.models.request_payload import CompaniesTransferPayload
 import logging
+from services.session_store import store, ADMIN_WAIT_TTL
 
-user_states = {}
+user_states = store.flow("companies_transfer", ttl=ADMIN_WAIT_TTL)
 
 COMMISSION_PER_50000 = 1500
 
@@ -44,9 +47,10 @@ def deduct_balance(user_id, amount):
     from services.wallet_service import deduct_balance as deduct_bal
     deduct_bal(user_id, amount)
 
+@registry.once
 def register_companies_transfer(bot, history):
 
-    @bot.message_handler(func=lambda msg: msg.text == "حوالة مالية عبر شركات")
+    @router.on_text(bot, "حوالة مالية عبر شركات")
     def open_companies_menu(msg):
         user_id = msg.from_user.id
         register_user_if_not_exist(user_id)
@@ -55,15 +59,12 @@ def register_companies_transfer(bot, history):
         logging.info(f"[COMPANY][{user_id}] فتح قائمة تحويل الشركات")
         bot.send_message(msg.chat.id, "💸 اختر الشركة التي تريد التحويل عبرها:", reply_markup=companies_transfer_menu())
 
-    @bot.callback_query_handler(func=lambda call: call.data in [
-        "company_alharam", "company_alfouad", "company_shakhashir"
-    ])
+    @router.on_callback(bot, "company_alharam", "company_alfouad", "company_shakhashir")
     def select_company(call):
         user_id = call.from_user.id
 
         # تحقق طلب معلق مسبق
-        existing = get_table("pending_requests").select("id").eq("user_id", user_id).execute()
-        if existing.data:
+        if has_pending_request(user_id):
             bot.answer_callback_query(call.id, "❌ لديك طلب قيد الانتظار، الرجاء الانتظار حتى الانتهاء.", show_alert=True)
             return
 
@@ -87,14 +88,14 @@ def register_companies_transfer(bot, history):
         )
         bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=kb)
 
-    @bot.callback_query_handler(func=lambda call: call.data == "company_commission_cancel")
+    @router.on_callback(bot, "company_commission_cancel")
     def company_commission_cancel(call):
         user_id = call.from_user.id
         logging.info(f"[COMPANY][{user_id}] ألغى العملية من شاشة العمولة")
         bot.edit_message_text("❌ تم إلغاء العملية.", call.message.chat.id, call.message.message_id)
         user_states.pop(user_id, None)
 
-    @bot.callback_query_handler(func=lambda call: call.data == "company_commission_confirm")
+    @router.on_callback(bot, "company_commission_confirm")
     def company_commission_confirm(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "awaiting_beneficiary_name"
@@ -125,13 +126,13 @@ def register_companies_transfer(bot, history):
             reply_markup=kb
         )
 
-    @bot.callback_query_handler(func=lambda call: call.data == "edit_beneficiary_name")
+    @router.on_callback(bot, "edit_beneficiary_name")
     def edit_beneficiary_name(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "awaiting_beneficiary_name"
         bot.send_message(call.message.chat.id, "👤 أعد إرسال اسم المستفيد (الاسم الكنية ابن الأب):")
 
-    @bot.callback_query_handler(func=lambda call: call.data == "beneficiary_name_confirm")
+    @router.on_callback(bot, "beneficiary_name_confirm")
     def beneficiary_name_confirm(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "awaiting_beneficiary_number"
@@ -163,13 +164,13 @@ def register_companies_transfer(bot, history):
             reply_markup=kb
         )
 
-    @bot.callback_query_handler(func=lambda call: call.data == "edit_beneficiary_number")
+    @router.on_callback(bot, "edit_beneficiary_number")
     def edit_beneficiary_number(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "awaiting_beneficiary_number"
         bot.send_message(call.message.chat.id, "📱 أعد إرسال رقم المستفيد (يجب أن يبدأ بـ 09):")
 
-    @bot.callback_query_handler(func=lambda call: call.data == "beneficiary_number_confirm")
+    @router.on_callback(bot, "beneficiary_number_confirm")
     def beneficiary_number_confirm(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "awaiting_transfer_amount"
@@ -198,8 +199,7 @@ def register_companies_transfer(bot, history):
         user_states[user_id]["total"] = total
 
         # تحقق طلب معلق مسبق قبل تأكيد المبلغ
-        existing = get_table("pending_requests").select("id").eq("user_id", user_id).execute()
-        if existing.data:
+        if has_pending_request(user_id):
             bot.send_message(msg.chat.id, "❌ لديك طلب قيد الانتظار، الرجاء الانتظار حتى الانتهاء.")
             return
 
@@ -221,13 +221,13 @@ def register_companies_transfer(bot, history):
         logging.info(f"[COMPANY][{user_id}] مبلغ التحويل: {amount}, عمولة: {commission}, إجمالي: {total}")
         bot.send_message(msg.chat.id, summary, reply_markup=kb)
 
-    @bot.callback_query_handler(func=lambda call: call.data == "edit_transfer_amount")
+    @router.on_callback(bot, "edit_transfer_amount")
     def edit_transfer_amount(call):
         user_id = call.from_user.id
         user_states[user_id]["step"] = "awaiting_transfer_amount"
         bot.send_message(call.message.chat.id, "💵 أعد إرسال المبلغ (مثال: 12345):")
 
-    @bot.callback_query_handler(func=lambda call: call.data == "company_transfer_confirm")
+    @router.on_callback(bot, "company_transfer_confirm")
     def company_transfer_confirm(call):
         user_id = call.from_user.id
         data = user_states.get(user_id, {})
@@ -280,16 +280,14 @@ def register_companies_transfer(bot, history):
             user_id=user_id,
             username=call.from_user.username,
             request_text=msg,
-            payload={
-                "type": "companies_transfer",
-                "beneficiary_name": data.get('beneficiary_name'),
-                "beneficiary_number": data.get('beneficiary_number'),
-                "company": data.get('company'),
-                "amount": amount,
-                "commission": commission,
-                "total": total,
-                "reserved": total,
-            }
+            payload=CompaniesTransferPayload(
+                beneficiary_name=data.get('beneficiary_name'),
+                beneficiary_number=data.get('beneficiary_number'),
+                company=data.get('company'),
+                amount=amount,
+                commission=commission,
+                total=total,
+            ).to_dict()
         )
         msg_admin = bot.send_message(
             ADMIN_MAIN_ID,
@@ -299,24 +297,26 @@ def register_companies_transfer(bot, history):
         user_states[user_id]["admin_message_id"] = msg_admin.message_id
         user_states[user_id]["admin_chat_id"] = ADMIN_MAIN_ID
 
-    @bot.callback_query_handler(func=lambda call: call.data == "recharge_wallet")
+    @router.on_callback(bot, "recharge_wallet")
     def show_recharge_methods(call):
         bot.send_message(call.message.chat.id, "💳 اختر طريقة شحن المحفظة:", reply_markup=keyboards.recharge_menu())
 
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("admin_company_accept_"))
+    @router.on_callback_prefix(bot, "admin_company_accept_")
     def admin_accept_company_transfer(call):
         try:
             parts = call.data.split("_")
             user_id = int(parts[-2])
             total = int(parts[-1])
             data = user_states.get(user_id, {})
-            if not has_sufficient_balance(user_id, total):
+            # الخصم الذري يرفض إن لم يكفِ الرصيد (لا فحص مسبق منفصل)
+            try:
+                deduct_balance(user_id, total)
+            except InsufficientBalanceError:
                 logging.warning(f"[COMPANY][ADMIN][{user_id}] فشل الحوالة، لا يوجد رصيد كافٍ")
                 bot.send_message(user_id, "❌ فشل الحوالة: لا يوجد رصيد كافٍ في محفظتك.")
                 bot.answer_callback_query(call.id, "❌ لا يوجد رصيد كافٍ لدى العميل.")
                 bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
                 return
-            deduct_balance(user_id, total)
             logging.info(f"[COMPANY][ADMIN][{user_id}] تم الخصم وقبول الحوالة، الإجمالي: {total}")
             bot.send_message(
                 user_id,
@@ -337,7 +337,7 @@ def register_companies_transfer(bot, history):
             logging.error(f"[COMPANY][ADMIN][{user_id}] خطأ أثناء تأكيد الحوالة: {e}", exc_info=True)
             bot.send_message(call.message.chat.id, f"❌ حدث خطأ: {e}")
 
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("admin_company_reject_"))
+    @router.on_callback_prefix(bot, "admin_company_reject_")
     def admin_reject_company_transfer(call):
         try:
             user_id = int(call.data.split("_")[-1])
@@ -8,19 +8,25 @@ from telebot import types
 
 from config import ADMIN_MAIN_ID
 from database.models.product import Product
+from database.models.request_payload import InternetPayload
 from services.wallet_service import (
     register_user_if_not_exist,
     add_purchase,
     get_balance,
     has_sufficient_balance,
     deduct_balance,
+    InsufficientBalanceError,
 )
 from services.queue_service import (
     add_pending_request,
     process_queue,
     delete_pending_request,
+    has_pending_request,  # لمنع الطلبات المتزامنة
 )
-from database.db import get_table  # لمنع الطلبات المتزامنة
+from handlers import router
+from handlers import registry
+from handlers import keyboards
+from services.session_store import store, ADMIN_WAIT_TTL
 # =====================================
 #       ثوابت
 # =====================================
@@ -40,7 +46,7 @@ INTERNET_SPEEDS = [
 COMMISSION_PER_5000 = 600
 
 # حالة المستخدم (نوع الطلب والخطوات)
-user_net_state = {}  # { user_id: { step, provider?, speed?, price?, phone? } }
+user_net_state = store.flow("internet", ttl=ADMIN_WAIT_TTL)  # { user_id: { step, provider?, speed?, price?, phone? } }
 
 # =====================================
 #   وظائف مساعدة
@@ -72,28 +78,37 @@ CB_CANCEL        = "icancel"      # إلغاء من المستخدم
 
 # Inline keyboards
 def _provider_inline_kb() -> types.InlineKeyboardMarkup:
+    return _providers_kb(tuple(INTERNET_PROVIDERS))
+
+@keyboards.cached_markup
+def _providers_kb(providers) -> types.InlineKeyboardMarkup:
     kb = types.InlineKeyboardMarkup(row_width=2)
     btns = [
         types.InlineKeyboardButton(f"🌐 {name}", callback_data=f"{CB_PROV_PREFIX}:{name}")
-        for name in INTERNET_PROVIDERS
+        for name in providers
     ]
     kb.add(*btns)
     kb.add(types.InlineKeyboardButton("❌ إلغاء", callback_data=CB_CANCEL))
     return kb
 
 def _speeds_inline_kb() -> types.InlineKeyboardMarkup:
+    return _speeds_kb(tuple((speed["label"], speed["price"]) for speed in INTERNET_SPEEDS))
+
+@keyboards.cached_markup
+def _speeds_kb(speeds) -> types.InlineKeyboardMarkup:
     kb = types.InlineKeyboardMarkup(row_width=2)
     btns = [
         types.InlineKeyboardButton(
-            text=f"{speed['label']} - {speed['price']:,} ل.س",
+            text=f"{label} - {price:,} ل.س",
             callback_data=f"{CB_SPEED_PREFIX}:{idx}"
         )
-        for idx, speed in enumerate(INTERNET_SPEEDS)
+        for idx, (label, price) in enumerate(speeds)
     ]
     kb.add(*btns)
     kb.add(types.InlineKeyboardButton("⬅️ رجوع", callback_data=CB_BACK_PROV))
     return kb
 
+@keyboards.cached_markup
 def _confirm_inline_kb() -> types.InlineKeyboardMarkup:
     kb = types.InlineKeyboardMarkup(row_width=2)
     kb.add(
@@ -106,15 +121,16 @@ def _confirm_inline_kb() -> types.InlineKeyboardMarkup:
 # =====================================
 #   بدء القوائم وتسجيل المعالجات
 # =====================================
+@registry.once
 def register(bot):
     """تسجيل معالجات مزودي الإنترنت."""
     # فتح القائمة الرئيسية
-    @bot.message_handler(func=lambda msg: msg.text == "🌐 دفع مزودات الإنترنت ADSL")
+    @router.on_text(bot, "🌐 دفع مزودات الإنترنت ADSL")
     def open_net_menu(msg):
         start_internet_provider_menu(bot, msg)
 
     # اختيار مزود
-    @bot.callback_query_handler(func=lambda c: c.data.startswith(f"{CB_PROV_PREFIX}:"))
+    @router.on_callback_prefix(bot, f"{CB_PROV_PREFIX}:")
     def cb_choose_provider(call):
         user_id = call.from_user.id
         provider = call.data.split(":", 1)[1]
@@ -129,7 +145,7 @@ def register(bot):
         )
 
     # رجوع لقائمة المزودين
-    @bot.callback_query_handler(func=lambda c: c.data == CB_BACK_PROV)
+    @router.on_callback(bot, CB_BACK_PROV)
     def cb_back_to_prov(call):
         user_id = call.from_user.id
         user_net_state[user_id] = {"step": "choose_provider"}
@@ -141,7 +157,7 @@ def register(bot):
         )
 
     # اختيار سرعة
-    @bot.callback_query_handler(func=lambda c: c.data.startswith(f"{CB_SPEED_PREFIX}:"))
+    @router.on_callback_prefix(bot, f"{CB_SPEED_PREFIX}:")
     def cb_choose_speed(call):
         user_id = call.from_user.id
         try:
@@ -165,13 +181,14 @@ def register(bot):
         )
 
     # رجوع لشاشة السرعات
-    @bot.callback_query_handler(func=lambda c: c.data == CB_BACK_SPEED)
+    @router.on_callback(bot, CB_BACK_SPEED)
     def cb_back_to_speed(call):
         user_id = call.from_user.id
         st = user_net_state.get(user_id, {})
         if "provider" not in st:
             return cb_back_to_prov(call)
         st["step"] = "choose_speed"
+        user_net_state[user_id] = st  # get للفحص فقط ← الحفظ وتجديد المهلة بالإسناد
         bot.edit_message_text(
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
@@ -180,7 +197,7 @@ def register(bot):
         )
 
     # إلغاء من المستخدم
-    @bot.callback_query_handler(func=lambda c: c.data == CB_CANCEL)
+    @router.on_callback(bot, CB_CANCEL)
     def cb_cancel(call):
         user_net_state.pop(call.from_user.id, None)
         bot.edit_message_text(
@@ -223,7 +240,7 @@ def register(bot):
         )
 
     # إرسال الطلب إلى طابور الأدمن مع حجز المبلغ
-    @bot.callback_query_handler(func=lambda c: c.data == CB_CONFIRM)
+    @router.on_callback(bot, CB_CONFIRM)
     def cb_confirm(call):
         user_id = call.from_user.id
         st = user_net_state.get(user_id)
@@ -231,16 +248,18 @@ def register(bot):
             return bot.answer_callback_query(call.id, "انتهت صلاحية هذا الطلب.", show_alert=True)
 
         # منع الطلبات المتزامنة
-        existing = get_table("pending_requests").select("id").eq("user_id", user_id).execute()
-        if getattr(existing, 'data', None):
+        if has_pending_request(user_id):
             return bot.answer_callback_query(call.id, "❌ لديك طلب قيد الانتظار، الرجاء الانتظار حتى الانتهاء.", show_alert=True)
 
         price = st["price"]
         comm  = calculate_commission(price)
         total = price + comm
 
-        balance = get_balance(user_id)
-        if balance < total:
+        # حجز الرصيد (الخصم الذري يرفض إن لم يكفِ الرصيد)
+        try:
+            balance = deduct_balance(user_id, total) + total  # الرصيد قبل الحجز كما في رسالة الأدمن
+        except InsufficientBalanceError:
+            balance = get_balance(user_id)
             missing = total - balance
             return bot.answer_callback_query(
                 call.id,
@@ -248,9 +267,6 @@ def register(bot):
                 show_alert=True
             )
 
-        # حجز الرصيد
-        deduct_balance(user_id, total)
-
         adm_txt = (
             "📥 *طلب جديد (إنترنت)*\n"
             f"المستخدم: {user_id}\n"
@@ -265,16 +281,15 @@ def register(bot):
             user_id=user_id,
             username=call.from_user.username,
             request_text=adm_txt,
-            payload={
-                "type": "internet",
-                "provider": st["provider"],
-                "speed": st["speed"],
-                "phone": st["phone"],
-                "price": price,
-                "comm": comm,
-                "total": total,
-                "reserved": total,
-            }
+            payload=InternetPayload(
+                provider=st["provider"],
+                speed=st["speed"],
+                phone=st["phone"],
+                price=price,
+                comm=comm,
+                total=total,
+                reserved=total,
+            ).to_dict()
         )
         process_queue(bot)
 
@@ -286,6 +301,7 @@ def register(bot):
         )
 
         st["step"] = "wait_admin"
+        user_net_state[user_id] = st
 
 def start_internet_provider_menu(bot, message):
     bot.send_message(
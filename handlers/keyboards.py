@@ -1,6 +1,29 @@
 from telebot import types
+import functools
 import logging
 
+# ---- كاش الكيبوردات ----
+# كل لوحة تُبنى مرة واحدة ويُحفظ JSON الخاص بها (telebot يستدعي to_json عند كل إرسال).
+# المفتاح هو معاملات الدالة، فاللوحات المبنية من قوائم تُمرَّر لها القائمة كـ tuple:
+# أي تغيير في المحتوى يعطي مفتاحًا جديدًا، و cache_clear() يمسح الكاش يدويًا.
+
+def _read_only(*args, **kwargs):
+    raise TypeError("لوحة مخزنة مؤقتًا: لا تعدّلها، ابنِ لوحة جديدة")
+
+def freeze_markup(markup):
+    data = markup.to_json()
+    markup.to_json = lambda: data
+    markup.add = markup.row = _read_only
+    return markup
+
+def cached_markup(func):
+    @functools.lru_cache(maxsize=256)
+    @functools.wraps(func)
+    def wrapper(*args):
+        return freeze_markup(func(*args))
+    return wrapper
+
+@cached_markup
 def main_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     markup.add(
@@ -13,6 +36,7 @@ def main_menu():
     )
     return markup
 
+@cached_markup
 def products_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     markup.add(
@@ -27,6 +51,7 @@ def products_menu():
     return markup
 
 # قائمة التحويلات المدمجة
+@cached_markup
 def transfers_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     markup.add(
@@ -36,6 +61,7 @@ def transfers_menu():
     )
     return markup
 
+@cached_markup
 def game_categories():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=3)
     markup.add(
@@ -46,6 +72,7 @@ def game_categories():
     )
     return markup
 
+@cached_markup
 def recharge_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     markup.add(
@@ -58,6 +85,7 @@ def recharge_menu():
     )
     return markup
 
+@cached_markup
 def cash_transfer_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     markup.add(
@@ -69,6 +97,7 @@ def cash_transfer_menu():
     )
     return markup
 
+@cached_markup
 def companies_transfer_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     markup.add(
@@ -88,6 +117,7 @@ def syrian_balance_menu():
     markup.add(*buttons)
     return markup
 
+@cached_markup
 def wallet_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     markup.add(
@@ -100,6 +130,7 @@ def wallet_menu():
     )
     return markup
 
+@cached_markup
 def support_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=1)
     markup.add(
@@ -108,6 +139,7 @@ def support_menu():
     )
     return markup
 
+@cached_markup
 def links_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     markup.add(
@@ -118,6 +150,7 @@ def links_menu():
     )
     return markup
 
+@cached_markup
 def media_services_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     markup.add(
@@ -130,5 +163,6 @@ def media_services_menu():
     )
     return markup
 
+@cached_markup
 def hide_keyboard():
     return types.ReplyKeyboardRemove()
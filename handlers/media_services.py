@@ -2,13 +2,16 @@
 from telebot import types
 from config import ADMIN_MAIN_ID
 from services.wallet_service import register_user_if_not_exist
-from services.wallet_service import add_purchase, get_balance, has_sufficient_balance,deduct_balance
+from services.wallet_service import add_purchase, get_balance, has_sufficient_balance,deduct_balance, InsufficientBalanceError
 from handlers.keyboards import media_services_menu
+from handlers import router
+from handlers import registry
 from services.queue_service import add_pending_request
 import logging
+from services.session_store import store, ADMIN_WAIT_TTL
 
 # حالة المستخدم داخل سير عمل خدمات الإعلام
-user_media_state = {}
+user_media_state = store.flow("media_services", ttl=ADMIN_WAIT_TTL)
 USD_RATE = 11000  # سعر الصرف ليرة/دولار
 MEDIA_PRODUCTS = {
     "🖼️ تصميم لوغو احترافي": 300,
@@ -24,8 +27,9 @@ def make_inline_buttons(*buttons):
         kb.add(types.InlineKeyboardButton(text, callback_data=data))
     return kb
 
+@registry.once
 def register(bot, user_state):
-    @bot.message_handler(func=lambda msg: msg.text == "🖼️ خدمات إعلانية وتصميم")
+    @router.on_text(bot, "🖼️ خدمات إعلانية وتصميم")
     def open_media_menu(msg):
         user_id = msg.from_user.id
         # تعيين حالة القائمة الرئيسية إلى خدمات إعلامية
@@ -38,7 +42,7 @@ def register(bot, user_state):
             reply_markup=media_services_menu()
         )
 
-    @bot.message_handler(func=lambda msg: user_media_state.get(msg.from_user.id, {}).get("step") == "choose_service" and msg.text in MEDIA_PRODUCTS)
+    @router.on_text(bot, *MEDIA_PRODUCTS, func=lambda msg: user_media_state.get(msg.from_user.id, {}).get("step") == "choose_service")
     def handle_selected_service(msg):
         user_id = msg.from_user.id
         service = msg.text
@@ -100,7 +104,7 @@ def register(bot, user_state):
             reply_markup=kb
         )
 
-    @bot.callback_query_handler(func=lambda call: call.data == "media_cancel")
+    @router.on_callback(bot, "media_cancel")
     def cancel_media(call):
         user_id = call.from_user.id
         bot.edit_message_text(
@@ -110,7 +114,7 @@ def register(bot, user_state):
         )
         user_media_state.pop(user_id, None)
 
-    @bot.callback_query_handler(func=lambda call: call.data == "media_confirm")
+    @router.on_callback(bot, "media_confirm")
     def confirm_media(call):
         user_id = call.from_user.id
         state = user_media_state.pop(user_id, {})
@@ -118,18 +122,17 @@ def register(bot, user_state):
         price_syp = state.get("price_syp", 0)
         details = state.get("details", "")
 
-        # التحقق من الرصيد (إذا السعر > 0)
-        if price_syp > 0 and not has_sufficient_balance(user_id, price_syp):
-            bot.edit_message_text(
-                "❌ لا يوجد رصيد كافٍ في محفظتك لإتمام هذه الخدمة.",
-                call.message.chat.id,
-                call.message.message_id
-            )
-            return
-
-        # خصم الرصيد إن وُجد سعر
+        # خصم الرصيد إن وُجد سعر (الخصم الذري يرفض إن لم يكفِ الرصيد)
         if price_syp > 0:
-            deduct_balance(user_id, price_syp)
+            try:
+                deduct_balance(user_id, price_syp)
+            except InsufficientBalanceError:
+                bot.edit_message_text(
+                    "❌ لا يوجد رصيد كافٍ في محفظتك لإتمام هذه الخدمة.",
+                    call.message.chat.id,
+                    call.message.message_id
+                )
+                return
 
         # بناء رسالة للإدارة
         admin_msg = (
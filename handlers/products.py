@@ -1,49 +1,17 @@
 import logging
 from telebot import types
-from services.wallet_service import register_user_if_not_exist, get_balance, deduct_balance
+from services.wallet_service import register_user_if_not_exist, get_balance, deduct_balance, InsufficientBalanceError
 from config import BOT_NAME
 from handlers import keyboards
+from handlers import router
+from handlers import registry
 from services.queue_service import process_queue, add_pending_request
-from database.models.product import Product
-
-pending_orders = set()
-user_orders = {}
-
-# ============= تعريف المنتجات =============
-PRODUCTS = {
-    "PUBG": [
-        Product(1, "60 شدة", "ألعاب", 0.89, "زر 60 شدة"),
-        Product(2, "325 شدة", "ألعاب", 4.44, "زر 325 شدة"),
-        Product(3, "660 شدة", "ألعاب", 8.85, "زر 660 شدة"),
-        Product(4, "1800 شدة", "ألعاب", 22.09, "زر 1800 شدة"),
-        Product(5, "3850 شدة", "ألعاب", 43.24, "زر 3850 شدة"),
-        Product(6, "8100 شدة", "ألعاب", 86.31, "زر 8100 شدة"),
-    ],
-    "FreeFire": [
-        Product(7, "100 جوهرة", "ألعاب", 0.98, "زر 100 جوهرة"),
-        Product(8, "310 جوهرة", "ألعاب", 2.49, "زر 310 جوهرة"),
-        Product(9, "520 جوهرة", "ألعاب", 4.13, "زر 520 جوهرة"),
-        Product(10, "1060 جوهرة", "ألعاب", 9.42, "زر 1060 جوهرة"),
-        Product(11, "2180 جوهرة", "ألعاب", 18.84, "زر 2180 جوهرة"),
-    ],
-    "Jawaker": [
-        Product(12, "10000 توكنز", "ألعاب", 1.34, "زر 10000 توكنز"),
-        Product(13, "15000 توكنز", "ألعاب", 2.01, "زر 15000 توكنز"),
-        Product(14, "20000 توكنز", "ألعاب", 2.68, "زر 20000 توكنز"),
-        Product(15, "30000 توكنز", "ألعاب", 4.02, "زر 30000 توكنز"),
-        Product(16, "60000 توكنز", "ألعاب", 8.04, "زر 60000 توكنز"),
-        Product(17, "120000 توكنز", "ألعاب", 16.08, "زر 120000 توكنز"),
-    ],
-}
-
-def convert_price_usd_to_syp(usd):
-    if usd <= 5:
-        return int(usd * 11800)
-    elif usd <= 10:
-        return int(usd * 11600)
-    elif usd <= 20:
-        return int(usd * 11300)
-    return int(usd * 11000)
+from services import catalog_service
+from database.models.request_payload import OrderPayload
+from services.session_store import store, ADMIN_WAIT_TTL
+
+pending_orders = store.flow_set("products_pending", ttl=ADMIN_WAIT_TTL)
+user_orders = store.flow("products", ttl=ADMIN_WAIT_TTL)
 
 def show_products_menu(bot, message):
     bot.send_message(message.chat.id, "📍 اختر نوع المنتج:", reply_markup=keyboards.products_menu())
@@ -51,14 +19,23 @@ def show_products_menu(bot, message):
 def show_game_categories(bot, message):
     bot.send_message(message.chat.id, "🎮 اختر اللعبة أو التطبيق:", reply_markup=keyboards.game_categories())
 
-def show_product_options(bot, message, category):
-    options = PRODUCTS.get(category, [])
+@keyboards.cached_markup
+def _product_options_kb(version, category):
+    # version ضمن المفتاح: أي إعادة تحميل للكتالوج تبني لوحات جديدة
     keyboard = types.InlineKeyboardMarkup(row_width=2)
-    for p in options:
+    for p in catalog_service.products_in(category):
         keyboard.add(types.InlineKeyboardButton(f"{p.name} ({p.price}$)", callback_data=f"select_{p.product_id}"))
     keyboard.add(types.InlineKeyboardButton("⬅️ رجوع", callback_data="back_to_categories"))
+    return keyboard
+
+def show_product_options(bot, message, category):
+    keyboard = _product_options_kb(catalog_service.current().version, category)
     bot.send_message(message.chat.id, f"📦 اختر الكمية لـ {category}:", reply_markup=keyboard)
 
+def product_price_syp(product):
+    price = catalog_service.price_syp(product.product_id)
+    return price if price is not None else catalog_service.convert_price_usd_to_syp(product.price)
+
 def clear_user_order(user_id):
     user_orders.pop(user_id, None)
     pending_orders.discard(user_id)
@@ -73,8 +50,9 @@ def handle_player_id(message, bot):
         return
 
     order["player_id"] = player_id
+    user_orders[user_id] = order  # get للفحص فقط ← الحفظ وتجديد المهلة بالإسناد
     product = order["product"]
-    price_syp = convert_price_usd_to_syp(product.price)
+    price_syp = product_price_syp(product)
 
     keyboard = types.InlineKeyboardMarkup(row_width=2)
     keyboard.add(
@@ -96,8 +74,9 @@ def handle_player_id(message, bot):
         reply_markup=keyboard
     )
 
+@registry.once
 def register_message_handlers(bot, history):
-    @bot.message_handler(func=lambda msg: msg.text in ["🛒 المنتجات", "💼 المنتجات"])
+    @router.on_text(bot, "🛒 المنتجات", "💼 المنتجات")
     def handle_main_product_menu(msg):
         user_id = msg.from_user.id
         register_user_if_not_exist(user_id, msg.from_user.full_name)
@@ -107,18 +86,19 @@ def register_message_handlers(bot, history):
         history.setdefault(user_id, []).append("products_menu")
         show_products_menu(bot, msg)
 
-    @bot.message_handler(func=lambda msg: msg.text == "🎮 شحن ألعاب و تطبيقات")
+    @router.on_text(bot, "🎮 شحن ألعاب و تطبيقات")
     def handle_games_menu(msg):
         user_id = msg.from_user.id
         register_user_if_not_exist(user_id, msg.from_user.full_name)
         history.setdefault(user_id, []).append("games_menu")
         show_game_categories(bot, msg)
 
-    @bot.message_handler(func=lambda msg: msg.text in [
+    @router.on_text(
+        bot,
         "🎯 شحن شدات ببجي العالمية",
         "🔥 شحن جواهر فري فاير",
-        "🏏 تطبيق جواكر"
-    ])
+        "🏏 تطبيق جواكر",
+    )
     def game_handler(msg):
         user_id = msg.from_user.id
         register_user_if_not_exist(user_id, msg.from_user.full_name)
@@ -135,49 +115,43 @@ def register_message_handlers(bot, history):
         user_orders[user_id] = {"category": category}
         show_product_options(bot, msg, category)
 
+@registry.once
 def setup_inline_handlers(bot, admin_ids):
-    @bot.callback_query_handler(func=lambda c: c.data.startswith("select_"))
+    @router.on_callback_prefix(bot, "select_")
     def on_select_product(call):
         user_id = call.from_user.id
         if user_id in pending_orders:
             bot.answer_callback_query(call.id, "⚠️ لا يمكنك إرسال طلب جديد الآن، لديك طلب قيد التنفيذ.", show_alert=True)
             return
         product_id = int(call.data.split("_", 1)[1])
-        selected = None
-        for items in PRODUCTS.values():
-            for p in items:
-                if p.product_id == product_id:
-                    selected = p
-                    break
-            if selected:
-                break
+        selected = catalog_service.get_product(product_id)
         if not selected:
             bot.answer_callback_query(call.id, "❌ المنتج غير موجود.")
             return
-        user_orders[user_id] = {"category": selected.category, "product": selected}
+        user_orders[user_id] = {"category": catalog_service.group_of(product_id), "product": selected}
         kb = types.InlineKeyboardMarkup()
         kb.add(types.InlineKeyboardButton("⬅️ رجوع", callback_data="back_to_products"))
         msg = bot.send_message(user_id, "💡 أدخل آيدي اللاعب الخاص بك:", reply_markup=kb)
         bot.register_next_step_handler(msg, handle_player_id, bot)
 
-    @bot.callback_query_handler(func=lambda c: c.data == "back_to_products")
+    @router.on_callback(bot, "back_to_products")
     def back_to_products(call):
         user_id = call.from_user.id
         category = user_orders.get(user_id, {}).get("category")
         if category:
             show_product_options(bot, call.message, category)
 
-    @bot.callback_query_handler(func=lambda c: c.data == "back_to_categories")
+    @router.on_callback(bot, "back_to_categories")
     def back_to_categories(call):
         show_game_categories(bot, call.message)
 
-    @bot.callback_query_handler(func=lambda c: c.data == "cancel_order")
+    @router.on_callback(bot, "cancel_order")
     def cancel_order(call):
         user_id = call.from_user.id
         clear_user_order(user_id)
         bot.send_message(user_id, "❌ تم إلغاء الطلب.", reply_markup=keyboards.products_menu())
 
-    @bot.callback_query_handler(func=lambda c: c.data == "final_confirm_order")
+    @router.on_callback(bot, "final_confirm_order")
     def final_confirm_order(call):
         user_id = call.from_user.id
         if user_id in pending_orders:
@@ -189,20 +163,18 @@ def setup_inline_handlers(bot, admin_ids):
             return
         product = order["product"]
         player_id = order["player_id"]
-        price_syp = convert_price_usd_to_syp(product.price)
+        price_syp = product_price_syp(product)
 
-        # **تحقق من الرصيد قبل إرسال الطلب للإدمن والطابور**
-        balance = get_balance(user_id)
-        if balance < price_syp:
+        # حجز المبلغ فور إرسال الطلب للطابور (الخصم الذري يرفض إن لم يكفِ الرصيد)
+        try:
+            balance = deduct_balance(user_id, price_syp)
+        except InsufficientBalanceError:
+            balance = get_balance(user_id)
             bot.send_message(
                 user_id,
                 f"❌ لا يوجد رصيد كافٍ لإرسال الطلب.\nرصيدك الحالي: {balance:,} ل.س\nالسعر المطلوب: {price_syp:,} ل.س\nيرجى شحن المحفظة أولاً."
             )
             return
-        # حجز المبلغ فور إرسال الطلب للطابور
-        deduct_balance(user_id, price_syp)
-        # تحديث الرصيد اللحظي بعد الحجز
-        balance = get_balance(user_id)
 
 
         pending_orders.add(user_id)
@@ -224,13 +196,13 @@ def setup_inline_handlers(bot, admin_ids):
             user_id=user_id,
             username=call.from_user.username,
             request_text=admin_msg,
-            payload={
-                "type": "order",
-                "product_id": product.product_id,
-                "player_id": player_id,
-                "price": price_syp,
-                "reserved": price_syp
-            }
+            payload=OrderPayload(
+                product_id=product.product_id,
+                product_name=product.name,
+                player_id=player_id,
+                price=price_syp,
+                reserved=price_syp,
+            ).to_dict()
         )  # ← هنا نغلق القوسين
 
         bot.send_message(
@@ -239,8 +211,8 @@ def setup_inline_handlers(bot, admin_ids):
         )
         process_queue(bot)   # ← هذا السطر مهم جداً!
 
+@registry.once
 def register(bot, history):
     # تسجيل الهاندلرات للرسائل (استدعاء دالة خاصة بذلك)
     register_message_handlers(bot, history)
-    # تسجيل الهاندلرات للكولباك
-    setup_inline_handlers(bot, admin_ids=[])
+    # هاندلرات الكولباك تُسجَّل من main.py عبر setup_inline_handlers(bot, ADMIN_IDS)
@@ -2,13 +2,16 @@ from telebot import types
 from config import ADMIN_MAIN_ID
 from services.recharge_service import apply_recharge
 from handlers import keyboards  # ✅ الكيبورد الموحد
+from handlers import router
+from handlers import registry
 from services.wallet_service import register_user_if_not_exist  # ✅ الاستيراد الجديد
 from types import SimpleNamespace  # 🔴 التصحيح هنا
 from services.queue_service import add_pending_request
 import logging
+from services.session_store import store, ADMIN_WAIT_TTL
 
-recharge_requests = {}
-recharge_pending = set()
+recharge_requests = store.flow("recharge", ttl=ADMIN_WAIT_TTL)
+recharge_pending = store.flow_set("recharge_pending", ttl=ADMIN_WAIT_TTL)
 
 SYRIATEL_NUMBERS = ["0011111", "0022222", "0033333", "0044444"]
 MTN_NUMBERS = ["0005555", "0006666", "0006666", "0007777"]
@@ -64,15 +67,14 @@ def start_recharge_menu(bot, message, history=None):
         reply_markup=keyboards.recharge_menu()
     )
 
+@registry.once
 def register(bot, history):
 
-    @bot.message_handler(func=lambda msg: msg.text == "💳 شحن محفظتي")
+    @router.on_text(bot, "💳 شحن محفظتي")
     def open_recharge(msg):
         start_recharge_menu(bot, msg, history)
 
-    @bot.message_handler(func=lambda msg: msg.text in [
-        "📲 سيرياتيل كاش", "📲 أم تي إن كاش", "📲 شام كاش", "💳 Payeer"
-    ])
+    @router.on_text(bot, "📲 سيرياتيل كاش", "📲 أم تي إن كاش", "📲 شام كاش", "💳 Payeer")
     def request_invoice(msg):
         user_id = msg.from_user.id
         if user_id in recharge_pending:
@@ -96,7 +98,7 @@ def register(bot, history):
             reply_markup=markup
         )
 
-    @bot.callback_query_handler(func=lambda call: call.data in ["confirm_recharge_method", "cancel_recharge_method"])
+    @router.on_callback(bot, "confirm_recharge_method", "cancel_recharge_method")
     def handle_method_confirm_cancel(call):
         user_id = call.from_user.id
         if call.data == "confirm_recharge_method":
@@ -180,9 +182,7 @@ def register(bot, history):
             reply_markup=markup
         )
 
-    @bot.callback_query_handler(
-        func=lambda call: call.data in ["user_confirm_recharge", "user_edit_recharge", "user_cancel_recharge"]
-    )
+    @router.on_callback(bot, "user_confirm_recharge", "user_edit_recharge", "user_cancel_recharge")
     def handle_user_recharge_action(call):
         user_id = call.from_user.id
 
@@ -0,0 +1,112 @@
+# handlers/registry.py
+"""
+سجل تسجيل المعالجات: كل دالة register في الوحدات تُنفَّذ مرة واحدة لكل bot.
+- أي استدعاء مكرر (من main.py أو من داخل معالج وقت التشغيل) يُرفض مع تحذير
+  بدل إضافة نسخة جديدة من كل المعالجات إلى قوائم telebot والموجّه.
+- handler_counts(bot) يعيد عدد المعالجات التي أضافها كل تسجيل، و log_counts
+  يطبعها عند الإقلاع.
+- freeze(bot) بعد آخر تسجيل في main.py: قوائم telebot تصبح tuple، وأي
+  bot.*_handler / add_*_handler أو مسار router لاحق يُرفض (RuntimeError + سجل خطأ).
+
+الاستخدام:
+    from handlers import registry
+
+    @registry.once
+    def register(bot, history): ...
+"""
+import functools
+import logging
+import threading
+
+_ATTR = "_registrations"
+_FROZEN_ATTR = "_handlers_frozen"
+_lock = threading.RLock()
+
+# قوائم telebot التي تضيف إليها decorators المعالجات
+HANDLER_LISTS = (
+    "message_handlers", "edited_message_handlers", "callback_query_handlers",
+    "inline_handlers", "chosen_inline_handlers", "my_chat_member_handlers",
+    "chat_member_handlers", "chat_join_request_handlers",
+)
+
+
+def _handler_total(bot) -> int:
+    total = sum(len(getattr(bot, name, ())) for name in HANDLER_LISTS)
+    router = getattr(bot, "_router", None)
+    if router is not None:
+        total += router.route_count()
+    return total
+
+
+def register(bot, name, func, *args, **kwargs) -> bool:
+    """ينفذ func(bot, ...) مرة واحدة باسم name؛ يعيد False إن كان مسجلًا مسبقًا."""
+    with _lock:
+        registrations = bot.__dict__.setdefault(_ATTR, {})
+        if name in registrations:
+            logging.warning(f"[REGISTRY] {name} مسجل مسبقًا؛ تم رفض التسجيل المكرر")
+            return False
+        if is_frozen(bot):
+            logging.error(f"[REGISTRY] {name} بعد تجميد المعالجات؛ التسجيل يتم في main.py قبل freeze")
+            raise RuntimeError(f"handlers are frozen: {name}")
+        registrations[name] = None  # يمنع التسجيل المتداخل لنفس الاسم
+        before = _handler_total(bot)
+        try:
+            func(bot, *args, **kwargs)
+        except Exception:
+            registrations.pop(name, None)
+            raise
+        registrations[name] = _handler_total(bot) - before
+    return True
+
+
+def once(func):
+    """يجعل دالة register(bot, ...) غير قابلة للتكرار لنفس bot."""
+    name = f"{func.__module__}.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(bot, *args, **kwargs):
+        register(bot, name, func, *args, **kwargs)
+
+    return wrapper
+
+
+def _refuse(name):
+    def refuse(*args, **kwargs):
+        logging.error(f"[REGISTRY] {name} بعد تجميد المعالجات؛ التسجيل يتم في main.py قبل freeze")
+        raise RuntimeError(f"handlers are frozen: {name}")
+    return refuse
+
+
+def freeze(bot):
+    """يمنع أي تسجيل معالج بعد اكتمال التسجيل (decorators و add_* و register_* والموجّه)."""
+    with _lock:
+        if is_frozen(bot):
+            return
+        bot.__dict__[_FROZEN_ATTR] = True
+        # decorators و register_*_handler كلها تمر بـ add_*_handler
+        for name in dir(type(bot)):
+            if name.startswith("add_") and name.endswith("_handler"):
+                setattr(bot, name, _refuse(name))
+        for name in HANDLER_LISTS:
+            handlers = getattr(bot, name, None)
+            if isinstance(handlers, list):
+                setattr(bot, name, tuple(handlers))
+        router = getattr(bot, "_router", None)
+        if router is not None:
+            router.freeze()
+
+
+def is_frozen(bot) -> bool:
+    return bool(bot.__dict__.get(_FROZEN_ATTR))
+
+
+def handler_counts(bot) -> dict:
+    """عدد المعالجات التي أضافها كل تسجيل (المتداخل يُحسب ضمن الأب أيضًا)."""
+    return dict(bot.__dict__.get(_ATTR, {}))
+
+
+def log_counts(bot):
+    counts = handler_counts(bot)
+    for name, count in counts.items():
+        logging.info(f"[REGISTRY] {name}: {count} معالج")
+    logging.info(f"[REGISTRY] الإجمالي: {_handler_total(bot)} معالج/مسار في {len(counts)} وحدة")
@@ -0,0 +1,196 @@
+# handlers/router.py
+"""
+موجّه التحديثات (Router):
+- نصوص الأزرار الثابتة في جدول hash (dict) ← بحث O(1).
+- بادئات callback_data (وبادئات الأوامر مثل /done_) في شجرة بادئات (trie)
+  ← البحث يتناسب مع طول النص وليس مع عدد المعالجات.
+يُسجَّل الموجّه كمعالج واحد في مقدمة قوائم telebot؛ وإذا لم يطابق أي مسار
+تكمل telebot فحص المعالجات العامة (lambda على حالة المستخدم) كالمعتاد.
+بعد registry.freeze(bot) يرفض الموجّه أي مسار جديد.
+
+الاستخدام:
+    from handlers import router
+
+    @router.on_text(bot, "💰 محفظتي")
+    def handle_wallet(msg): ...
+
+    @router.on_callback_prefix(bot, "admin_queue_")
+    def handle_queue_action(call): ...
+"""
+import logging
+import threading
+
+_ROUTE_ATTR = "_routed_handler"
+
+
+class _PrefixTrie:
+    __slots__ = ("_root", "size")
+
+    def __init__(self):
+        self._root = {}
+        self.size = 0
+
+    def add(self, prefix, route):
+        node = self._root
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node.setdefault(None, []).append(route)
+        self.size += 1
+
+    def match(self, text):
+        """يعيد المسارات المطابقة، الأطول بادئةً أولاً."""
+        found = []
+        node = self._root
+        if None in node:
+            found.append(node[None])
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            if None in node:
+                found.append(node[None])
+        for routes in reversed(found):
+            yield from routes
+
+
+def _first(routes, update):
+    for handler, func in routes:
+        if func is None or func(update):
+            return handler
+    return None
+
+
+class Router:
+    def __init__(self):
+        self._texts = {}
+        self._text_prefixes = _PrefixTrie()
+        self._callbacks = {}
+        self._callback_prefixes = _PrefixTrie()
+        self._lock = threading.Lock()
+        self._frozen = False
+
+    # ---------- التسجيل ----------
+    def freeze(self):
+        with self._lock:
+            self._frozen = True
+
+    def _check_open(self, handler):
+        """يُستدعى والقفل ممسوك."""
+        if self._frozen:
+            name = getattr(handler, "__qualname__", handler)
+            logging.error(f"[ROUTER] مسار {name} بعد تجميد المعالجات؛ التسجيل يتم في main.py قبل freeze")
+            raise RuntimeError(f"router is frozen: {name}")
+
+    def add_text(self, texts, handler, func=None):
+        with self._lock:
+            self._check_open(handler)
+            for text in texts:
+                self._texts.setdefault(text, []).append((handler, func))
+
+    def add_text_prefix(self, prefix, handler, func=None):
+        with self._lock:
+            self._check_open(handler)
+            self._text_prefixes.add(prefix, (handler, func))
+
+    def add_callback(self, values, handler, func=None):
+        with self._lock:
+            self._check_open(handler)
+            for value in values:
+                self._callbacks.setdefault(value, []).append((handler, func))
+
+    def add_callback_prefix(self, prefix, handler, func=None):
+        with self._lock:
+            self._check_open(handler)
+            self._callback_prefixes.add(prefix, (handler, func))
+
+    def route_count(self):
+        return (
+            sum(len(r) for r in self._texts.values()) + self._text_prefixes.size
+            + sum(len(r) for r in self._callbacks.values()) + self._callback_prefixes.size
+        )
+
+    # ---------- البحث ----------
+    def resolve_message(self, msg):
+        text = msg.text
+        if not text:
+            return None
+        routes = self._texts.get(text)
+        handler = _first(routes, msg) if routes else None
+        if handler is None:
+            handler = _first(self._text_prefixes.match(text), msg)
+        return handler
+
+    def resolve_callback(self, call):
+        data = call.data
+        if not data:
+            return None
+        routes = self._callbacks.get(data)
+        handler = _first(routes, call) if routes else None
+        if handler is None:
+            handler = _first(self._callback_prefixes.match(data), call)
+        return handler
+
+    # ---------- الربط مع telebot ----------
+    def install(self, bot):
+        def _match(resolve):
+            def test(update):
+                handler = resolve(update)
+                if handler is None:
+                    return False
+                setattr(update, _ROUTE_ATTR, handler)
+                return True
+            return test
+
+        def dispatch(update):
+            return getattr(update, _ROUTE_ATTR)(update)
+
+        bot.message_handlers.insert(0, bot._build_handler_dict(
+            dispatch, content_types=["text"], func=_match(self.resolve_message)
+        ))
+        bot.callback_query_handlers.insert(0, bot._build_handler_dict(
+            dispatch, func=_match(self.resolve_callback)
+        ))
+
+
+def routed_handler(update):
+    """المعالج الذي اختاره الموجّه لهذا التحديث (None إن لم يطابق مسارًا)."""
+    return getattr(update, _ROUTE_ATTR, None)
+
+
+def get_router(bot):
+    """يعيد موجّه البوت (ويثبّته عند أول استخدام)."""
+    router = getattr(bot, "_router", None)
+    if router is None:
+        router = Router()
+        router.install(bot)
+        bot._router = router
+    return router
+
+
+# ---------- مزخرفات (decorators) بنفس روح bot.message_handler ----------
+def on_text(bot, *texts, func=None):
+    def decorator(handler):
+        get_router(bot).add_text(texts, handler, func)
+        return handler
+    return decorator
+
+
+def on_text_prefix(bot, prefix, func=None):
+    def decorator(handler):
+        get_router(bot).add_text_prefix(prefix, handler, func)
+        return handler
+    return decorator
+
+
+def on_callback(bot, *values, func=None):
+    def decorator(handler):
+        get_router(bot).add_callback(values, handler, func)
+        return handler
+    return decorator
+
+
+def on_callback_prefix(bot, prefix, func=None):
+    def decorator(handler):
+        get_router(bot).add_callback_prefix(prefix, handler, func)
+        return handler
+    return decorator
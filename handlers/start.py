@@ -1,9 +1,14 @@
 import logging
+import threading
 import time
+from collections import OrderedDict
 from telebot import types
 from handlers import keyboards
-from config import BOT_NAME, FORCE_SUB_CHANNEL_USERNAME
+from handlers import router
+from handlers import registry
+from config import BOT_NAME, FORCE_SUB_CHANNEL_ID, FORCE_SUB_CHANNEL_USERNAME
 from services.wallet_service import register_user_if_not_exist
+from services.session_store import store
 
 START_BTN_TEXT = "✨ ستارت"
 START_BTN_TEXT_SUB = "✅ تم الاشتراك"
@@ -12,10 +17,19 @@ SUB_BTN_TEXT = "🔔 اشترك الآن في القناة"
 CB_START = "cb_start_main"
 CB_CHECK_SUB = "cb_check_sub"
 
-_sub_status_cache = {}
-_sub_status_ttl = 60
-_user_start_limit = {}
+# كاش الاشتراك: LRU محدود يُحدَّث من تحديثات chat_member للقناة،
+# و get_chat_member عند غياب المستخدم أو انتهاء صلاحية الحالة.
+# لكل حالة مدة صلاحية: تيليجرام لا يضمن وصول كل chat_member (البوت ليس مشرفًا،
+# توقف، تحديثات فائتة)، فحتى الحالة المدفوعة تُعاد فحصها بعد مدة أطول.
+_sub_status_cache = OrderedDict()   # user_id -> (status, last_check)
+_sub_cache_lock = threading.Lock()
+_sub_cache_size = 50_000
+# مدة واحدة للحالة المسحوبة (get_chat_member) والمدفوعة (chat_member)؛
+# تحديث chat_member يستبدل المدخل فورًا فلا حاجة لسحب متكرر
+_sub_status_ttl = 30 * 60
+_MEMBER_STATUSES = ("member", "creator", "administrator")
 _rate_limit_seconds = 5
+_user_start_limit = store.flow("start_rate_limit", ttl=_rate_limit_seconds)
 
 def _reset_user_flows(user_id: int):
     try:
@@ -58,25 +72,53 @@ def _welcome_inline_kb():
     kb.add(types.InlineKeyboardButton(START_BTN_TEXT, callback_data=CB_START))
     return kb
 
-def is_user_subscribed(bot, user_id):
+def _cache_sub_status(user_id, status, now):
+    with _sub_cache_lock:
+        _sub_status_cache[user_id] = (status, now)
+        _sub_status_cache.move_to_end(user_id)
+        while len(_sub_status_cache) > _sub_cache_size:
+            _sub_status_cache.popitem(last=False)
+
+def _is_member(member) -> bool:
+    if member.status == "restricted":
+        return bool(getattr(member, "is_member", False))
+    return member.status in _MEMBER_STATUSES
+
+def update_subscription(chat_member_updated):
+    """تحديث الكاش من تحديث chat_member لقناة الاشتراك."""
+    if chat_member_updated.chat.id != FORCE_SUB_CHANNEL_ID:
+        return
+    member = chat_member_updated.new_chat_member
+    _cache_sub_status(member.user.id, _is_member(member), time.time())
+
+def is_user_subscribed(bot, user_id, recheck=False):
+    """recheck=True: حالة "غير مشترك" المخزنة يُعاد فحصها (المستخدم يقول إنه اشترك للتو)."""
     now = time.time()
-    cached = _sub_status_cache.get(user_id)
+    with _sub_cache_lock:
+        cached = _sub_status_cache.get(user_id)
+        if cached:
+            _sub_status_cache.move_to_end(user_id)
     if cached:
         status, last_check = cached
-        if now - last_check < _sub_status_ttl:
+        if now - last_check < _sub_status_ttl and (status or not recheck):
             return status
     try:
         result = bot.get_chat_member(FORCE_SUB_CHANNEL_USERNAME, user_id)
-        status = result.status in ["member", "creator", "administrator"]
-        _sub_status_cache[user_id] = (status, now)
+        status = _is_member(result)
+        _cache_sub_status(user_id, status, now)
         return status
     except Exception as e:
         logging.error(f"[start.py] Error get_chat_member: {e}", exc_info=True)
-        _sub_status_cache[user_id] = (False, now)
         return False
 
+@registry.once
 def register(bot, user_history):
 
+    # ---- تحديثات عضوية قناة الاشتراك (تتطلب أن يكون البوت مشرفًا فيها) ----
+    @bot.chat_member_handler(func=lambda upd: upd.chat.id == FORCE_SUB_CHANNEL_ID)
+    def on_channel_member(update):
+        update_subscription(update)
+
     @bot.message_handler(commands=['start'])
     def send_welcome(message):
         user_id = message.from_user.id
@@ -119,13 +161,13 @@ def register(bot, user_history):
         user_history[user_id] = []
 
     # ---- Callback: إعادة فحص الاشتراك ----
-    @bot.callback_query_handler(func=lambda c: c.data == CB_CHECK_SUB)
+    @router.on_callback(bot, CB_CHECK_SUB)
     def cb_check_subscription(call):
         user_id = call.from_user.id
         _reset_user_flows(user_id)
 
         if FORCE_SUB_CHANNEL_USERNAME:
-            if not is_user_subscribed(bot, user_id):
+            if not is_user_subscribed(bot, user_id, recheck=True):
                 try:
                     bot.answer_callback_query(call.id, "لم يتم العثور على اشتراك. اشترك ثم أعد المحاولة.", show_alert=True)
                 except Exception as e:
@@ -146,7 +188,7 @@ def register(bot, user_history):
         user_history[user_id] = []
 
     # ---- Callback: ستارت (القائمة الرئيسية) ----
-    @bot.callback_query_handler(func=lambda c: c.data == CB_START)
+    @router.on_callback(bot, CB_START)
     def cb_start_main(call):
         user_id = call.from_user.id
         name = getattr(call.from_user, "full_name", None) or call.from_user.first_name
@@ -175,7 +217,7 @@ def register(bot, user_history):
             reply_markup=keyboards.main_menu()
         )
 
-    @bot.message_handler(func=lambda msg: msg.text == "🔄 ابدأ من جديد")
+    @router.on_text(bot, "🔄 ابدأ من جديد")
     def restart_user(msg):
         send_welcome(msg)
         
@@ -188,7 +230,7 @@ def register(bot, user_history):
             reply_markup=keyboards.main_menu()
         )
 
-    @bot.message_handler(func=lambda msg: msg.text == "⬅️ رجوع")
+    @router.on_text(bot, "⬅️ رجوع")
     def back_to_main_menu(message):
         bot.send_message(
             message.chat.id,
@@ -1,14 +1,18 @@
 from telebot import types
 from config import ADMIN_MAIN_ID
 from handlers import keyboards
+from handlers import router
+from handlers import registry
 from services.queue_service import add_pending_request
 import logging
+from services.session_store import store, ADMIN_WAIT_TTL
 
 # تخزين الطلبات التي بانتظار رد الأدمن
-pending_support = {}
+pending_support = store.flow("support", ttl=ADMIN_WAIT_TTL)
 
+@registry.once
 def register(bot, history):
-    @bot.message_handler(func=lambda msg: msg.text == "🛠️ الدعم الفني")
+    @router.on_text(bot, "🛠️ الدعم الفني")
     def request_support(msg):
         user_id = msg.from_user.id
         if user_id in pending_support:
@@ -32,7 +36,7 @@ def register(bot, history):
         history.setdefault(user_id, []).append("support_menu")
         bot.send_message(msg.chat.id, text, reply_markup=keyboard)
 
-    @bot.callback_query_handler(func=lambda call: call.data in ["support_confirm", "support_cancel"])
+    @router.on_callback(bot, "support_confirm", "support_cancel")
     def handle_support_decision(call):
         user_id = call.from_user.id
         if call.data == "support_cancel":
@@ -72,7 +76,7 @@ def register(bot, history):
         )
         pending_support[user_id] = "waiting_admin"
 
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("reply_"))
+    @router.on_callback_prefix(bot, "reply_")
     def prompt_admin_reply(call):
         target_id = int(call.data.split("_")[1])
         pending_support[call.from_user.id] = f"replying_{target_id}"
@@ -1,13 +1,16 @@
 # handlers/university_fees.py
 from telebot import types
-from services.wallet_service import add_purchase, get_balance, has_sufficient_balance,deduct_balance
+from services.wallet_service import add_purchase, get_balance, has_sufficient_balance,deduct_balance, InsufficientBalanceError
 from config import ADMIN_MAIN_ID
 from services.wallet_service import register_user_if_not_exist
 from handlers import keyboards
+from handlers import router
+from handlers import registry
 from services.queue_service import add_pending_request
 import logging
+from services.session_store import store, ADMIN_WAIT_TTL
 
-user_uni_state = {}
+user_uni_state = store.flow("university_fees", ttl=ADMIN_WAIT_TTL)
 
 COMMISSION_PER_50000 = 3500
 
@@ -33,9 +36,10 @@ def university_fee_menu():
     )
     return kb
 
+@registry.once
 def register_university_fees(bot, history):
 
-    @bot.message_handler(func=lambda msg: msg.text == "🎓 دفع رسوم جامعية")
+    @router.on_text(bot, "🎓 دفع رسوم جامعية")
     def open_uni_menu(msg):
         user_id = msg.from_user.id
         register_user_if_not_exist(user_id)
@@ -103,25 +107,28 @@ def register_university_fees(bot, history):
         )
         bot.send_message(msg.chat.id, text, reply_markup=kb)
 
-    @bot.callback_query_handler(func=lambda call: call.data == "edit_university_fees")
+    @router.on_callback(bot, "edit_university_fees")
     def edit_university_fees(call):
         user_id = call.from_user.id
         user_uni_state[user_id]["step"] = "amount"
         bot.send_message(call.message.chat.id, "💰 أعد إدخال المبلغ المراد دفعه:")
 
-    @bot.callback_query_handler(func=lambda call: call.data == "uni_cancel")
+    @router.on_callback(bot, "uni_cancel")
     def cancel_uni(call):
         user_uni_state.pop(call.from_user.id, None)
         bot.edit_message_text("🚫 تم إلغاء العملية.", call.message.chat.id, call.message.message_id)
 
-    @bot.callback_query_handler(func=lambda call: call.data == "uni_confirm")
+    @router.on_callback(bot, "uni_confirm")
     def confirm_uni_order(call):
         user_id = call.from_user.id
         state = user_uni_state.get(user_id, {})
         total = state.get("total")
 
-        balance = get_balance(user_id)
-        if balance is None or balance < total:
+        # خصم الرصيد مباشرة من المستخدم (الخصم الذري يرفض إن لم يكفِ الرصيد)
+        try:
+            deduct_balance(user_id, total)
+        except InsufficientBalanceError:
+            balance = get_balance(user_id)
             shortage = total - (balance or 0)
             kb = make_inline_buttons(
                 ("💳 شحن المحفظة", "recharge_wallet_uni"),
@@ -138,9 +145,6 @@ def register_university_fees(bot, history):
             )
             return
 
-        # خصم الرصيد مباشرة من المستخدم
-        deduct_balance(user_id, total)
-
         # إرسال الطلب إلى الأدمن مع أزرار قبول/رفض
         kb_admin = make_inline_buttons(
             ("✅ تأكيد دفع الرسوم", f"admin_uni_accept_{user_id}_{total}"),
@@ -171,11 +175,11 @@ def register_university_fees(bot, history):
         user_uni_state[user_id]["admin_chat_id"] = ADMIN_MAIN_ID
         user_uni_state[user_id]["step"] = "waiting_admin"
 
-    @bot.callback_query_handler(func=lambda call: call.data == "recharge_wallet_uni")
+    @router.on_callback(bot, "recharge_wallet_uni")
     def show_recharge_methods_uni(call):
         bot.send_message(call.message.chat.id, "💳 اختر طريقة شحن المحفظة:", reply_markup=keyboards.recharge_menu())
 
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("admin_uni_accept_"))
+    @router.on_callback_prefix(bot, "admin_uni_accept_")
     def admin_accept_uni_fees(call):
         try:
             parts = call.data.split("_")
@@ -204,7 +208,7 @@ def register_university_fees(bot, history):
         except Exception as e:
             bot.send_message(call.message.chat.id, f"❌ حدث خطأ: {e}")
 
-    @bot.callback_query_handler(func=lambda call: call.data.startswith("admin_uni_reject_"))
+    @router.on_callback_prefix(bot, "admin_uni_reject_")
     def admin_reject_uni_fees(call):
         try:
             user_id = int(call.data.split("_")[-1])
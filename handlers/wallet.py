@@ -1,6 +1,8 @@
 from telebot import types
 from config import BOT_NAME
 from handlers import keyboards
+from handlers import router
+from handlers import registry
 from services.wallet_service import (
     get_balance, add_balance, deduct_balance, get_purchases, get_deposit_transfers,
     has_sufficient_balance, transfer_balance, get_table,
@@ -10,8 +12,9 @@ from services.wallet_service import (
 )
 from services.queue_service import add_pending_request
 import logging
+from services.session_store import store, FLOW_TTL
 
-transfer_steps = {}
+transfer_steps = store.flow("wallet_transfer", ttl=FLOW_TTL)
 
 # ✅ عرض المحفظة
 def show_wallet(bot, message, history=None):
@@ -39,7 +42,7 @@ def show_purchases(bot, message, history=None):
     user_id = message.from_user.id
     name = message.from_user.full_name
     register_user_if_not_exist(user_id, name)
-    purchases = get_purchases(user_id)  # الآن يحذف القديم تلقائيًا
+    purchases = get_purchases(user_id)  # المنتهي يُستبعد ويُحذف في الخلفية
 
     if history is not None:
         history.setdefault(user_id, []).append("wallet")
@@ -83,21 +86,22 @@ def show_transfers(bot, message, history=None):
         )
 
 # ✅ تسجيل الأوامر
+@registry.once
 def register(bot, user_state):
 
-    @bot.message_handler(func=lambda msg: msg.text == "💰 محفظتي")
+    @router.on_text(bot, "💰 محفظتي")
     def handle_wallet(msg):
         show_wallet(bot, msg, user_state)
 
-    @bot.message_handler(func=lambda msg: msg.text == "🛍️ مشترياتي")
+    @router.on_text(bot, "🛍️ مشترياتي")
     def handle_purchases(msg):
         show_purchases(bot, msg, user_state)
 
-    @bot.message_handler(func=lambda msg: msg.text == "📑 سجل التحويلات")
+    @router.on_text(bot, "📑 سجل التحويلات")
     def handle_transfers(msg):
         show_transfers(bot, msg, user_state)
 
-    @bot.message_handler(func=lambda msg: msg.text == "🔁 تحويل من محفظتك إلى محفظة عميل آخر")
+    @router.on_text(bot, "🔁 تحويل من محفظتك إلى محفظة عميل آخر")
     def handle_transfer_notice(msg):
         user_id = msg.from_user.id
         name = msg.from_user.full_name
@@ -114,7 +118,7 @@ def register(bot, user_state):
         kb.add("✅ موافق", "⬅️ رجوع", "🔄 ابدأ من جديد")
         bot.send_message(msg.chat.id, warning, reply_markup=kb)
 
-    @bot.message_handler(func=lambda msg: msg.text == "✅ موافق")
+    @router.on_text(bot, "✅ موافق")
     def ask_for_target_id(msg):
         bot.send_message(
             msg.chat.id,
@@ -188,7 +192,7 @@ def register(bot, user_state):
         )
 
     # زر تعديل المبلغ
-    @bot.message_handler(func=lambda msg: msg.text == "✏️ تعديل المبلغ")
+    @router.on_text(bot, "✏️ تعديل المبلغ")
     def edit_amount(msg):
         user_id = msg.from_user.id
         if transfer_steps.get(user_id, {}).get("step") == "awaiting_amount":
@@ -206,7 +210,7 @@ def register(bot, user_state):
             transfer_steps.pop(user_id, None)
 
     # زر إلغاء العملية
-    @bot.message_handler(func=lambda msg: msg.text == "❌ إلغاء")
+    @router.on_text(bot, "❌ إلغاء")
     def cancel_transfer(msg):
         user_id = msg.from_user.id
         bot.send_message(
@@ -216,7 +220,7 @@ def register(bot, user_state):
         )
         transfer_steps.pop(user_id, None)
 
-    @bot.message_handler(func=lambda msg: msg.text == "✅ تأكيد التحويل")
+    @router.on_text(bot, "✅ تأكيد التحويل")
     def confirm_transfer(msg):
         user_id = msg.from_user.id
         step = transfer_steps.get(user_id)
@@ -3,9 +3,12 @@ from config import ADMIN_MAIN_ID
 from services.wallet_service import register_user_if_not_exist
 from services.wallet_service import add_purchase, get_balance, has_sufficient_balance, deduct_balance
 from services.queue_service import add_pending_request
+from handlers import router
+from handlers import registry
 import logging
+from services.session_store import store, ADMIN_WAIT_TTL
 
-user_wholesale_state = {}
+user_wholesale_state = store.flow("wholesale", ttl=ADMIN_WAIT_TTL)
 
 WHOLESALE_DESCRIPTION = """
 🛒 هذه الخدمة مخصصة لأصحاب المحلات والمراكز التجارية.
@@ -21,9 +24,10 @@ WHOLESALE_DESCRIPTION = """
 ✍️ يرجى الآن كتابة تفاصيل المنتجات التي ترغب بطلبها (نوع وكميات...)
 """
 
+@registry.once
 def register(bot, user_state):
 
-    @bot.message_handler(func=lambda msg: msg.text == "📦 طلب جملة للتجار")
+    @router.on_text(bot, "📦 طلب جملة للتجار")
     def start_wholesale(msg):
         user_id = msg.from_user.id
         user_wholesale_state[user_id] = {"step": "products"}
@@ -1,38 +1,11 @@
 import os
 import sys
 import logging
-import telebot
-from config import API_TOKEN
-
 import threading
-import http.server
-import socketserver
-
-bot = telebot.TeleBot(API_TOKEN, parse_mode="HTML")
-user_state = {}
-
-# ----------- الاستيرادات الصحيحة: -----------
-from handlers import admin, bill_and_units, products, wallet
-from services import wallet_service, queue_service
-
-# ----------- تسجيل الهاندلرز (حسب الحاجة): -----------
-admin.register(bot, user_state)
-bill_and_units.register(bot)         # فقط (bot) إذا كانت الدالة لا تحتاج user_state
-products.register(bot, user_state)
-wallet.register(bot, user_state)
-
-
-PORT = 8081
+from services import boot_profile  # أول استيراد: بداية قياس زمن الإقلاع
 
-def run_dummy_server():
-    handler = http.server.SimpleHTTPRequestHandler
-    with socketserver.TCPServer(("", PORT), handler) as httpd:
-        print(f"🔌 Dummy server listening on port {PORT}")
-        httpd.serve_forever()
-
-# شغل الخادم في ثريد منفصل حتى لا يوقف البوت الأساسي
-threading.Thread(target=run_dummy_server, daemon=True).start()
-# ===============================================================
+import telebot
+from config import API_TOKEN, HANDLER_LANES, BOT_MODE, PORT, ALLOWED_UPDATES
 
 # ---------------------------------------------------------
 # تسجيل الأخطاء لظهورها في سجلّ Render
@@ -50,97 +23,118 @@ def _unhandled_exception_hook(exc_type, exc_value, exc_tb):
 sys.excepthook = _unhandled_exception_hook
 
 # ---------------------------------------------------------
-# ✅ فحص صحة API_TOKEN وجلب هوية البوت قبل التشغيل
+# 1) كائن البوت الوحيد (تستخدمه المعالجات والطابور والمهام الدورية)
 # ---------------------------------------------------------
-def check_api_token(token):
-    try:
-        # تمّ التصحيح: استخدم المتغير token بدلًا من API_TOKEN الثابت
-        test_bot = telebot.TeleBot(token)
-        me = test_bot.get_me()
-        print(f"✅ التوكن سليم. هوية البوت: @{me.username} (ID: {me.id})")
-        return True
-    except Exception as e:
-        logging.critical(f"❌ التوكن غير صالح أو لا يمكن الاتصال بـ Telegram API: {e}")
-        sys.exit(1)
-
-if not check_api_token(API_TOKEN):
-    sys.exit(1)
+from services.http_server import start_http_server, set_webhook
+from services.executor_service import ShardedWorkerPool
+from services import send_scheduler
+
+with boot_profile.phase("bot"):
+    bot = telebot.TeleBot(API_TOKEN)
+    # كل إرسال/تعديل عبر bot يمر بمجدول الإرسال (حدود تيليجرام + إعادة 429)
+    send_scheduler.install(bot)
+    # تنفيذ المعالجات على مسارات حسب المستخدم بدل مجمّع الخيوط الافتراضي
+    # إغلاق المجمّع الافتراضي ينتظر خيوطه (~0.5 ث) فيُترك لخيط خلفي
+    _default_pool, bot.worker_pool = bot.worker_pool, ShardedWorkerPool(bot, HANDLER_LANES)
+    threading.Thread(target=_default_pool.close, daemon=True).start()
+    # في وضع polling يبقى الخادم للـ keep-alive فقط ويعمل في ثريد منفصل؛
+    # في وضع webhook يُشغَّل لاحقًا في الخيط الرئيسي لاستقبال التحديثات.
+    if BOT_MODE != "webhook":
+        start_http_server(PORT)
 
 # ---------------------------------------------------------
-# 1) إنشاء كائن البوت ثم حذف أي Webhook سابق لتجنّب خطأ 409
+# ✅ فحص التوكن + حذف Webhook السابق (تجنّب خطأ 409) + عميل قاعدة البيانات — بالتوازي
 # ---------------------------------------------------------
-bot = telebot.TeleBot(API_TOKEN)
-try:
-    bot.delete_webhook(drop_pending_updates=True)
-except Exception as e:
-    logging.warning(f"⚠️ لم يتم حذف Webhook بنجاح: {e}")
+from database.db import get_client
+
+def check_api_token(me):
+    if isinstance(me, Exception):
+        logging.critical(f"❌ التوكن غير صالح أو لا يمكن الاتصال بـ Telegram API: {me}")
+        sys.exit(1)
+    print(f"✅ التوكن سليم. هوية البوت: @{me.username} (ID: {me.id})")
+
+_boot_checks = {"get_me": bot.get_me, "db": get_client}
+if BOT_MODE != "webhook":
+    # في وضع webhook يُستبدل لاحقًا بـ set_webhook؛ حذفه هنا يُسقط التحديثات المعلقة
+    _boot_checks["delete_webhook"] = lambda: bot.delete_webhook(drop_pending_updates=True)
+_boot_results = boot_profile.run_parallel("network", **_boot_checks)
+check_api_token(_boot_results["get_me"])
+if isinstance(_boot_results.get("delete_webhook"), Exception):
+    logging.warning(f"⚠️ لم يتم حذف Webhook بنجاح: {_boot_results['delete_webhook']}")
+if isinstance(_boot_results["db"], Exception):
+    logging.error(f"⚠️ تعذر تهيئة عميل قاعدة البيانات، ستُعاد المحاولة عند أول استخدام: {_boot_results['db']}")
 
 # ---------------------------------------------------------
 # 2) استيراد جميع الهاندلرز بعد تهيئة البوت
+#    استيراد فوري مقصود: كل وحدة يجب أن تُسجَّل قبل أول تحديث، والمرحلة كلها
+#    ~65-85ms (أثقل وحدة bill_and_units ~10ms؛ supabase/postgrest حُمّلا في مرحلة network)
 # ---------------------------------------------------------
-from handlers import (
-    start,
-    wallet,
-    support,
-    admin,
-    recharge,
-    cash_transfer,
-    companies_transfer,
-    products,
-    media_services,
-    wholesale,
-    university_fees,
-    internet_providers,
-    bill_and_units,
-)
-from handlers.keyboards import (
-    main_menu,
-    products_menu,
-    game_categories,
-    recharge_menu, 
-    companies_transfer_menu,
-    cash_transfer_menu,
-    syrian_balance_menu,
-    wallet_menu,
-    support_menu,
-    links_menu,
-    media_services_menu,
-    transfers_menu,      # أضفناها هنا للاستخدام
-)
+with boot_profile.phase("imports"):
+    from handlers import (
+        start,
+        wallet,
+        support,
+        admin,
+        recharge,
+        cash_transfer,
+        companies_transfer,
+        products,
+        media_services,
+        wholesale,
+        university_fees,
+        internet_providers,
+        bill_and_units,
+        router,
+        registry,
+    )
+    from handlers.keyboards import (
+        main_menu,
+        products_menu,
+        game_categories,
+        recharge_menu, 
+        companies_transfer_menu,
+        cash_transfer_menu,
+        syrian_balance_menu,
+        wallet_menu,
+        support_menu,
+        links_menu,
+        media_services_menu,
+        transfers_menu,      # أضفناها هنا للاستخدام
+    )
 
 # ---------------------------------------------------------
 # 3) حالة المستخدم
 # ---------------------------------------------------------
-user_state: dict[int, str] = {}
-history: dict[int, list] = {}
+from services.session_store import menu_state as user_state, history
 
 # ---------------------------------------------------------
 # 4) تسجيل جميع الهاندلرز (بدون تغيير أي شيء في القائمة الرئيسية)
 # ---------------------------------------------------------
-start.register(bot, user_state)
-wallet.register(bot, history)
-support.register(bot, user_state)
-admin.register(bot, user_state)
-recharge.register(bot, user_state)
-cash_transfer.register(bot, history)
-companies_transfer.register_companies_transfer(bot, history)
-bill_and_units.register(bot)
-products.register(bot, user_state)
-media_services.register(bot, user_state)
-wholesale.register(bot, user_state)
-university_fees.register_university_fees(bot, history)
-internet_providers.register(bot)
-
-# ---------------------------------------------------------
-# 4.1) ربط النظام الجديد لأوامر المنتجات (لا تحذف هذا السطر)
-# ---------------------------------------------------------
-ADMIN_IDS = [6935846121]
-products.setup_inline_handlers(bot, ADMIN_IDS)
+with boot_profile.phase("handlers"):
+    start.register(bot, user_state)
+    wallet.register(bot, history)
+    support.register(bot, user_state)
+    admin.register(bot, user_state)
+    recharge.register(bot, user_state)
+    cash_transfer.register(bot, history)
+    companies_transfer.register_companies_transfer(bot, history)
+    bill_and_units.register(bot)
+    products.register(bot, user_state)
+    media_services.register(bot, user_state)
+    wholesale.register(bot, user_state)
+    university_fees.register_university_fees(bot, history)
+    internet_providers.register(bot)
+
+    # ---------------------------------------------------------
+    # 4.1) ربط النظام الجديد لأوامر المنتجات (لا تحذف هذا السطر)
+    # ---------------------------------------------------------
+    ADMIN_IDS = [6935846121]
+    products.setup_inline_handlers(bot, ADMIN_IDS)
 
 # ---------------------------------------------------------
 # 5) زر الرجوع الذكي (ابقِه كما هو بدون تعديل)
 # ---------------------------------------------------------
-@bot.message_handler(func=lambda msg: msg.text == "⬅️ رجوع")
+@router.on_text(bot, "⬅️ رجوع")
 def handle_back(msg):
     user_id = msg.from_user.id
     state = user_state.get(user_id, "main_menu")
@@ -166,49 +160,48 @@ def handle_back(msg):
 # ---------------------------------------------------------
 # 6) ربط أزرار المنتجات بالخدمات الخاصة بها
 # ---------------------------------------------------------
-@bot.message_handler(func=lambda msg: msg.text == "تحويلات كاش و حوالات")
+@router.on_text(bot, "تحويلات كاش و حوالات")
 def handle_transfers(msg):
     bot.send_message(msg.chat.id, "اختر نوع التحويل:", reply_markup=transfers_menu())
     user_state[msg.from_user.id] = "transfers_menu"
 
-@bot.message_handler(func=lambda msg: msg.text == "💵 تحويل الى رصيد كاش")
+@router.on_text(bot, "💵 تحويل الى رصيد كاش")
 def handle_cash_transfer(msg):
     from handlers.cash_transfer import start_cash_transfer
     start_cash_transfer(bot, msg, history)
 
-@bot.message_handler(func=lambda msg: msg.text == "حوالة مالية عبر شركات")
-def handle_companies_transfer(msg):
-    from handlers.companies_transfer import register_companies_transfer
-    register_companies_transfer(bot, history)
+# "حوالة مالية عبر شركات" يعالجها companies_transfer.open_companies_menu مباشرة
+# (كان هنا معالج يعيد تسجيل كل هاندلرات الوحدة عند كل ضغطة).
 
-@bot.message_handler(func=lambda msg: msg.text == "💳 تحويل رصيد سوري")
+@router.on_text(bot, "💳 تحويل رصيد سوري")
 def handle_syrian_units(msg):
     from handlers.syr_units import start_syriatel_menu
     start_syriatel_menu(bot, msg)
 
-@bot.message_handler(func=lambda msg: msg.text == "🌐 دفع مزودات الإنترنت ADSL")
+@router.on_text(bot, "🌐 دفع مزودات الإنترنت ADSL")
 def handle_internet(msg):
     from handlers.internet_providers import start_internet_provider_menu
     start_internet_provider_menu(bot, msg)
 
-@bot.message_handler(func=lambda msg: msg.text == "🎓 دفع رسوم جامعية")
+@router.on_text(bot, "🎓 دفع رسوم جامعية")
 def handle_university_fees(msg):
     from handlers.university_fees import start_university_fee
     start_university_fee(bot, msg)
 
-@bot.message_handler(func=lambda msg: msg.text in [
+@router.on_text(
+    bot,
     "🖼️ تصميم لوغو احترافي",
     "📱 إدارة ونشر يومي",
     "📢 إطلاق حملة إعلانية",
     "🧾 باقة متكاملة شهرية",
-    "✏️ طلب مخصص"
-])
+    "✏️ طلب مخصص",
+)
 def handle_media(msg):
     from handlers.media_services import show_media_services
     show_media_services(bot, msg, user_state)
 
 # ================== أزرار الشركات الجديدة ======================
-@bot.message_handler(func=lambda msg: msg.text == "شركة الهرم")
+@router.on_text(bot, "شركة الهرم")
 def handle_al_haram(msg):
     bot.send_message(
         msg.chat.id,
@@ -221,7 +214,7 @@ def handle_al_haram(msg):
     )
     user_state[msg.from_user.id] = "alharam_start"
 
-@bot.message_handler(func=lambda msg: msg.text == "شركة الفؤاد")
+@router.on_text(bot, "شركة الفؤاد")
 def handle_alfouad(msg):
     bot.send_message(
         msg.chat.id,
@@ -234,7 +227,7 @@ def handle_alfouad(msg):
     )
     user_state[msg.from_user.id] = "alfouad_start"
 
-@bot.message_handler(func=lambda msg: msg.text == "شركة شخاشير")
+@router.on_text(bot, "شركة شخاشير")
 def handle_shakhashir(msg):
     bot.send_message(
         msg.chat.id,
@@ -247,11 +240,40 @@ def handle_shakhashir(msg):
     )
     user_state[msg.from_user.id] = "shakhashir_start"
 
+# ---------------------------------------------------------
+# اكتمل التسجيل: أي *_handler أو مسار router بعد هذا السطر يُرفض
+# ---------------------------------------------------------
+registry.freeze(bot)
+registry.log_counts(bot)
+
 # ---------------------------------------------------------
 # === تشغيل نظام الطابور (QUEUE) ===
 # ---------------------------------------------------------
-from services.queue_service import process_queue
-threading.Thread(target=process_queue, args=(bot,), daemon=True).start()
+from services.queue_service import init_queue, start_reconciler
+from config import QUEUE_RECONCILE_SECONDS
+with boot_profile.phase("queue"):
+    init_queue(bot)  # تحميل الطابور مرة واحدة؛ بعدها يُدار بالأحداث
+    start_reconciler(QUEUE_RECONCILE_SECONDS)
+
+# حالة المحادثات تُحفظ في data/sessions.db وتُستعاد كسولًا بعد إعادة التشغيل
+from services.session_store import store as session_store, SESSION_DB
+with boot_profile.phase("sessions"):
+    session_store.persist(SESSION_DB)
+
+# سجل المشتريات والحركات اليدوية: journal محلي ثم إدراج على دفعات
+from services import ledger_writer
+with boot_profile.phase("ledger"):
+    ledger_writer.start()
+
+# كتالوج المنتجات من ملف/جدول مع إعادة تحميل دورية (المضمّن لا يحتاج شيئًا)
+from services import catalog_service
+with boot_profile.phase("catalog"):
+    catalog_service.start_auto_reload()
+
+# المهام الدورية على نفس البوت (الحاذفة منها خلف SCHEDULED_CLEANUP، معطّلة افتراضيًا)
+import scheduled_tasks
+with boot_profile.phase("scheduled"):
+    scheduled_tasks.start_scheduled_tasks(bot)
 
 # ---------------------------------------------------------
 # 7) تشغيل البوت مع نظام إعادة المحاولة والتنبيه في حال الخطأ
@@ -262,6 +284,8 @@ def restart_bot():
     """إعادة تشغيل البوت بعد حدوث خطأ قاتل."""
     logging.warning("🔄 إعادة تشغيل البوت بعد 10 ثوانٍ…")
     time.sleep(10)
+    session_store.close()  # حفظ ما تغيّر منذ آخر دفعة قبل استبدال العملية
+    ledger_writer.close()
     os.execv(sys.executable, [sys.executable] + sys.argv)
 
 def start_polling():
@@ -272,6 +296,7 @@ def start_polling():
                 none_stop=True,
                 skip_pending=True,
                 long_polling_timeout=40,
+                allowed_updates=ALLOWED_UPDATES,
             )
         except telebot.apihelper.ApiTelegramException as e:
             if getattr(e, "error_code", None) == 409:
@@ -286,9 +311,22 @@ def start_polling():
             restart_bot()
             break
 
-start_polling()
+def start_webhook():
+    print("🤖 البوت يعمل الآن (webhook)…")
+    set_webhook(bot, max_connections=HANDLER_LANES * 5, allowed_updates=ALLOWED_UPDATES)
+    start_http_server(PORT, bot, block=True)
+
+# مقاييس Prometheus على GET /metrics (بعد اكتمال تسجيل المعالجات)
+from services import metrics
+with boot_profile.phase("metrics"):
+    metrics.install(bot)
+
+boot_profile.report()
 
-import scheduled_tasks  # لإطلاق المهام الدورية تلقائيًا عند تشغيل البوت
+if BOT_MODE == "webhook":
+    start_webhook()
+else:
+    start_polling()
 
 # ---------------------------------------------------------
 # (تنبيه حول الضغط العالي – فكرة للطوابير/queues)
@@ -4,13 +4,13 @@ from datetime import datetime, timedelta
 import threading
 import time
 
-from database.db import client
+from config import SCHEDULED_CLEANUP
+from database.db import get_table
+from services.cleanup_service import iter_inactive_users, purge_users, sweep_expired_purchases, DELETE_CHUNK_SIZE
+from services.notification_service import broadcast
 
-import telebot
-from config import API_TOKEN
-
-# إعداد كائن البوت لإرسال الرسائل
-bot = telebot.TeleBot(API_TOKEN)
+# كائن البوت المشترك من main.py (يُمرَّر عبر start_scheduled_tasks)
+bot = None
 
 # اسماء الجداول في supabase
 USERS_TABLE = "houssin363"
@@ -22,78 +22,73 @@ DELETE_USER_AFTER_DAYS = 35
 WARN_USER_BEFORE_DAYS = 5
 DELETE_RECORDS_AFTER_DAYS = 7
 
+# كنس المشتريات المنتهية (expire_at) كل N ثانية
+PURCHASE_SWEEP_SECONDS = 1800
+
 BOT_LINK = "https://t.me/اسم_البوت_هنا"  # ضع رابط البوت الخاص بك هنا
 
-def send_warning_message(user_id, delete_date):
+def warning_text(delete_date):
+    """نص تحذير المستخدم قبل حذف حسابه."""
+    return (
+        f"🚨 تنبيه!\n"
+        f"سيتم حذف حسابك وجميع بياناتك من النظام بتاريخ {delete_date.strftime('%Y-%m-%d')} "
+        f"لعدم وجود نشاط في محفظتك لمدة {DELETE_USER_AFTER_DAYS} يوم.\n"
+        "إذا كنت تريد الحفاظ على حسابك، يرجى شحن محفظتك أو تنفيذ عملية شراء قبل هذا التاريخ.\n"
+        "بعد الحذف لا يمكنك المطالبة بأي رصيد أو مراجعة.\n\n"
+        f"رابط البوت: {BOT_LINK}"
+    )
+
+def send_warnings(delete_dates):
     """
-    يحاول إرسال تحذير للمستخدم قبل حذف حسابه.
-    يتجاهل الخطأ إذا كان المستخدم قد حظر البوت أو حذفه.
+    يرسل التحذيرات دفعة واحدة عبر broadcast (متوازٍ ضمن حدود تيليجرام).
+    المستخدمون الذين حظروا البوت يُحسبون blocked ولا يوقفون المهمة.
+    نقطة الحفظ باسم اليوم ← إعادة التشغيل لا تكرر التحذير.
     """
-    try:
-        warning_text = (
-            f"🚨 تنبيه!\n"
-            f"سيتم حذف حسابك وجميع بياناتك من النظام بتاريخ {delete_date.strftime('%Y-%m-%d')} "
-            f"لعدم وجود نشاط في محفظتك لمدة {DELETE_USER_AFTER_DAYS} يوم.\n"
-            "إذا كنت تريد الحفاظ على حسابك، يرجى شحن محفظتك أو تنفيذ عملية شراء قبل هذا التاريخ.\n"
-            "بعد الحذف لا يمكنك المطالبة بأي رصيد أو مراجعة.\n\n"
-            f"رابط البوت: {BOT_LINK}"
-        )
-        bot.send_message(user_id, warning_text)
-        logging.info(f"تم إرسال تحذير للحذف للمستخدم {user_id}")
-    except Exception as e:
-        # يتجاهل أي خطأ (حظر البوت أو حذف البوت)
-        logging.warning(f"فشل إرسال تحذير للمستخدم {user_id}: {e}")
+    if not delete_dates:
+        return
+    counts = broadcast(
+        bot,
+        lambda user_id: warning_text(delete_dates[user_id]),
+        user_ids=sorted(delete_dates),
+        broadcast_id=f"inactive-warning-{datetime.utcnow():%Y%m%d}",
+    )
+    logging.info(f"تحذيرات الحذف: {counts}")
+
+def _parse_ts(value):
+    if isinstance(value, str):
+        return datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+    return value
 
 def delete_inactive_users():
     """
     يحذف المستخدمين غير النشطين منذ X يوم.
     ويرسل تحذير قبل 5 أيام من الحذف الفعلي.
+    آخر نشاط يُحسب في قاعدة البيانات (user_last_activity) والحذف على دفعات.
     """
     now = datetime.utcnow()
-    # 1) استخرج كل المستخدمين
-    users_resp = client.table(USERS_TABLE).select("*").execute()
-    if not users_resp.data:
-        return
+    warn_from = now - timedelta(days=DELETE_USER_AFTER_DAYS - WARN_USER_BEFORE_DAYS)
+    to_delete = []
+    to_warn = {}
+    deleted = 0
 
-    for user in users_resp.data:
-        user_id = user.get("user_id")
-        created_at = user.get("created_at")
-        last_activity = created_at
-        # تحقق من آخر معاملة أو شراء له
-        last_txn = client.table(TRANSACTIONS_TABLE)\
-            .select("timestamp")\
-            .eq("user_id", user_id)\
-            .order("timestamp", desc=True)\
-            .limit(1)\
-            .execute()
-        last_purchase = client.table(PURCHASES_TABLE)\
-            .select("created_at")\
-            .eq("user_id", user_id)\
-            .order("created_at", desc=True)\
-            .limit(1)\
-            .execute()
-        if last_txn.data:
-            last_activity = max(last_activity, last_txn.data[0]["timestamp"])
-        if last_purchase.data:
-            last_activity = max(last_activity, last_purchase.data[0]["created_at"])
-        # تحويل آخر نشاط لـ datetime
-        last_dt = (
-            datetime.strptime(last_activity[:19], "%Y-%m-%dT%H:%M:%S")
-            if isinstance(last_activity, str)
-            else last_activity
-        )
+    for row in iter_inactive_users(warn_from):
+        user_id = row["user_id"]
+        last_dt = _parse_ts(row["last_activity"])
         days_inactive = (now - last_dt).days
         # أ) أرسل تحذير قبل 5 أيام
         if DELETE_USER_AFTER_DAYS - WARN_USER_BEFORE_DAYS <= days_inactive < DELETE_USER_AFTER_DAYS:
-            delete_date = last_dt + timedelta(days=DELETE_USER_AFTER_DAYS)
-            send_warning_message(user_id, delete_date)
+            to_warn[user_id] = last_dt + timedelta(days=DELETE_USER_AFTER_DAYS)
         # ب) حذف العميل بعد المدة
         elif days_inactive >= DELETE_USER_AFTER_DAYS:
-            # حذف من جميع الجداول المتعلقة
-            client.table(USERS_TABLE).delete().eq("user_id", user_id).execute()
-            client.table(TRANSACTIONS_TABLE).delete().eq("user_id", user_id).execute()
-            client.table(PURCHASES_TABLE).delete().eq("user_id", user_id).execute()
-            logging.info(f"تم حذف المستخدم {user_id} نهائيًا بسبب عدم النشاط.")
+            to_delete.append(user_id)
+            if len(to_delete) >= DELETE_CHUNK_SIZE:
+                deleted += purge_users(to_delete)
+                to_delete = []
+
+    if to_delete:
+        deleted += purge_users(to_delete)
+    logging.info(f"تم حذف {deleted} مستخدم نهائيًا بسبب عدم النشاط.")
+    send_warnings(to_warn)
 
 def delete_old_transactions_and_purchases():
     """
@@ -102,21 +97,22 @@ def delete_old_transactions_and_purchases():
     now = datetime.utcnow()
     cutoff = now - timedelta(days=DELETE_RECORDS_AFTER_DAYS)
     # حذف المعاملات القديمة
-    client.table(TRANSACTIONS_TABLE)\
+    get_table(TRANSACTIONS_TABLE)\
         .delete()\
         .lt("timestamp", cutoff.isoformat())\
         .execute()
     # حذف المشتريات القديمة
-    client.table(PURCHASES_TABLE)\
+    get_table(PURCHASES_TABLE)\
         .delete()\
         .lt("created_at", cutoff.isoformat())\
         .execute()
     logging.info("تم حذف السجلات القديمة من جدول المعاملات والمشتريات.")
 
-def run_scheduled_tasks():
+def run_scheduled_tasks(initial_delay=0):
     """
     دالة رئيسية: تكرر المهام كل يوم تلقائيًا في الخلفية.
     """
+    time.sleep(initial_delay)
     while True:
         try:
             logging.info("تشغيل المهام الدورية: حذف العملاء غير النشطين وحذف السجلات القديمة.")
@@ -127,6 +123,32 @@ def run_scheduled_tasks():
         # انتظر 24 ساعة (86400 ثانية)
         time.sleep(86400)
 
-# اطلاق الثريد عند استيراد الملف تلقائيًا
-threading.Thread(target=run_scheduled_tasks, daemon=True).start()
+def run_purchase_sweeper(initial_delay=0):
+    """حذف المشتريات المنتهية على دفعات بدل حذفها عند كل عرض."""
+    time.sleep(initial_delay)
+    while True:
+        try:
+            sweep_expired_purchases()
+        except Exception as e:
+            logging.error(f"خطأ في كنس المشتريات المنتهية: {e}")
+        time.sleep(PURCHASE_SWEEP_SECONDS)
+
+def start_scheduled_tasks(shared_bot, initial_delay=60):
+    """
+    يطلق ثريد المهام باستخدام بوت main.py نفسه.
+    حذف العملاء والسجلات القديمة لا يعمل إلا مع SCHEDULED_CLEANUP؛ كنس المشتريات
+    المنتهية يعمل دائمًا (يحل محل حذفها عند العرض).
+    التشغيل الأول مؤجل قليلًا حتى لا ينافس الإقلاع وأول التحديثات على الشبكة وقاعدة البيانات.
+    """
+    global bot
+    bot = shared_bot
+    if SCHEDULED_CLEANUP:
+        threading.Thread(
+            target=run_scheduled_tasks, args=(initial_delay,), name="ScheduledTasks", daemon=True
+        ).start()
+    else:
+        logging.info("المهام اليومية الحاذفة معطّلة (SCHEDULED_CLEANUP=1 لتفعيلها).")
+    threading.Thread(
+        target=run_purchase_sweeper, args=(initial_delay,), name="PurchaseSweeper", daemon=True
+    ).start()
 # === نهاية الملف ===
@@ -0,0 +1,178 @@
+# services/agent_codes_service.py
+"""
+سجل عمليات أكواد الوكلاء (إلحاق فقط) بدل إعادة كتابة data/secret_codes.json كاملًا:
+- record(code, user, amount) يضيف سطر JSON واحدًا مع fsync ← كلفة ثابتة مهما كبر السجل.
+- في الذاكرة لكل كود: العدد والمجموع وآخر REPORT_RECENT عملية (للتقرير).
+- بعد COMPACT_EVERY سطرًا يُدوَّر الملف: ينتقل كما هو إلى أرشيف <log>.<رقم> (لا يُحذف
+  أي سطر عملية)، ويبدأ ملف نشط جديد بسطر ملخص لكل كود؛ فالإقلاع يقرأ الملف النشط فقط.
+- iter_operations() تمر على كل العمليات منذ البداية (الأرشيف ثم الملف النشط).
+- أول تحميل ينقل secret_codes.json القديم (كل عملياته) إلى السجل ويعيد تسميته إلى .migrated.
+
+سطر العملية: {"code", "user", "amount", "date"}
+سطر الملخص:  {"code", "count", "total", "recent": [...]}  (أول الملف النشط بعد التدوير)
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+AGENT_CODES_LOG = os.getenv("AGENT_CODES_LOG", "data/agent_codes.jsonl")
+LEGACY_CODES_FILE = "data/secret_codes.json"
+REPORT_RECENT = int(os.getenv("AGENT_CODES_RECENT", "50"))
+COMPACT_EVERY = int(os.getenv("AGENT_CODES_COMPACT_EVERY", "5000"))
+
+_lock = threading.Lock()
+_codes = {}       # code -> {"count", "total", "recent": deque}
+_log = None
+_path = None
+_lines = 0        # أسطر الملف النشط (لتقرير موعد التدوير)
+
+
+def _entry(code):
+    agg = _codes.get(code)
+    if agg is None:
+        agg = _codes[code] = {"count": 0, "total": 0, "recent": deque(maxlen=REPORT_RECENT)}
+    return agg
+
+
+def _apply(line):
+    agg = _entry(line["code"])
+    if "recent" in line:  # ملخص
+        agg["count"] += line["count"]
+        agg["total"] += line["total"]
+        agg["recent"].extend(line["recent"])
+    else:
+        agg["count"] += 1
+        agg["total"] += line["amount"]
+        agg["recent"].append({"user": line["user"], "amount": line["amount"], "date": line["date"]})
+
+
+def _write_lines(f, lines):
+    for line in lines:
+        f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _snapshot():
+    return [
+        {"code": code, "count": agg["count"], "total": agg["total"], "recent": list(agg["recent"])}
+        for code, agg in _codes.items()
+    ]
+
+
+def _write_file(path, lines):
+    """كتابة ملف كامل عبر ملف مؤقت + os.replace (لا ملف نصف مكتوب عند الانهيار)."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        _write_lines(f, lines)
+    os.replace(tmp, path)
+
+
+def _archives(path):
+    """ملفات الأرشيف بترتيب إنشائها."""
+    return sorted(
+        (p for p in glob.glob(glob.escape(path) + ".*") if p.rsplit(".", 1)[1].isdigit()),
+        key=lambda p: int(p.rsplit(".", 1)[1]),
+    )
+
+
+def _rotate():
+    """الملف النشط ← أرشيف كما هو، ثم ملف نشط جديد يبدأ بالملخص (يُستدعى تحت _lock)."""
+    global _log, _lines
+    snapshot = _snapshot()
+    tmp = _path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        _write_lines(f, snapshot)
+    _log.close()
+    # انهيار بين الخطوتين: _open يكمل من .tmp
+    os.rename(_path, f"{_path}.{time.time_ns()}")
+    os.replace(tmp, _path)
+    _lines = len(snapshot)
+    _log = open(_path, "a", encoding="utf-8")
+
+
+def _migrate_legacy():
+    """secret_codes.json القديم ← أسطر عمليات في السجل (مرة واحدة، بلا حذف أي عملية)."""
+    with open(LEGACY_CODES_FILE, "r", encoding="utf-8") as f:
+        legacy = json.load(f)
+    lines = [
+        {"code": code, "user": op.get("user"), "amount": op.get("amount", 0), "date": op.get("date")}
+        for code, ops in legacy.items()
+        for op in ops
+    ]
+    _write_file(_path, lines)
+    for line in lines:
+        _apply(line)
+    os.replace(LEGACY_CODES_FILE, LEGACY_CODES_FILE + ".migrated")
+    logging.info(f"[AGENT_CODES] نُقل {len(lines)} عملية من {LEGACY_CODES_FILE}")
+    return len(lines)
+
+
+def _open(path=AGENT_CODES_LOG):
+    """تحميل السجل إلى الذاكرة وفتحه للإلحاق (يُستدعى تحت _lock)."""
+    global _log, _path, _lines
+    if _log is not None:
+        return
+    _path = path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if os.path.exists(path + ".tmp"):
+        if os.path.exists(path):
+            os.remove(path + ".tmp")  # تدوير لم يبدأ: الملف النشط ما زال كاملًا
+        else:
+            os.replace(path + ".tmp", path)  # انهيار بعد نقل الملف إلى الأرشيف
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for raw in f:
+                try:
+                    line = json.loads(raw)
+                except ValueError:
+                    continue  # سطر أخير ناقص من انهيار أثناء الكتابة
+                _apply(line)
+                _lines += 1
+    elif os.path.isfile(LEGACY_CODES_FILE):
+        _lines = _migrate_legacy()
+    _log = open(path, "a", encoding="utf-8")
+
+
+def record(code, user, amount, date):
+    """إضافة عملية شحن عبر كود وكيل (سطر واحد + fsync)."""
+    global _lines
+    line = {"code": code, "user": user, "amount": amount, "date": date}
+    with _lock:
+        _open()
+        _write_lines(_log, [line])
+        _apply(line)
+        _lines += 1
+        if _lines >= len(_codes) + COMPACT_EVERY:
+            _rotate()
+
+
+def report():
+    """{code: {"count", "total", "recent": [أحدث العمليات أولًا]}}"""
+    with _lock:
+        _open()
+        return {
+            code: {"count": agg["count"], "total": agg["total"], "recent": list(reversed(agg["recent"]))}
+            for code, agg in _codes.items()
+        }
+
+
+def iter_operations(code=None):
+    """كل العمليات منذ البداية بترتيب تسجيلها (الأرشيف ثم الملف النشط)."""
+    with _lock:
+        _open()
+        paths = _archives(_path) + [_path]
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for raw in f:
+                try:
+                    line = json.loads(raw)
+                except ValueError:
+                    continue
+                if "recent" in line or (code is not None and line["code"] != code):
+                    continue  # سطر ملخص: عملياته موجودة في الأرشيف
+                yield line
@@ -0,0 +1,59 @@
+# services/boot_profile.py
+"""
+قياس زمن الإقلاع مرحلةً مرحلة حتى جاهزية استقبال أول تحديث:
+
+    with boot_profile.phase("handlers"):
+        ...
+    results = boot_profile.run_parallel("network", get_me=bot.get_me, db=get_client)
+    boot_profile.report()   # جدول المراحل + تحذير إن تجاوز BOOT_BUDGET_SECONDS
+
+البداية تُحسب من استيراد هذه الوحدة (أول سطر في main.py).
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from config import BOOT_BUDGET_SECONDS
+
+_started = time.perf_counter()
+_phases = []  # [(name, seconds)]
+
+
+@contextmanager
+def phase(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, time.perf_counter() - t0))
+
+
+def run_parallel(name, **tasks):
+    """
+    ينفذ مهام مستقلة (فحوص شبكة غالبًا) معًا ضمن مرحلة واحدة.
+    يعيد {اسم: النتيجة أو الاستثناء}؛ قرار التعامل مع الفشل للمستدعي.
+    """
+    results = {}
+    with phase(name), ThreadPoolExecutor(max_workers=len(tasks) or 1) as pool:
+        futures = {key: pool.submit(func) for key, func in tasks.items()}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = e
+    return results
+
+
+def elapsed() -> float:
+    return time.perf_counter() - _started
+
+
+def report():
+    total = elapsed()
+    lines = [f"  {name:<14}{seconds * 1000:>9.1f} ms" for name, seconds in _phases]
+    lines.append(f"  {'TOTAL':<14}{total * 1000:>9.1f} ms")
+    logging.info("[BOOT] زمن الإقلاع حسب المرحلة:\n" + "\n".join(lines))
+    if BOOT_BUDGET_SECONDS and total > BOOT_BUDGET_SECONDS:
+        logging.warning(f"[BOOT] الإقلاع استغرق {total:.1f} ث وتجاوز الميزانية {BOOT_BUDGET_SECONDS} ث")
+    return total
@@ -0,0 +1,174 @@
+# services/catalog_service.py
+"""
+كتالوج المنتجات كلقطة (snapshot) ثابتة ومرقّمة:
+- فهرس id -> المنتج، وقائمة مرتبة لكل مجموعة (PUBG, FreeFire, ...)،
+  والسعر بالليرة محسوب مسبقًا لكل منتج.
+- إعادة التحميل تبني لقطة جديدة كاملة ثم تستبدل المرجع دفعة واحدة؛
+  القرّاء يأخذون current() بلا أقفال ولا يرون كتالوجًا نصف محدّث.
+
+المصادر (CATALOG_SOURCE):
+    builtin  القائمة المضمنة أدناه (الافتراضي)
+    file     ملف JSON (CATALOG_FILE): {"PUBG": [{"id": 1, "name": "60 شدة", "price": 0.89, ...}]}
+    table    جدول products: type = المجموعة، details = {"price", "category", "description", "position"}
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from database.models.product import Product
+
+CATALOG_SOURCE = os.getenv("CATALOG_SOURCE", "builtin")
+CATALOG_FILE = os.getenv("CATALOG_FILE", "data/catalog.json")
+CATALOG_RELOAD_SECONDS = int(os.getenv("CATALOG_RELOAD_SECONDS", "300"))
+PRODUCTS_TABLE = "products"
+
+DEFAULT_CATALOG = {
+    "PUBG": [
+        Product(1, "60 شدة", "ألعاب", 0.89, "زر 60 شدة"),
+        Product(2, "325 شدة", "ألعاب", 4.44, "زر 325 شدة"),
+        Product(3, "660 شدة", "ألعاب", 8.85, "زر 660 شدة"),
+        Product(4, "1800 شدة", "ألعاب", 22.09, "زر 1800 شدة"),
+        Product(5, "3850 شدة", "ألعاب", 43.24, "زر 3850 شدة"),
+        Product(6, "8100 شدة", "ألعاب", 86.31, "زر 8100 شدة"),
+    ],
+    "FreeFire": [
+        Product(7, "100 جوهرة", "ألعاب", 0.98, "زر 100 جوهرة"),
+        Product(8, "310 جوهرة", "ألعاب", 2.49, "زر 310 جوهرة"),
+        Product(9, "520 جوهرة", "ألعاب", 4.13, "زر 520 جوهرة"),
+        Product(10, "1060 جوهرة", "ألعاب", 9.42, "زر 1060 جوهرة"),
+        Product(11, "2180 جوهرة", "ألعاب", 18.84, "زر 2180 جوهرة"),
+    ],
+    "Jawaker": [
+        Product(12, "10000 توكنز", "ألعاب", 1.34, "زر 10000 توكنز"),
+        Product(13, "15000 توكنز", "ألعاب", 2.01, "زر 15000 توكنز"),
+        Product(14, "20000 توكنز", "ألعاب", 2.68, "زر 20000 توكنز"),
+        Product(15, "30000 توكنز", "ألعاب", 4.02, "زر 30000 توكنز"),
+        Product(16, "60000 توكنز", "ألعاب", 8.04, "زر 60000 توكنز"),
+        Product(17, "120000 توكنز", "ألعاب", 16.08, "زر 120000 توكنز"),
+    ],
+}
+
+
+def convert_price_usd_to_syp(usd):
+    if usd <= 5:
+        return int(usd * 11800)
+    elif usd <= 10:
+        return int(usd * 11600)
+    elif usd <= 20:
+        return int(usd * 11300)
+    return int(usd * 11000)
+
+
+class CatalogSnapshot:
+    """لقطة للقراءة فقط؛ لا تُعدَّل بعد البناء."""
+
+    __slots__ = ("version", "source", "by_id", "groups", "group_of", "prices_syp")
+
+    def __init__(self, groups, version, source):
+        self.version = version
+        self.source = source
+        self.groups = {name: tuple(items) for name, items in groups.items()}
+        self.by_id = {}
+        self.group_of = {}
+        self.prices_syp = {}
+        for name, items in self.groups.items():
+            for product in items:
+                self.by_id[product.product_id] = product
+                self.group_of[product.product_id] = name
+                self.prices_syp[product.product_id] = convert_price_usd_to_syp(product.price)
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+_snapshot = CatalogSnapshot(DEFAULT_CATALOG, version=1, source="builtin")
+_reload_lock = threading.Lock()  # يسلسل إعادة التحميل فقط؛ القراءة بلا قفل
+
+
+def current() -> CatalogSnapshot:
+    return _snapshot
+
+
+def get_product(product_id):
+    return _snapshot.by_id.get(product_id)
+
+
+def products_in(group):
+    return _snapshot.groups.get(group, ())
+
+
+def group_of(product_id):
+    return _snapshot.group_of.get(product_id)
+
+
+def price_syp(product_id):
+    return _snapshot.prices_syp.get(product_id)
+
+
+# ---------- المصادر ----------
+def _product(row, category="ألعاب"):
+    return Product(
+        int(row["id"]), row["name"], row.get("category") or category,
+        float(row["price"]), row.get("description"), row.get("code"), row.get("stock", 1),
+    )
+
+
+def _load_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {group: [_product(row) for row in rows] for group, rows in data.items()}
+
+
+def _load_table():
+    from database.db import get_table
+
+    rows = get_table(PRODUCTS_TABLE).select("id", "name", "type", "details").execute().data or []
+    groups = {}
+    for row in sorted(rows, key=lambda r: ((r.get("details") or {}).get("position", 0), r["id"])):
+        details = row.get("details") or {}
+        if details.get("price") is None or not row.get("type"):
+            continue
+        groups.setdefault(row["type"], []).append(_product(dict(details, id=row["id"], name=row["name"])))
+    return groups
+
+
+def reload(source=None):
+    """يبني لقطة جديدة من المصدر ويستبدلها ذريًا؛ عند الفشل تبقى اللقطة الحالية."""
+    global _snapshot
+    source = source or CATALOG_SOURCE
+    with _reload_lock:
+        if source == "file":
+            groups = _load_file(CATALOG_FILE)
+        elif source == "table":
+            groups = _load_table()
+        else:
+            groups = DEFAULT_CATALOG
+        if not groups:
+            raise ValueError(f"الكتالوج من {source} فارغ")
+        _snapshot = CatalogSnapshot(groups, version=_snapshot.version + 1, source=source)
+    logging.info(f"[CATALOG] v{_snapshot.version} من {source}: {len(_snapshot)} منتج")
+    return _snapshot
+
+
+def start_auto_reload(interval=CATALOG_RELOAD_SECONDS):
+    """تحميل أولي ثم إعادة تحميل دورية (فقط إن كان المصدر خارجيًا)."""
+    if CATALOG_SOURCE == "builtin":
+        return
+    try:
+        reload()
+    except Exception:
+        logging.exception("[CATALOG] فشل التحميل الأولي، سيُستخدم الكتالوج المضمّن")
+    if interval <= 0:
+        return
+
+    def _loop():
+        while True:
+            time.sleep(interval)
+            try:
+                reload()
+            except Exception:
+                logging.exception("[CATALOG] فشل إعادة التحميل")
+
+    threading.Thread(target=_loop, name="CatalogReload", daemon=True).start()
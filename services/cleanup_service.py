@@ -1,6 +1,19 @@
 # services/cleanup_service.py
+import logging
+import time
 from datetime import datetime, timedelta
-from database.db import get_table
+from database.db import get_table, rpc
+from services.wallet_service import forget_users
+
+# دالة RPC لآخر نشاط (انظر التعريف 7 في wallet_service)
+ACTIVITY_RPC = "user_last_activity"
+SWEEP_PAGE_SIZE = 1000
+DELETE_CHUNK_SIZE = 200
+PURCHASE_SWEEP_CHUNK = 500      # صفوف لكل دفعة حذف
+PURCHASE_SWEEP_MAX_CHUNKS = 200  # حد أعلى لكل دورة (الباقي في الدورة التالية)
+
+# آخر دورة كنس + المجموع (يُعرض في /metrics)
+sweep_stats = {"runs": 0, "deleted_total": 0, "last_deleted": 0, "last_seconds": 0.0, "last_rows_per_second": 0.0}
 
 def delete_inactive_users():
     table_users = get_table("houssin363")
@@ -16,4 +29,67 @@ def delete_inactive_users():
             table_users.delete().eq("user_id", user_id).execute()
             print(f"تم حذف المستخدم غير النشيط: {user_id}")
 
+def iter_inactive_users(before: datetime, page_size: int = SWEEP_PAGE_SIZE):
+    """
+    يمرّ على المستخدمين الذين آخر نشاط لهم قبل before.
+    استعلام تجميعي واحد لكل صفحة، والتصفح keyset على user_id.
+    """
+    after = 0
+    while True:
+        rows = rpc(ACTIVITY_RPC, {
+            "p_before": before.isoformat(),
+            "p_after_user_id": after,
+            "p_limit": page_size,
+        }).execute().data or []
+        yield from rows
+        if len(rows) < page_size:
+            return
+        after = rows[-1]["user_id"]
+
+def purge_users(user_ids, chunk_size: int = DELETE_CHUNK_SIZE) -> int:
+    """حذف المستخدمين مع حركاتهم ومشترياتهم على دفعات (in_) بدل حذف لكل مستخدم."""
+    user_ids = list(user_ids)
+    for i in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[i:i + chunk_size]
+        get_table("transactions").delete().in_("user_id", chunk).execute()
+        get_table("purchases").delete().in_("user_id", chunk).execute()
+        get_table("houssin363").delete().in_("user_id", chunk).execute()
+        forget_users(chunk)
+    return len(user_ids)
+
+def sweep_expired_purchases(chunk_size: int = PURCHASE_SWEEP_CHUNK,
+                            max_chunks: int = PURCHASE_SWEEP_MAX_CHUNKS) -> int:
+    """
+    يحذف المشتريات المنتهية (expire_at < الآن) على دفعات محدودة:
+    اختيار chunk_size معرّف بالترتيب (فهرس purchases_expire_at_idx) ثم حذفها بـ in_.
+    """
+    now = datetime.utcnow().isoformat()
+    deleted = 0
+    started = time.perf_counter()
+    for _ in range(max_chunks):
+        rows = (
+            get_table("purchases").select("id")
+            .lt("expire_at", now)
+            .order("expire_at")
+            .limit(chunk_size)
+            .execute().data or []
+        )
+        if not rows:
+            break
+        get_table("purchases").delete().in_("id", [row["id"] for row in rows]).execute()
+        deleted += len(rows)
+        if len(rows) < chunk_size:
+            break
+    elapsed = time.perf_counter() - started
+    sweep_stats.update(
+        runs=sweep_stats["runs"] + 1,
+        deleted_total=sweep_stats["deleted_total"] + deleted,
+        last_deleted=deleted,
+        last_seconds=round(elapsed, 3),
+        last_rows_per_second=round(deleted / max(elapsed, 1e-9), 1),
+    )
+    if deleted:
+        logging.info(f"[SWEEP] حذف {deleted} شراء منتهٍ في {elapsed:.2f} ث ({deleted / max(elapsed, 1e-9):.0f} صف/ث)")
+    return deleted
+
 # يمكنك تشغيلها يومياً تلقائياً عبر cron أو كود باكجراوند.
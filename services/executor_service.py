@@ -0,0 +1,101 @@
+# services/executor_service.py
+"""
+منفّذ المعالجات المقسّم حسب المستخدم (بديل util.ThreadPool في telebot):
+- كل مستخدم يُربط بمسار (lane) ثابت عبر from_user.id % عدد المسارات.
+- كل مسار خيط واحد بطابور خاص ← تحديثات المستخدم الواحد تُنفَّذ بالترتيب
+  (ضغطتان على زر التأكيد لا تتسابقان)، والمستخدمون المختلفون يعملون بالتوازي.
+- lane_depths() تعيد عدد المهام المنتظرة في كل مسار لمعرفة الحجم المناسب.
+
+الاستخدام:
+    bot.worker_pool = ShardedWorkerPool(bot, HANDLER_LANES)
+"""
+import logging
+import queue
+import threading
+
+
+def _lane_key(args):
+    """مفتاح التقسيم: from_user.id للرسائل والـ callback، وإلا chat.id."""
+    update = args[0] if args else None
+    user = getattr(update, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, "chat", None) or getattr(getattr(update, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    return 0
+
+
+class _Lane(threading.Thread):
+    def __init__(self, pool, index):
+        super().__init__(name=f"HandlerLane{index}", daemon=True)
+        self.pool = pool
+        self.tasks = queue.Queue()
+        self.busy = False
+        self._running = True
+        self.start()
+
+    def run(self):
+        while self._running:
+            try:
+                task, args, kwargs = self.tasks.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self.busy = True
+            try:
+                task(*args, **kwargs)
+            except Exception as e:
+                self.pool.on_exception(e)
+            finally:
+                self.busy = False
+
+    def stop(self):
+        self._running = False
+
+
+class ShardedWorkerPool:
+    """نفس واجهة util.ThreadPool التي تستخدمها telebot (put/raise_exceptions/clear_exceptions/close)."""
+
+    def __init__(self, telebot, num_lanes=8):
+        self.telebot = telebot
+        self.num_threads = num_lanes
+        self.lanes = [_Lane(self, i) for i in range(num_lanes)]
+        self.exception_event = threading.Event()
+        self.exception_info = None
+
+    def lane_for(self, key) -> int:
+        return hash(key) % len(self.lanes)
+
+    def put(self, func, *args, **kwargs):
+        self.lanes[self.lane_for(_lane_key(args))].tasks.put((func, args, kwargs))
+
+    def lane_depths(self):
+        """عدد المهام المنتظرة في كل مسار."""
+        return [lane.tasks.qsize() for lane in self.lanes]
+
+    def busy_lanes(self) -> int:
+        return sum(1 for lane in self.lanes if lane.busy)
+
+    def on_exception(self, exc):
+        if self.telebot.exception_handler is not None:
+            handled = self.telebot.exception_handler.handle(exc)
+        else:
+            handled = False
+        if not handled:
+            logging.error(f"[LANES] خطأ في معالج: {exc!r}", exc_info=exc)
+            self.exception_info = exc
+            self.exception_event.set()
+
+    def raise_exceptions(self):
+        if self.exception_event.is_set():
+            raise self.exception_info
+
+    def clear_exceptions(self):
+        self.exception_event.clear()
+
+    def close(self):
+        for lane in self.lanes:
+            lane.stop()
+        for lane in self.lanes:
+            if lane is not threading.current_thread():
+                lane.join()
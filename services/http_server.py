@@ -0,0 +1,122 @@
+# services/http_server.py
+"""
+خادم HTTP على منفذ Render (PORT):
+- GET  /metrics ← مقاييس Prometheus النصية (services/metrics).
+- GET  أي مسار آخر ← 200 (فحص الحياة keep-alive كما كان الخادم الوهمي).
+- POST WEBHOOK_PATH ← تحديثات تيليجرام في وضع webhook:
+    يتحقق دائمًا من X-Telegram-Bot-Api-Secret-Token، يرد 200 فورًا،
+    ويضع التحديث في طابور محدود؛ خيط مستهلك يمرّره إلى bot.process_new_updates
+    (ومنه إلى مسارات المعالجات). عند امتلاء الطابور يرد 503 فيعيد تيليجرام الإرسال لاحقًا.
+"""
+import hmac
+import json
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_QUEUE_SIZE
+from services import metrics
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+METRICS_PATH = "/metrics"
+_BATCH_SIZE = 100
+
+_updates = queue.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+_bot = None
+_stats = {"accepted": 0, "rejected": 0, "dropped": 0}
+
+
+def queue_depth() -> int:
+    return _updates.qsize()
+
+
+def ingress_stats() -> dict:
+    return dict(_stats, queued=_updates.qsize())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass  # منع طباعة السجلات غير الضرورية
+
+    def _reply(self, code, body=b"OK", content_type="text/plain; charset=utf-8"):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == METRICS_PATH:
+            body = metrics.render().encode("utf-8")
+            return self._reply(200, body, "text/plain; version=0.0.4; charset=utf-8")
+        self._reply(200)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def do_POST(self):
+        if _bot is None or self.path != WEBHOOK_PATH:
+            return self._reply(404, b"Not Found")
+        # المقارنة دائمًا (السر غير فارغ أبدًا، انظر config)
+        token = self.headers.get(SECRET_HEADER) or ""
+        if not hmac.compare_digest(token.encode(), WEBHOOK_SECRET.encode()):
+            _stats["rejected"] += 1
+            return self._reply(403, b"Forbidden")
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            update = types.Update.de_json(json.loads(self.rfile.read(length)))
+        except Exception:
+            _stats["rejected"] += 1
+            return self._reply(400, b"Bad Request")
+        try:
+            _updates.put_nowait(update)
+        except queue.Full:
+            _stats["dropped"] += 1
+            return self._reply(503, b"Busy")
+        _stats["accepted"] += 1
+        self._reply(200)
+
+
+def _consume():
+    while True:
+        batch = [_updates.get()]
+        while len(batch) < _BATCH_SIZE:
+            try:
+                batch.append(_updates.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _bot.process_new_updates(batch)
+        except Exception:
+            logging.exception("[WEBHOOK] خطأ أثناء تمرير التحديثات")
+
+
+def start_http_server(port: int, bot=None, block: bool = False):
+    """
+    يشغّل الخادم على port. إذا مُرّر bot يُفعَّل استقبال webhook.
+    block=True يشغّله في الخيط الحالي (وضع webhook)، وإلا في خيط خلفي.
+    """
+    global _bot
+    if bot is not None:
+        _bot = bot
+        threading.Thread(target=_consume, name="WebhookConsumer", daemon=True).start()
+    httpd = ThreadingHTTPServer(("", port), _Handler)
+    httpd.daemon_threads = True
+    print(f"🔌 HTTP server listening on port {port}")
+    if block:
+        httpd.serve_forever()
+    else:
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def set_webhook(bot, **kwargs):
+    """تسجيل عنوان webhook لدى تيليجرام مع secret_token."""
+    url = WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH
+    bot.remove_webhook()
+    bot.set_webhook(url=url, secret_token=WEBHOOK_SECRET, **kwargs)
+    logging.info(f"[WEBHOOK] تم تسجيل {url}")
@@ -0,0 +1,291 @@
+# services/ledger_writer.py
+"""
+كاتب السجلات المؤجَّل (write-behind) لجداول الإلحاق فقط (transactions, purchases):
+- append(table, row) يكتب الصف في journal محلي (JSONL + fsync) ويعود فورًا؛
+  المستخدم لا ينتظر رحلة إلى قاعدة البيانات.
+- خيط خلفي يدرج الصفوف المتراكمة بإدراج متعدد الصفوف لكل جدول عند امتلاء
+  LEDGER_BATCH_SIZE أو كل LEDGER_FLUSH_SECONDS.
+- بعد كل دفعة ناجحة يُحدَّث checkpoint (آخر seq مُدرج)، ويُفرَّغ الـ journal
+  متى لم يبق فيه شيء معلق.
+- start() يعيد تشغيل ما بعد الـ checkpoint من الـ journal (بعد restart_bot أو انهيار).
+  كل صف يحمل ledger_id يولَّد عند append، والإدراج upsert بـ ignore-duplicates على
+  هذا العمود؛ فإعادة دفعة أُدرجت قبل الانهيار لا تكرر الصفوف.
+- دفعة يرفضها الخادم (قيد، عمود ناقص...) LEDGER_MAX_ATTEMPTS مرة تُجزَّأ صفًا صفًا؛
+  الصف المرفوض وحده يُنقل إلى ملف dead-letter (<journal>.dead) ولا يوقف بقية الجدول.
+  أخطاء الشبكة لا تُحسب: الصفوف تنتظر عودة الاتصال.
+- start() يتحقق أولًا من وجود عمود ledger_id في LEDGER_TABLES؛ إن غاب (لم تُطبَّق
+  الخطوة 9 في wallet_service) لا يعمل الكاتب المؤجل: ما بقي في الـ journal يُدرج
+  مباشرة، و append يدرج بإدراج عادي بدون ledger_id (بدل رفض كل دفعة ونقلها إلى .dead).
+
+قبل start() (سكربتات، اختبارات) يُدرج append مباشرة كما في السابق.
+"""
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+
+from database.db import get_table
+
+LEDGER_JOURNAL = os.getenv("LEDGER_JOURNAL", "data/ledger.jsonl")
+LEDGER_BATCH_SIZE = int(os.getenv("LEDGER_BATCH_SIZE", "200"))
+LEDGER_FLUSH_SECONDS = float(os.getenv("LEDGER_FLUSH_SECONDS", "1"))
+LEDGER_FSYNC = os.getenv("LEDGER_FSYNC", "1") == "1"
+LEDGER_MAX_ATTEMPTS = int(os.getenv("LEDGER_MAX_ATTEMPTS", "5"))
+
+# عمود مفتاح التكرار (فهرس فريد، انظر wallet_service)
+LEDGER_ID_COLUMN = "ledger_id"
+LEDGER_TABLES = ("transactions", "purchases")
+
+_lock = threading.Lock()        # الـ journal والمخزن المؤقت
+_flush_lock = threading.Lock()  # دفعة واحدة في كل مرة
+_wake = threading.Event()
+_buffer = []                    # [(seq, table, row)] بترتيب seq
+_seq = 0
+_journal = None
+_path = None
+_attempts = {}                  # أول seq في الدفعة المرفوضة -> عدد مرات الرفض
+_idempotent = True              # False: عمود ledger_id غير موجود ← إدراج عادي متزامن
+_stats = {"appended": 0, "flushed": 0, "batches": 0, "failures": 0, "replayed": 0, "dead": 0, "sync": 0}
+
+
+def _checkpoint_path():
+    return _path + ".ckpt"
+
+
+def _read_checkpoint():
+    try:
+        with open(_checkpoint_path(), "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _write_checkpoint(seq):
+    tmp = _checkpoint_path() + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(str(seq))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _checkpoint_path())
+
+
+def _dead_letter(table, rows, error):
+    with open(_path + ".dead", "a", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps({"table": table, "row": row, "error": str(error)}, ensure_ascii=False, default=str) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_line(entry):
+    _journal.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+    _journal.flush()
+    if LEDGER_FSYNC:
+        os.fsync(_journal.fileno())
+
+
+def _read_journal(path, checkpoint):
+    """(آخر seq، الصفوف بعد الـ checkpoint) من الـ journal."""
+    last, entries = checkpoint, []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # سطر أخير ناقص من انهيار أثناء الكتابة
+                last = max(last, entry["seq"])
+                if entry["seq"] > checkpoint:
+                    entries.append((entry["seq"], entry["table"], entry["row"]))
+    return last, entries
+
+
+def _missing_ledger_id():
+    """جداول LEDGER_TABLES التي لا تحوي عمود ledger_id (خطأ شبكة لا يُعد غيابًا)."""
+    missing = []
+    for table in LEDGER_TABLES:
+        try:
+            get_table(table).select(LEDGER_ID_COLUMN).limit(1).execute()
+        except APIError as e:
+            logging.error(f"[LEDGER] {table}.{LEDGER_ID_COLUMN}: {e}")
+            missing.append(table)
+        except Exception as e:
+            logging.warning(f"[LEDGER] تعذر فحص {table}.{LEDGER_ID_COLUMN}: {e}")
+    return missing
+
+
+def _start_sync(path):
+    """بدون ledger_id: إدراج ما بقي في الـ journal مباشرة ثم append متزامن."""
+    global _idempotent, _path
+    _idempotent = False
+    _path = path
+    _stats["sync"] = 1
+    last, entries = _read_journal(path, _read_checkpoint())
+    if not entries:
+        return
+    try:
+        for table in dict.fromkeys(table for _, table, _ in entries):
+            _insert(table, [row for _, t, row in entries if t == table])
+    except Exception:
+        logging.exception(f"[LEDGER] تعذر إدراج {len(entries)} صف من {path}؛ تبقى فيه")
+        return
+    _write_checkpoint(last)
+    open(path, "w", encoding="utf-8").close()
+    _stats["replayed"] = len(entries)
+    logging.info(f"[LEDGER] أُدرج {len(entries)} صف من {path} مباشرة")
+
+
+def start(path=LEDGER_JOURNAL):
+    """فتح الـ journal وإعادة ما لم يُدرج بعد، ثم تشغيل خيط الدفعات."""
+    global _journal, _path, _seq
+    if _journal is not None:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    missing = _missing_ledger_id()
+    if missing:
+        logging.error(
+            f"[LEDGER] العمود {LEDGER_ID_COLUMN} غير موجود في {', '.join(missing)} "
+            "(الخطوة 9 في wallet_service): إدراج متزامن بدون journal"
+        )
+        _start_sync(path)
+        return
+    with _lock:
+        if _journal is not None:
+            return
+        _path = path
+        _seq, entries = _read_journal(path, _read_checkpoint())
+        _buffer.extend(entries)
+        _stats["replayed"] = len(_buffer)
+        _journal = open(path, "a", encoding="utf-8")
+    threading.Thread(target=_flush_loop, name="LedgerWriter", daemon=True).start()
+    if _buffer:
+        logging.info(f"[LEDGER] إعادة {len(_buffer)} صف من {path}")
+        _wake.set()
+
+
+def append(table, row):
+    """يضيف صفًا إلى السجل؛ يعود بعد حفظه محليًا (أو بعد الإدراج إن لم يبدأ الكاتب)."""
+    global _seq
+    if _idempotent:
+        row.setdefault(LEDGER_ID_COLUMN, uuid.uuid4().hex)
+    with _lock:
+        if _journal is not None:
+            _seq += 1
+            _write_line({"seq": _seq, "table": table, "row": row})
+            _buffer.append((_seq, table, row))
+            _stats["appended"] += 1
+            full = len(_buffer) >= LEDGER_BATCH_SIZE
+        else:
+            full = None
+    if full is None:
+        _insert(table, [row])
+    elif full:
+        _wake.set()
+
+
+def _insert(table, rows):
+    if not _idempotent:
+        rows = [{k: v for k, v in row.items() if k != LEDGER_ID_COLUMN} for row in rows]
+        get_table(table).insert(rows, returning=ReturnMethod.minimal).execute()
+        return
+    get_table(table).upsert(
+        rows, on_conflict=LEDGER_ID_COLUMN, ignore_duplicates=True, returning=ReturnMethod.minimal
+    ).execute()
+
+
+def _isolate(table, chunk, done):
+    """إدراج صفًا صفًا بعد تكرار رفض الدفعة؛ المرفوض يذهب إلى dead-letter. False = خطأ شبكة."""
+    for seq, _, row in chunk:
+        try:
+            _insert(table, [row])
+        except APIError as e:
+            _dead_letter(table, [row], e)
+            _stats["dead"] += 1
+            logging.error(f"[LEDGER] صف مرفوض نُقل إلى {_path}.dead ({table}): {e}")
+        except Exception:
+            return False
+        done.add(seq)
+    return True
+
+
+def _flush_loop():
+    while True:
+        _wake.wait(LEDGER_FLUSH_SECONDS)
+        _wake.clear()
+        try:
+            flush()
+        except Exception:
+            logging.exception("[LEDGER] فشل إدراج الدفعة")
+
+
+def flush() -> int:
+    """يدرج كل الصفوف المعلقة (إدراج متعدد لكل جدول)؛ يعيد عدد المُدرج."""
+    global _journal
+    with _flush_lock:
+        with _lock:
+            batch = list(_buffer)
+        if not batch:
+            return 0
+        groups = OrderedDict()
+        for entry in batch:
+            groups.setdefault(entry[1], []).append(entry)
+        done = set()
+        for table, entries in groups.items():
+            for i in range(0, len(entries), LEDGER_BATCH_SIZE):
+                chunk = entries[i:i + LEDGER_BATCH_SIZE]
+                try:
+                    _insert(table, [row for _, _, row in chunk])
+                except APIError as e:
+                    # رفض من الخادم: بعد LEDGER_MAX_ATTEMPTS نعزل الصف المسبب
+                    _stats["failures"] += 1
+                    key = chunk[0][0]
+                    _attempts[key] = _attempts.get(key, 0) + 1
+                    if _attempts[key] < LEDGER_MAX_ATTEMPTS:
+                        logging.warning(f"[LEDGER] رُفضت دفعة {len(chunk)} صف في {table} ({_attempts[key]}/{LEDGER_MAX_ATTEMPTS}): {e}")
+                        break
+                    _attempts.pop(key)
+                    if not _isolate(table, chunk, done):
+                        break
+                    continue
+                except Exception as e:
+                    _stats["failures"] += 1
+                    logging.warning(f"[LEDGER] تعذر إدراج {len(chunk)} صف في {table}، ستُعاد المحاولة: {e}")
+                    break
+                _attempts.pop(chunk[0][0], None)
+                done.update(seq for seq, _, _ in chunk)
+                _stats["batches"] += 1
+        with _lock:
+            _buffer[:] = [entry for entry in _buffer if entry[0] not in done]
+            _stats["flushed"] += len(done)
+            # checkpoint = آخر seq قبل أول صف ما زال معلقًا
+            _write_checkpoint(_buffer[0][0] - 1 if _buffer else _seq)
+            if not _buffer and _journal is not None:
+                _journal.close()
+                _journal = open(_path, "w", encoding="utf-8")
+        return len(done)
+
+
+def close():
+    """دفعة أخيرة قبل الإغلاق أو إعادة التشغيل (ما يفشل يبقى في الـ journal)."""
+    if _journal is not None:
+        flush()
+
+
+def pending_rows(table, user_id):
+    """صفوف المستخدم التي لم تُدرج بعد (بترتيب الإضافة)."""
+    with _lock:
+        return [row for _, t, row in _buffer if t == table and row.get("user_id") == user_id]
+
+
+def pending() -> int:
+    return len(_buffer)
+
+
+def stats() -> dict:
+    with _lock:
+        return dict(_stats, pending=len(_buffer), seq=_seq)
@@ -0,0 +1,239 @@
+# services/metrics.py
+"""
+مقاييس تشغيلية بصيغة Prometheus النصية على GET /metrics (منفذ http_server نفسه):
+- bot_handler_seconds{handler}                   زمن كل معالج (histogram)
+- db_request_seconds{table} / db_requests_total{table,method,status}
+- telegram_request_seconds{method} / telegram_requests_total{method,status}
+  (status="429" ← تجاوز حد تيليجرام)
+- مقاييس لحظية تُحسب عند الطلب فقط: طابور الطلبات (العمق وعمر الأقدم)،
+  SessionStore، مسارات المعالجات، مجمّع اتصالات DB، طابور webhook، الإرسال.
+
+التسجيل على المسار الساخن: bisect + زيادة أعداد تحت قفل واحد؛ render() ينسخ
+الأعداد ويبني النص (بضع مئات من الأسطر) فلا بأس بالسحب كل بضع ثوانٍ.
+
+    from services import metrics
+    metrics.install(bot)      # بعد تسجيل المعالجات وتهيئة الطابور
+"""
+import bisect
+import functools
+import logging
+import threading
+import time
+
+from handlers.registry import HANDLER_LISTS
+from handlers.router import routed_handler
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_histograms = {}  # name -> (help, label_names, {labels: [bucket counts..., sum, count]})
+_counters = {}    # name -> (help, label_names, {labels: value})
+_gauges = []      # (name, help, func) ؛ func() -> رقم أو [(labels dict, قيمة)]
+
+
+def _histogram(name, help_text, label_names):
+    _histograms[name] = (help_text, label_names, {})
+
+
+def _counter(name, help_text, label_names):
+    _counters[name] = (help_text, label_names, {})
+
+
+_histogram("bot_handler_seconds", "زمن تنفيذ معالجات التحديثات", ("handler",))
+_counter("bot_handler_errors_total", "استثناءات المعالجات", ("handler",))
+_histogram("db_request_seconds", "زمن طلبات PostgREST لكل جدول", ("table",))
+_counter("db_requests_total", "طلبات PostgREST", ("table", "method", "status"))
+_histogram("telegram_request_seconds", "زمن استدعاءات Bot API", ("method",))
+_counter("telegram_requests_total", "استدعاءات Bot API حسب النتيجة", ("method", "status"))
+
+
+def observe(name, labels, seconds):
+    series = _histograms[name][2]
+    index = bisect.bisect_left(_BUCKETS, seconds)
+    with _lock:
+        values = series.get(labels)
+        if values is None:
+            values = series[labels] = [0] * (len(_BUCKETS) + 2)
+        values[index] += 1  # index == len(_BUCKETS) ← فوق أكبر حد (+Inf فقط)
+        values[-2] += seconds
+        values[-1] += 1
+
+
+def inc(name, labels, amount=1):
+    series = _counters[name][2]
+    with _lock:
+        series[labels] = series.get(labels, 0) + amount
+
+
+def gauge(name, help_text, func):
+    _gauges.append((name, help_text, func))
+
+
+# ---------- مصادر القياس ----------
+def observe_db(path, method, status, seconds):
+    """path بصيغة /rest/v1/<table> أو /rest/v1/rpc/<fn>."""
+    table = path.split("/rest/v1/", 1)[-1].strip("/") or "?"
+    observe("db_request_seconds", (table,), seconds)
+    inc("db_requests_total", (table, method, str(status)))
+
+
+def _handler_name(func):
+    return f"{getattr(func, '__module__', '?')}.{getattr(func, '__name__', '?')}"
+
+
+def _timed(func):
+    @functools.wraps(func)
+    def timed(update, *args, **kwargs):
+        t0 = time.perf_counter()
+        failed = False
+        try:
+            return func(update, *args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # معالج الموجّه يُسمّى باسم المعالج الذي اختاره لهذا التحديث
+            name = _handler_name(routed_handler(update) or func)
+            observe("bot_handler_seconds", (name,), time.perf_counter() - t0)
+            if failed:
+                inc("bot_handler_errors_total", (name,))
+
+    timed._metered = True
+    return timed
+
+
+def instrument_bot(bot):
+    """
+    يلف دوال المعالجات المسجلة في قوائم telebot بمؤقت باسم المعالج.
+    يُستدعى بعد registry.freeze(bot): لا يُضاف بعده معالج غير مُقاس.
+    """
+    for list_name in HANDLER_LISTS:
+        for handler in getattr(bot, list_name, ()):
+            if not getattr(handler["function"], "_metered", False):
+                handler["function"] = _timed(handler["function"])
+
+
+def instrument_telegram():
+    """يلف apihelper._make_request: كل استدعاءات Bot API تمر من هنا."""
+    from telebot import apihelper
+
+    make_request = apihelper._make_request
+    if getattr(make_request, "_metered", False):
+        return
+
+    def _make_request(token, method_name, method="get", params=None, files=None):
+        t0 = time.perf_counter()
+        status = "ok"
+        try:
+            return make_request(token, method_name, method, params=params, files=files)
+        except apihelper.ApiTelegramException as e:
+            status = str(e.error_code)
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            observe("telegram_request_seconds", (method_name,), time.perf_counter() - t0)
+            inc("telegram_requests_total", (method_name, status))
+
+    _make_request._metered = True
+    apihelper._make_request = _make_request
+
+
+def _register_default_gauges(bot):
+    from database.db import pool_stats
+    from services import cleanup_service, http_server, ledger_writer, queue_service, send_scheduler, wallet_service
+    from services.executor_service import ShardedWorkerPool
+    from services.session_store import store
+
+    gauge("queue_pending_requests", "طلبات الطابور المفتوحة", queue_service.queue_size)
+    gauge("queue_oldest_age_seconds", "عمر أقدم طلب في الطابور", queue_service.oldest_age)
+    gauge("session_store", "حجم SessionStore", lambda: [
+        ({"kind": key}, value) for key, value in store.counters().items()
+    ])
+    gauge("db_pool", "مجمّع اتصالات PostgREST", lambda: [
+        ({"kind": key}, value) for key, value in pool_stats().items() if key != "http2"
+    ])
+    gauge("webhook_ingress", "طابور تحديثات webhook", lambda: [
+        ({"kind": key}, value) for key, value in http_server.ingress_stats().items()
+    ])
+    gauge("ledger_writer", "كاتب السجل المؤجل", lambda: [
+        ({"kind": key}, value) for key, value in ledger_writer.stats().items()
+    ])
+    gauge("wallet_history", "نسخ آخر المشتريات والحركات في الذاكرة", lambda: [
+        ({"kind": kind, "stat": key}, value)
+        for kind, recent in (("purchases", wallet_service._recent_purchases),
+                             ("transactions", wallet_service._recent_transactions))
+        for key, value in dict(recent.stats, users=len(recent)).items()
+    ])
+    gauge("purchase_sweeper", "كنس المشتريات المنتهية", lambda: [
+        ({"kind": key}, value) for key, value in cleanup_service.sweep_stats.items()
+    ])
+    gauge("send_scheduler", "مجدول الإرسال", lambda: [
+        ({"kind": key}, value) for key, value in send_scheduler.stats().items()
+    ])
+
+    def lanes():
+        pool = getattr(bot, "worker_pool", None)
+        if not isinstance(pool, ShardedWorkerPool):
+            return []
+        return [
+            ({"kind": "total"}, len(pool.lanes)),
+            ({"kind": "busy"}, pool.busy_lanes()),
+            ({"kind": "queued"}, sum(pool.lane_depths())),
+        ]
+
+    gauge("handler_lanes", "مسارات تنفيذ المعالجات", lanes)
+
+
+def install(bot):
+    instrument_bot(bot)
+    instrument_telegram()
+    _register_default_gauges(bot)
+
+
+# ---------- الإخراج ----------
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render() -> str:
+    with _lock:
+        histograms = {name: (h, n, {k: list(v) for k, v in s.items()}) for name, (h, n, s) in _histograms.items()}
+        counters = {name: (h, n, dict(s)) for name, (h, n, s) in _counters.items()}
+    lines = []
+    for name, (help_text, names, series) in histograms.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, values in series.items():
+            cumulative = 0
+            for bound, count in zip(_BUCKETS, values):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_labels(names, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{_labels(names, labels, le)} {values[-1]}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {values[-2]:.6f}")
+            lines.append(f"{name}_count{_labels(names, labels)} {values[-1]}")
+    for name, (help_text, names, series) in counters.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in series.items():
+            lines.append(f"{name}{_labels(names, labels)} {value}")
+    for name, help_text, func in _gauges:
+        try:
+            value = func()
+        except Exception as e:
+            logging.warning(f"[METRICS] تعذر حساب {name}: {e}")
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        if isinstance(value, (int, float)):
+            lines.append(f"{name} {value}")
+        else:
+            for labels, v in value:
+                lines.append(f"{name}{_labels(labels.keys(), labels.values())} {v}")
+    return "\n".join(lines) + "\n"
@@ -1,15 +1,189 @@
 # services/notification_service.py
 # خدمة إرسال إشعارات للمستخدمين أو المسؤولين
+# الإرسال يمر عبر send_scheduler (غير حاجب ويحترم حدود تيليجرام)
+import json
+import logging
+import os
+import threading
+import time
+
+from telebot.apihelper import ApiTelegramException
 from config import ADMIN_MAIN_ID, ADMIN_MAIN_USERNAME
+from database.db import get_table
+from services import send_scheduler
 
 def notify_admin(bot, text):
-    try:
-        bot.send_message(ADMIN_MAIN_ID, f"📣 إشعار من البوت ({ADMIN_MAIN_USERNAME}):\n{text}")
-    except Exception as e:
-        print(f"❌ فشل في إرسال إشعار للأدمن: {e}")
+    send_scheduler.send_message(
+        bot, ADMIN_MAIN_ID, f"📣 إشعار من البوت ({ADMIN_MAIN_USERNAME}):\n{text}",
+        on_error=lambda e: print(f"❌ فشل في إرسال إشعار للأدمن: {e}"),
+    )
 
 def notify_user(bot, user_id, text):
-    try:
-        bot.send_message(user_id, text)
-    except Exception as e:
-        print(f"❌ فشل في إرسال رسالة للمستخدم {user_id}: {e}")
+    send_scheduler.send_message(
+        bot, user_id, text,
+        on_error=lambda e: print(f"❌ فشل في إرسال رسالة للمستخدم {user_id}: {e}"),
+    )
+
+# =====================================
+#   البث الجماعي (broadcast)
+# =====================================
+BROADCAST_DIR = "data/broadcasts"
+BROADCAST_PAGE_SIZE = 500
+BROADCAST_WINDOW = 60   # أقصى عدد رسائل بث في طابور الإرسال معًا (حتى لا تتأخر رسائل المعالجات)
+BROADCAST_KEEP_DONE = 60   # عدد البثوث المكتملة المحفوظة في completed.json (الأقدم يُحذف)
+BROADCAST_STALE_DAYS = 7   # نقاط حفظ لم تُستأنف منذ هذه المدة تُحذف
+
+def iter_user_ids(page_size: int = BROADCAST_PAGE_SIZE, after: int = 0):
+    """صفحات keyset من user_id في جدول المستخدمين (بدون select * ولا offset)."""
+    while True:
+        rows = (
+            get_table("houssin363")
+            .select("user_id")
+            .gt("user_id", after)
+            .order("user_id")
+            .limit(page_size)
+            .execute()
+            .data
+        ) or []
+        if not rows:
+            return
+        yield [r["user_id"] for r in rows]
+        if len(rows) < page_size:
+            return
+        after = rows[-1]["user_id"]
+
+def _checkpoint_path(broadcast_id):
+    return os.path.join(BROADCAST_DIR, f"{broadcast_id}.json")
+
+def _load_checkpoint(broadcast_id):
+    if not broadcast_id or not os.path.isfile(_checkpoint_path(broadcast_id)):
+        return None
+    with open(_checkpoint_path(broadcast_id), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _save_checkpoint(broadcast_id, state):
+    if not broadcast_id:
+        return
+    os.makedirs(BROADCAST_DIR, exist_ok=True)
+    tmp = _checkpoint_path(broadcast_id) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, _checkpoint_path(broadcast_id))
+
+def _completed_path():
+    return os.path.join(BROADCAST_DIR, "completed.json")
+
+def _load_completed():
+    """{broadcast_id: counts} لآخر BROADCAST_KEEP_DONE بث مكتمل."""
+    if not os.path.isfile(_completed_path()):
+        return {}
+    with open(_completed_path(), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _finish_checkpoint(broadcast_id, counts):
+    """
+    بث مكتمل: يُسجَّل اسمه في completed.json (محدود العدد) وتُحذف نقطة حفظه،
+    مع حذف نقاط الحفظ المتروكة (مثل تحذيرات يوم سابق انقطعت ولن تُستأنف).
+    """
+    if not broadcast_id:
+        return
+    os.makedirs(BROADCAST_DIR, exist_ok=True)
+    completed = _load_completed()
+    completed.pop(broadcast_id, None)
+    completed[broadcast_id] = counts
+    completed = dict(list(completed.items())[-BROADCAST_KEEP_DONE:])
+    tmp = _completed_path() + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(completed, f, ensure_ascii=False)
+    os.replace(tmp, _completed_path())
+
+    stale = time.time() - BROADCAST_STALE_DAYS * 86400
+    for name in os.listdir(BROADCAST_DIR):
+        path = os.path.join(BROADCAST_DIR, name)
+        if path == _completed_path():
+            continue
+        try:
+            if path.startswith(_checkpoint_path(broadcast_id)) or os.path.getmtime(path) < stale:
+                os.remove(path)
+        except FileNotFoundError:
+            pass  # بث آخر استبدل ملفه في اللحظة نفسها
+
+def broadcast(bot, text, user_ids=None, broadcast_id=None, page_size: int = BROADCAST_PAGE_SIZE, **send_kwargs):
+    """
+    يرسل text إلى مجموعة مستخدمين ويعيد العدّادات {delivered, blocked, failed, skipped}.
+    - text: نص ثابت أو دالة user_id -> نص (None = تخطي المستخدم).
+    - user_ids: قائمة صريحة، أو None لكل المستخدمين (صفحات من الجدول).
+    - broadcast_id: اسم نقطة الحفظ؛ بعد إعادة التشغيل يستأنف البث من آخر صفحة مكتملة،
+      وبعد اكتماله تُحذف نقطة الحفظ ويبقى اسمه وعدّاداته في completed.json.
+    الإرسال متوازٍ عبر send_scheduler ضمن حدود تيليجرام؛ الدالة تحجب حتى النهاية
+    لذلك تُشغَّل عادة في خيط (broadcast_async).
+    """
+    completed = _load_completed() if broadcast_id else {}
+    if broadcast_id in completed:
+        return completed[broadcast_id]
+    state = _load_checkpoint(broadcast_id) or {
+        "after": 0, "offset": 0,
+        "counts": {"delivered": 0, "blocked": 0, "failed": 0, "skipped": 0},
+    }
+    counts = state["counts"]
+    if state.get("done"):  # نقطة حفظ مكتملة من الإصدار السابق
+        _finish_checkpoint(broadcast_id, counts)
+        return counts
+
+    if user_ids is None:
+        pages = iter_user_ids(page_size, after=state["after"])
+    else:
+        user_ids = list(user_ids)
+        pages = (user_ids[i:i + page_size] for i in range(state["offset"], len(user_ids), page_size))
+
+    lock = threading.Lock()
+    window = threading.BoundedSemaphore(BROADCAST_WINDOW)
+
+    def _done(key):
+        with lock:
+            counts[key] += 1
+        window.release()
+
+    def _error(exc):
+        blocked = isinstance(exc, ApiTelegramException) and exc.error_code in (400, 403)
+        _done("blocked" if blocked else "failed")
+
+    for page in pages:
+        for user_id in page:
+            body = text(user_id) if callable(text) else text
+            if not body:
+                counts["skipped"] += 1
+                continue
+            window.acquire()
+            send_scheduler.send_message(
+                bot, user_id, body,
+                callback=lambda _res: _done("delivered"),
+                on_error=_error,
+                **send_kwargs,
+            )
+        # انتظار اكتمال الصفحة قبل حفظ نقطة الاستئناف
+        for _ in range(BROADCAST_WINDOW):
+            window.acquire()
+        for _ in range(BROADCAST_WINDOW):
+            window.release()
+        state["after"] = page[-1] if user_ids is None else state["after"]
+        state["offset"] += len(page)
+        _save_checkpoint(broadcast_id, state)
+        logging.info(f"[BROADCAST] {broadcast_id or '-'}: {state['offset']} مستخدم، {counts}")
+
+    _finish_checkpoint(broadcast_id, counts)
+    return counts
+
+def broadcast_async(bot, text, user_ids=None, broadcast_id=None, on_finish=None, **kwargs):
+    """تشغيل broadcast في خيط خلفي؛ on_finish(counts) عند الانتهاء."""
+    def run():
+        try:
+            counts = broadcast(bot, text, user_ids=user_ids, broadcast_id=broadcast_id, **kwargs)
+        except Exception:
+            logging.exception(f"[BROADCAST] توقف البث {broadcast_id or '-'}")
+            return
+        if on_finish is not None:
+            on_finish(counts)
+    t = threading.Thread(target=run, name=f"Broadcast-{broadcast_id or 'adhoc'}", daemon=True)
+    t.start()
+    return t
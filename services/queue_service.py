@@ -1,15 +1,170 @@
 import time
+import heapq
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 import httpx
 import threading
-from database.db import client
+from database.db import get_table
 from config import ADMIN_MAIN_ID
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 QUEUE_TABLE = "pending_requests"
 _queue_lock = threading.Lock()
-_queue_cooldown = False  # يمنع إظهار أكثر من طلب
+
+# نسخة داخل الذاكرة من جدول الطابور:
+# - _requests: id -> الصف كما في الجدول
+# - _heap: (وقت الإنشاء، id) ؛ العناصر القديمة (بعد حذف/تأجيل) تُتجاهل عند السحب
+_requests = {}
+_heap = []
+_open_by_user = {}  # user_id -> عدد طلباته المفتوحة (فهرس has_pending_request)
+_loaded = False
+_bot = None
+_current_request_id = None  # الطلب المعروض حاليًا على الأدمن (None = الأدمن متفرغ)
+_load_lock = threading.Lock()  # تحميل واحد من الجدول في كل مرة
+_journal = None  # أثناء التحميل: ما أُضيف/حُذف في الذاكرة وقد لا تراه لقطة SELECT
+
+
+def _sort_key(row):
+    """مفتاح الترتيب: created_at كتوقيت UTC ثم id لكسر التعادل."""
+    value = row.get("created_at") or ""
+    try:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        if ts.tzinfo is not None:
+            ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    except ValueError:
+        ts = datetime.min
+    return (ts, row.get("id") or 0)
+
+
+def _push(row):
+    if _journal is not None:
+        _journal.append((_push, row))
+    if row["id"] not in _requests:
+        user_id = row.get("user_id")
+        _open_by_user[user_id] = _open_by_user.get(user_id, 0) + 1
+    _requests[row["id"]] = row
+    heapq.heappush(_heap, (_sort_key(row), row["id"]))
+
+
+def _drop(request_id):
+    if _journal is not None:
+        _journal.append((_drop, request_id))
+    row = _requests.pop(request_id, None)
+    if row is None:
+        return
+    user_id = row.get("user_id")
+    count = _open_by_user.get(user_id, 0) - 1
+    if count > 0:
+        _open_by_user[user_id] = count
+    else:
+        _open_by_user.pop(user_id, None)
+
+
+def _load_rows():
+    global _loaded, _current_request_id, _journal
+    with _load_lock:
+        with _queue_lock:
+            _journal = []
+        try:
+            rows = get_table(QUEUE_TABLE).select("*").order("created_at").execute().data or []
+        except Exception:
+            with _queue_lock:
+                _journal = None
+            raise
+        with _queue_lock:
+            changes, _journal = _journal, None
+            _requests.clear()
+            _heap.clear()
+            _open_by_user.clear()
+            for row in rows:
+                _push(row)
+            # ما جرى بين SELECT وهذه اللحظة يُعاد فوق اللقطة (إضافة مكررة أو حذف غائب لا يضر)
+            for op, arg in changes:
+                op(arg)
+            _loaded = True
+            # الطلب المعروض حُذف من الجدول (يدويًا مثلًا) ← الأدمن متفرغ
+            if _current_request_id not in _requests:
+                _current_request_id = None
+    return rows
+
+
+def _peek():
+    """رأس الطابور بعد إسقاط العناصر القديمة (O(1) مطفأ)."""
+    while _heap:
+        key, request_id = _heap[0]
+        row = _requests.get(request_id)
+        if row is not None and _sort_key(row) == key:
+            return row
+        heapq.heappop(_heap)
+    return None
+
+
+def init_queue(bot):
+    """تحميل الطابور من الجدول مرة واحدة عند الإقلاع ثم عرض أول طلب على الأدمن."""
+    global _bot
+    _bot = bot
+    rows = _load_rows()
+    logging.info(f"[QUEUE] تم تحميل {len(rows)} طلب معلق")
+    process_queue(bot)
+
+
+def reconcile_queue():
+    """إعادة مطابقة النسخة داخل الذاكرة مع الجدول (تعديلات يدوية أو حذف بالتتالي)."""
+    before = len(_requests)
+    rows = _load_rows()
+    if len(rows) != before:
+        logging.info(f"[QUEUE] مطابقة: {before} ← {len(rows)} طلب معلق")
+    process_queue()
+
+
+def start_reconciler(interval: int):
+    """مطابقة دورية اختيارية (interval <= 0 يعطّلها)."""
+    if interval <= 0:
+        return
+
+    def _loop():
+        while True:
+            time.sleep(interval)
+            try:
+                reconcile_queue()
+            except Exception:
+                logging.exception("[QUEUE] فشل مطابقة الطابور")
+
+    threading.Thread(target=_loop, name="QueueReconciler", daemon=True).start()
+
+
+def has_pending_request(user_id: int) -> bool:
+    """هل لدى المستخدم طلب قيد الانتظار؟ O(1) من الفهرس، ومن الجدول قبل التحميل."""
+    if _loaded:
+        return user_id in _open_by_user
+    res = get_table(QUEUE_TABLE).select("id").eq("user_id", user_id).limit(1).execute()
+    return bool(res.data)
+
+
+def queue_size() -> int:
+    return len(_requests)
+
+
+def oldest_age() -> float:
+    """عمر أقدم طلب مفتوح بالثواني (0 إن كان الطابور فارغًا)."""
+    with _queue_lock:
+        row = _peek()
+    if row is None:
+        return 0.0
+    created = _sort_key(row)[0]
+    if created == datetime.min:
+        return 0.0
+    return max(0.0, (datetime.utcnow() - created).total_seconds())
+
+
+def get_request(request_id: int):
+    """الطلب من النسخة داخل الذاكرة، ومن الجدول إن لم يكن محمّلًا."""
+    row = _requests.get(request_id)
+    if row is not None:
+        return row
+    res = get_table(QUEUE_TABLE).select("*").eq("id", request_id).execute()
+    return res.data[0] if res.data else None
+
 
 def add_pending_request(user_id: int, username: str, request_text: str, payload=None):
     for attempt in range(1, 4):
@@ -22,36 +177,32 @@ def add_pending_request(user_id: int, username: str, request_text: str, payload=
             }
             if payload is not None:
                 data["payload"] = payload
-            client.table(QUEUE_TABLE).insert(data).execute()
+            res = get_table(QUEUE_TABLE).insert(data).execute()
+            if res.data:
+                with _queue_lock:
+                    _push(res.data[0])
+                process_queue()
             return
         except httpx.ReadError as e:
             logging.warning(f"Attempt {attempt}: ReadError in add_pending_request: {e}")
             time.sleep(0.5)
     logging.error(f"Failed to add pending request for user {user_id} after 3 attempts.")
-    
+
 def delete_pending_request(request_id: int):
+    global _current_request_id
     try:
-        client.table(QUEUE_TABLE).delete().eq("id", request_id).execute()
+        get_table(QUEUE_TABLE).delete().eq("id", request_id).execute()
     except Exception:
         logging.exception(f"Error deleting pending request {request_id}")
+        return
+    with _queue_lock:
+        _drop(request_id)
+        if _current_request_id == request_id:
+            _current_request_id = None
 
 def get_next_request():
-    try:
-        res = (
-            client.table(QUEUE_TABLE)
-            .select("*")
-            .order("created_at")
-            .limit(1)
-            .execute()
-        )
-        data = res.data or []
-        return data[0] if data else None
-    except httpx.ReadError as e:
-        logging.warning(f"ReadError in get_next_request: {e}")
-        return None
-    except Exception:
-        logging.exception("Unexpected error in get_next_request")
-        return None
+    with _queue_lock:
+        return _peek()
 
 def update_request_admin_message_id(request_id: int, message_id: int):
     logging.debug(f"Skipping update_request_admin_message_id for request {request_id}")
@@ -59,46 +210,59 @@ def update_request_admin_message_id(request_id: int, message_id: int):
 def postpone_request(request_id: int):
     try:
         now = datetime.utcnow().isoformat()
-        client.table(QUEUE_TABLE) \
+        get_table(QUEUE_TABLE) \
             .update({"created_at": now}) \
             .eq("id", request_id) \
             .execute()
     except Exception:
         logging.exception(f"Error postponing request {request_id}")
+        return
+    with _queue_lock:
+        row = _requests.get(request_id)
+        if row is not None:
+            _push(dict(row, created_at=now))
 
-def process_queue(bot):
-    global _queue_cooldown
-    if _queue_cooldown:
+def process_queue(bot=None):
+    """يعرض رأس الطابور على الأدمن إن كان متفرغًا؛ لا يقرأ من قاعدة البيانات."""
+    global _current_request_id
+    bot = bot or _bot
+    if bot is None:
         return
 
     with _queue_lock:
-        req = get_next_request()
+        if _current_request_id is not None:
+            return
+        req = _peek()
         if not req:
             return
-
         request_id = req.get("id")
-        text = req.get("request_text", "")
+        _current_request_id = request_id
 
-        keyboard = InlineKeyboardMarkup(row_width=2)
-        keyboard.add(
-            InlineKeyboardButton("🔁 تأجيل", callback_data=f"admin_queue_postpone_{request_id}"),
-            InlineKeyboardButton("✅ تأكيد",  callback_data=f"admin_queue_accept_{request_id}"),
-            InlineKeyboardButton("🚫 إلغاء", callback_data=f"admin_queue_cancel_{request_id}"),
-            InlineKeyboardButton("✉️ رسالة للعميل", callback_data=f"admin_queue_message_{request_id}"),
-            InlineKeyboardButton("🖼️ صورة للعميل", callback_data=f"admin_queue_photo_{request_id}")
-        )
+    text = req.get("request_text", "")
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    keyboard.add(
+        InlineKeyboardButton("🔁 تأجيل", callback_data=f"admin_queue_postpone_{request_id}"),
+        InlineKeyboardButton("✅ تأكيد",  callback_data=f"admin_queue_accept_{request_id}"),
+        InlineKeyboardButton("🚫 إلغاء", callback_data=f"admin_queue_cancel_{request_id}"),
+        InlineKeyboardButton("✉️ رسالة للعميل", callback_data=f"admin_queue_message_{request_id}"),
+        InlineKeyboardButton("🖼️ صورة للعميل", callback_data=f"admin_queue_photo_{request_id}")
+    )
 
+    try:
         bot.send_message(ADMIN_MAIN_ID, text, reply_markup=keyboard, parse_mode="HTML")
+    except Exception:
+        logging.exception(f"[QUEUE] تعذر إرسال الطلب {request_id} للأدمن")
+        with _queue_lock:
+            if _current_request_id == request_id:
+                _current_request_id = None
 
-def queue_cooldown_start(bot=None):
-    global _queue_cooldown
-    _queue_cooldown = True
-    def release():
-        global _queue_cooldown
-        time.sleep(120)
-        _queue_cooldown = False
-        if bot is not None:
-            process_queue(bot)
-    threading.Thread(target=release, daemon=True).start()
+def release_queue(bot=None, request_id=None):
+    """الأدمن أنهى الطلب الحالي: اعرض الطلب التالي فورًا.
+    إذا مُرّر request_id ولم يعد هو المعروض (أُفرج عنه مسبقًا) فلا نلمس الطلب الجديد."""
+    global _current_request_id
+    with _queue_lock:
+        if request_id is None or _current_request_id == request_id:
+            _current_request_id = None
+    process_queue(bot)
 
 # نهاية ملف queue_service.py
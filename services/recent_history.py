@@ -0,0 +1,55 @@
+# services/recent_history.py
+"""
+آخر N صف لكل مستخدم (مشتريات، حركات) لعرض شاشات المحفظة بدون استعلام:
+- لكل مستخدم deque(maxlen=depth) الأحدث أولًا، و LRU على المستخدمين (max_users).
+- fill() عند أول عرض (من الجدول)، و add() عند كل كتابة للمستخدمين المحمّلين فقط؛
+  المستخدم غير المحمّل يُملأ كاملًا من الجدول عند عرضه.
+- ttl يحد بقاء النسخة (حذف المهام الدورية للسجلات القديمة يظهر بعده).
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class RecentHistory:
+    def __init__(self, depth, max_users, ttl):
+        self.depth = depth
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users = OrderedDict()  # user_id -> (deque, وقت الملء)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, user_id):
+        """الصفوف الأحدث أولًا، أو None إن لم يكن المستخدم محمّلًا."""
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached is None or time.monotonic() - cached[1] > self.ttl:
+                self._users.pop(user_id, None)
+                self.stats["misses"] += 1
+                return None
+            self._users.move_to_end(user_id)
+            self.stats["hits"] += 1
+            return list(cached[0])
+
+    def fill(self, user_id, rows):
+        """rows الأحدث أولًا (كما يعيدها الاستعلام)."""
+        with self._lock:
+            self._users[user_id] = (deque(rows[:self.depth], maxlen=self.depth), time.monotonic())
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def add(self, user_id, row):
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached is not None:
+                cached[0].appendleft(row)
+
+    def forget(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._users.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._users)
@@ -0,0 +1,294 @@
+# services/send_scheduler.py
+"""
+جدولة الرسائل الصادرة إلى تيليجرام مع احترام حدود المعدّل:
+- دلو رموز عام (~30 رسالة/ث) ودلو لكل محادثة (~1 رسالة/ث).
+- رسالة واحدة قيد الإرسال لكل محادثة ← ترتيب الرسائل داخل المحادثة محفوظ.
+- عند 429 يُحترم retry_after: تُعاد الرسالة لرأس طابور محادثتها وتُؤجَّل المحادثة.
+- الواجهة غير حاجبة: المعالج يعود فور وضع الرسالة في الطابور،
+  ويمكن تمرير callback لاستلام النتيجة (الرسالة المُرسلة) و on_error للخطأ.
+- install(bot) يلف دوال الإرسال/التعديل في البوت (ROUTED_METHODS) فيمر كل
+  bot.send_message(...) في المعالجات عبر نفس الطابور والدلاء؛ الاستدعاء هنا حاجب
+  (call) ويعيد الرسالة كما كان، أو يرفع الخطأ بعد استنفاد إعادة 429.
+
+الاستخدام:
+    from services import send_scheduler
+    send_scheduler.send_message(bot, user_id, "✅ تم تنفيذ طلبك")
+"""
+import functools
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from telebot.apihelper import ApiTelegramException
+
+from config import HANDLER_LANES
+
+GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))    # رسالة/ثانية لكل البوت
+PER_CHAT_RATE = float(os.getenv("SEND_PER_CHAT_RATE", "1"))  # رسالة/ثانية لكل محادثة
+GLOBAL_BURST = 5      # سعة الدلو العام: دفعة قصيرة دون تجاوز ~30 في أي ثانية
+PER_CHAT_BURST = 2
+# كل مسار معالجات قد ينتظر إرسالًا حاجبًا (install) + هامش للإرسال غير الحاجب
+SENDER_THREADS = int(os.getenv("SEND_THREADS", "0")) or HANDLER_LANES + 4
+MAX_RETRIES = 3
+
+# دوال Bot API التي تستهدف محادثة -> موضع chat_id بين المعاملات الموضعية
+ROUTED_METHODS = {
+    "send_message": 0, "send_photo": 0, "send_document": 0, "send_video": 0,
+    "send_animation": 0, "send_audio": 0, "send_voice": 0, "send_sticker": 0,
+    "send_media_group": 0, "send_location": 0, "send_contact": 0,
+    "forward_message": 0, "copy_message": 0,
+    "edit_message_text": 1, "edit_message_caption": 1, "edit_message_media": 1,
+    "edit_message_reply_markup": 0,
+}
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "stamp")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self, now) -> float:
+        """الزمن حتى توفر رمز (0 إن كان متاحًا الآن)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ("func", "args", "kwargs", "callback", "on_error", "attempts")
+
+    def __init__(self, func, args, kwargs, callback, on_error):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.callback = callback
+        self.on_error = on_error
+        self.attempts = 0
+
+
+_cond = threading.Condition()
+_chats = {}        # chat_id -> deque[_Job]
+_buckets = {}      # chat_id -> _TokenBucket
+_in_flight = set()
+_ready = deque()   # محادثات جاهزة للإرسال
+_delayed = []      # heap (وقت الجاهزية، chat_id)
+_global = _TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+_workers = []
+_stats = {"sent": 0, "failed": 0, "retried_429": 0}
+_local = threading.local()  # worker=True داخل خيوط المجدول
+
+
+def _ensure_workers():
+    if _workers:
+        return
+    for i in range(SENDER_THREADS):
+        t = threading.Thread(target=_worker, name=f"SendScheduler{i}", daemon=True)
+        _workers.append(t)
+        t.start()
+
+
+def _schedule(chat_id, now):
+    """يضع المحادثة في الجاهز أو المؤجل حسب دلوها (يُستدعى والقفل ممسوك)."""
+    bucket = _buckets.get(chat_id)
+    if bucket is None:
+        bucket = _buckets[chat_id] = _TokenBucket(PER_CHAT_RATE, PER_CHAT_BURST)
+    delay = bucket.wait_time(now)
+    if delay <= 0:
+        _ready.append(chat_id)
+    else:
+        heapq.heappush(_delayed, (now + delay, chat_id))
+
+
+def _promote(now):
+    while _delayed and _delayed[0][0] <= now:
+        _, chat_id = heapq.heappop(_delayed)
+        if chat_id not in _in_flight and _chats.get(chat_id):
+            _ready.append(chat_id)
+
+
+def _next_job():
+    with _cond:
+        while True:
+            now = time.monotonic()
+            _promote(now)
+            if _ready:
+                wait = _global.wait_time(now)
+                if wait <= 0:
+                    chat_id = _ready.popleft()
+                    _global.take(now)
+                    _buckets[chat_id].take(now)
+                    _in_flight.add(chat_id)
+                    return chat_id, _chats[chat_id][0]
+            else:
+                wait = (_delayed[0][0] - now) if _delayed else None
+            _cond.wait(wait)
+
+
+def _finish(chat_id, job, retry_after=None):
+    with _cond:
+        _in_flight.discard(chat_id)
+        queue_ = _chats.get(chat_id)
+        now = time.monotonic()
+        if retry_after is None and queue_ and queue_[0] is job:
+            queue_.popleft()
+        if queue_:
+            if retry_after is not None:
+                heapq.heappush(_delayed, (now + retry_after, chat_id))
+            else:
+                _schedule(chat_id, now)
+        else:
+            _chats.pop(chat_id, None)
+            bucket = _buckets.get(chat_id)
+            if bucket is not None and bucket.full(now):
+                _buckets.pop(chat_id, None)
+        _cond.notify_all()
+
+
+def _worker():
+    _local.worker = True
+    while True:
+        chat_id, job = _next_job()
+        job.attempts += 1
+        try:
+            result = job.func(*job.args, **job.kwargs)
+        except ApiTelegramException as e:
+            if e.error_code == 429 and job.attempts <= MAX_RETRIES:
+                retry_after = (e.result_json or {}).get("parameters", {}).get("retry_after", 1)
+                _stats["retried_429"] += 1
+                logging.warning(f"[SEND] 429 للمحادثة {chat_id}، إعادة بعد {retry_after} ث")
+                _finish(chat_id, job, retry_after=retry_after)
+                continue
+            _fail(chat_id, job, e)
+            continue
+        except Exception as e:
+            _fail(chat_id, job, e)
+            continue
+        _stats["sent"] += 1
+        _finish(chat_id, job)
+        if job.callback is not None:
+            try:
+                job.callback(result)
+            except Exception:
+                logging.exception("[SEND] خطأ في callback بعد الإرسال")
+
+
+def _fail(chat_id, job, exc):
+    _stats["failed"] += 1
+    _finish(chat_id, job)
+    if job.on_error is not None:
+        try:
+            job.on_error(exc)
+        except Exception:
+            logging.exception("[SEND] خطأ في on_error")
+    else:
+        logging.warning(f"[SEND] فشل الإرسال إلى {chat_id}: {exc}")
+
+
+# ---------- الواجهة العامة ----------
+def submit(chat_id, func, *args, callback=None, on_error=None, **kwargs):
+    """يضع أي استدعاء لـ Bot API يخص chat_id في طابور المحادثة ويعود فورًا."""
+    job = _Job(func, args, kwargs, callback, on_error)
+    with _cond:
+        _ensure_workers()
+        queue_ = _chats.get(chat_id)
+        if queue_ is None:
+            queue_ = _chats[chat_id] = deque()
+        queue_.append(job)
+        if len(queue_) == 1 and chat_id not in _in_flight:
+            _schedule(chat_id, time.monotonic())
+        _cond.notify()
+
+
+def call(chat_id, func, *args, **kwargs):
+    """مثل submit لكن حاجب: يعيد نتيجة الاستدعاء أو يرفع خطأه (للمعالجات التي تحتاج الرسالة)."""
+    if getattr(_local, "worker", False):
+        return func(*args, **kwargs)  # من داخل المجدول (callback مثلًا): انتظار أنفسنا يعلّق الخيط
+    done = threading.Event()
+    outcome = {}
+
+    def _result(result):
+        outcome["result"] = result
+        done.set()
+
+    def _error(exc):
+        outcome["error"] = exc
+        done.set()
+
+    submit(chat_id, func, *args, callback=_result, on_error=_error, **kwargs)
+    done.wait()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def _routed(method, position):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        chat_id = kwargs.get("chat_id", args[position] if len(args) > position else None)
+        if chat_id is None or getattr(_local, "worker", False):
+            # رسالة inline (بلا محادثة)، أو خيط المجدول ينفذ المهمة نفسها
+            return method(*args, **kwargs)
+        return call(chat_id, method, *args, **kwargs)
+
+    wrapper._scheduled = True
+    return wrapper
+
+
+def install(bot):
+    """كل bot.send_*/edit_* (ROUTED_METHODS) يمر عبر المجدول: الدلو العام ودلو المحادثة وإعادة 429."""
+    for name, position in ROUTED_METHODS.items():
+        method = getattr(bot, name, None)
+        if method is not None and not getattr(method, "_scheduled", False):
+            setattr(bot, name, _routed(method, position))
+
+
+def send_message(bot, chat_id, text, callback=None, on_error=None, **kwargs):
+    submit(chat_id, bot.send_message, chat_id, text, callback=callback, on_error=on_error, **kwargs)
+
+
+def send_photo(bot, chat_id, photo, callback=None, on_error=None, **kwargs):
+    submit(chat_id, bot.send_photo, chat_id, photo, callback=callback, on_error=on_error, **kwargs)
+
+
+def edit_message_text(bot, text, chat_id, message_id, callback=None, on_error=None, **kwargs):
+    submit(chat_id, bot.edit_message_text, text, chat_id, message_id,
+           callback=callback, on_error=on_error, **kwargs)
+
+
+def pending() -> int:
+    with _cond:
+        return sum(len(q) for q in _chats.values())
+
+
+def stats() -> dict:
+    return dict(_stats, pending=pending(), chats=len(_chats))
+
+
+def flush(timeout: float = 10.0) -> bool:
+    """ينتظر حتى يفرغ الطابور (للإغلاق والاختبار)."""
+    deadline = time.monotonic() + timeout
+    with _cond:
+        while any(_chats.values()):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _cond.wait(remaining)
+    return True
@@ -0,0 +1,435 @@
+# services/session_store.py
+"""
+مخزن موحّد لحالة المحادثات لكل مستخدم بدل القواميس المتفرقة في المعالجات:
+- سجل واحد مضغوط لكل مستخدم: {اسم التدفق: _Entry(القيمة، آخر وصول)}.
+- TTL لكل تدفق: الحالة المتروكة تنتهي تلقائيًا (تُحذف عند الوصول أو عند الكنس الدوري).
+- LRU على مستوى المستخدمين: عند تجاوز SESSION_MAX_USERS يُحذف الأقدم استخدامًا.
+- مكدس تنقل محدود: القوائم في التدفقات ذات nav_depth تتحول إلى deque(maxlen).
+- memory_usage(): تقدير بالبايت لحجم الحالة المخزنة.
+- persist(path): لقطات في SQLite (WAL) تنجو من restart_bot/os.execv:
+  الكتابة تدريجية (المدخلات المتغيرة فقط، دفعة كل SESSION_FLUSH_SECONDS)،
+  والتحميل كسول لكل مستخدم عند أول وصول فلا يتأخر الإقلاع مهما كبرت اللقطة.
+
+كل تدفق يُستخدم كقاموس عادي (user_id -> قيمة) فلا يتغير كود المعالجات:
+    from services.session_store import store
+    user_states = store.flow("cash_transfer", ttl=FLOW_TTL)
+    user_states[user_id] = {"step": "show_commission"}
+    user_states[user_id]["step"] = "awaiting_amount"   # تعديل في المكان
+الكتابة و flow[user_id] و setdefault تجدد TTL وتُعلِّم المدخل للحفظ (القيمة المعادة
+قابلة للتعديل في مكانها)، أما get و in والمرور على التدفق فقراءة فقط.
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping, MutableSet
+
+SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "20000"))
+FLOW_TTL = int(os.getenv("SESSION_FLOW_TTL", str(2 * 3600)))      # تدفقات الإدخال العادية
+ADMIN_WAIT_TTL = int(os.getenv("SESSION_ADMIN_TTL", str(24 * 3600)))  # تدفقات تنتظر الإدارة
+NAV_DEPTH = 20
+SESSION_DB = os.getenv("SESSION_DB", "data/sessions.db")
+FLUSH_SECONDS = float(os.getenv("SESSION_FLUSH_SECONDS", "1"))
+_SWEEP_EVERY = 1024  # كنس المنتهي كل N عملية كتابة
+
+
+class _Entry:
+    __slots__ = ("value", "stamp")
+
+    def __init__(self, value, stamp):
+        self.value = value
+        self.stamp = stamp
+
+
+def _sizeof(obj, depth=0) -> int:
+    size = sys.getsizeof(obj)
+    if depth > 3:
+        return size
+    if isinstance(obj, dict):
+        size += sum(_sizeof(k, depth + 1) + _sizeof(v, depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, deque)):
+        size += sum(_sizeof(v, depth + 1) for v in obj)
+    return size
+
+
+class SessionStore:
+    def __init__(self, max_users=SESSION_MAX_USERS):
+        self.max_users = max_users
+        self._sessions = OrderedDict()  # user_id -> {flow: _Entry}
+        self._ttls = {}                 # flow -> ttl بالثواني (None = بلا انتهاء)
+        self._nav = {}                  # flow -> أقصى عمق لمكدس التنقل
+        self._lock = threading.RLock()
+        self._writes = 0
+        self._stats = {"expired": 0, "evicted": 0, "loaded": 0, "flushed": 0}
+        # الاستمرارية (تُفعَّل بـ persist)
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._db_users = set()   # مستخدمون لهم لقطة لم تُحمَّل بعد؛ غيرهم لا يُقرأ من القرص
+        self._dirty = {}         # (user_id, flow) -> _Entry أو None (حذف)
+        self._flusher = None
+
+    def flow(self, name, ttl=FLOW_TTL, nav_depth=None):
+        """عرض قاموسي لتدفق واحد؛ الاستدعاء المتكرر بنفس الاسم يعيد نفس البيانات."""
+        self._ttls[name] = ttl
+        if nav_depth:
+            self._nav[name] = nav_depth
+        return FlowState(self, name)
+
+    def flow_set(self, name, ttl=FLOW_TTL):
+        """مجموعة user_id (مثل pending_orders) بنفس TTL والاستمرارية."""
+        self._ttls[name] = ttl
+        return FlowSet(self, name)
+
+    # ---------- الاستمرارية ----------
+    def persist(self, path=SESSION_DB):
+        """ربط المخزن بملف SQLite: حذف المنتهي وقراءة قائمة المستخدمين فقط."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " user_id INTEGER NOT NULL, flow TEXT NOT NULL, value BLOB NOT NULL, updated REAL NOT NULL,"
+            " PRIMARY KEY (user_id, flow)) WITHOUT ROWID"
+        )
+        now = time.time()
+        with db:
+            for name, ttl in self._ttls.items():
+                if ttl is not None:
+                    db.execute("DELETE FROM sessions WHERE flow = ? AND updated < ?", (name, now - ttl))
+        users = {row[0] for row in db.execute("SELECT DISTINCT user_id FROM sessions")}
+        with self._lock:
+            self._db = db
+            self._db_users = users - set(self._sessions)
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="SessionFlusher", daemon=True)
+            self._flusher.start()
+        logging.info(f"[SESSION] لقطة {path}: {len(users)} مستخدم (تحميل كسول)")
+
+    def _load_user(self, user_id):
+        """تحميل لقطة مستخدم واحد عند أول وصول (يُستدعى والقفل ممسوك)."""
+        self._db_users.discard(user_id)
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT flow, value, updated FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        now, wall = time.monotonic(), time.time()
+        session = self._sessions.get(user_id) or {}
+        # ما تغيّر ولم يُحفظ بعد (مستخدم أُخرج من LRU ثم عاد) أحدث من القرص
+        for (uid, name), entry in self._dirty.items():
+            if uid == user_id and entry is not None and name not in session:
+                session[name] = entry
+        for name, blob, updated in rows:
+            if name in session or (user_id, name) in self._dirty or name not in self._ttls:
+                continue
+            try:
+                value = pickle.loads(blob)
+            except Exception:
+                logging.warning(f"[SESSION] تعذر قراءة {name} للمستخدم {user_id}")
+                continue
+            session[name] = _Entry(value, now - max(0.0, wall - updated))
+        if session:
+            self._sessions[user_id] = session
+        self._stats["loaded"] += 1
+
+    def _touch(self, user_id, name, entry):
+        if self._db is not None:
+            self._dirty[(user_id, name)] = entry
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("[SESSION] فشل حفظ اللقطة")
+
+    def flush(self):
+        """كتابة المدخلات المتغيرة منذ آخر حفظ في معاملة واحدة."""
+        if self._db is None:
+            return
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            now, wall = time.monotonic(), time.time()
+            upserts, deletes = [], []
+            for (user_id, name), entry in dirty.items():
+                if entry is None:
+                    deletes.append((user_id, name))
+                    continue
+                try:
+                    blob = pickle.dumps(entry.value, protocol=pickle.HIGHEST_PROTOCOL)
+                except RuntimeError:
+                    # القيمة تتعدل الآن في خيط معالج: نعيد المحاولة في الدفعة التالية
+                    self._dirty.setdefault((user_id, name), entry)
+                    continue
+                except Exception:
+                    continue  # قيم غير قابلة للحفظ (دوال مثلًا) تبقى في الذاكرة فقط
+                upserts.append((user_id, name, blob, wall - (now - entry.stamp)))
+        if not upserts and not deletes:
+            return
+        with self._db_lock, self._db:
+            self._db.executemany(
+                "INSERT INTO sessions (user_id, flow, value, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id, flow) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+                upserts,
+            )
+            self._db.executemany("DELETE FROM sessions WHERE user_id = ? AND flow = ?", deletes)
+        self._stats["flushed"] += len(upserts) + len(deletes)
+
+    def close(self):
+        """حفظ أخير قبل الإغلاق أو إعادة التشغيل."""
+        self.flush()
+
+    # ---------- عمليات أساسية ----------
+    def _live(self, user_id, name, now, modify=False):
+        """المدخل إن كان موجودًا وغير منتهٍ (يُستدعى والقفل ممسوك).
+        modify=True: المستدعي سيعدّل القيمة في مكانها ← تجديد TTL وتعليمها للحفظ."""
+        if user_id in self._db_users:
+            self._load_user(user_id)
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+        entry = session.get(name)
+        if entry is None:
+            return None
+        ttl = self._ttls.get(name)
+        if ttl is not None and now - entry.stamp > ttl:
+            del session[name]
+            if not session:
+                del self._sessions[user_id]
+            self._stats["expired"] += 1
+            self._touch(user_id, name, None)
+            return None
+        self._sessions.move_to_end(user_id)
+        if modify:
+            entry.stamp = now
+            self._touch(user_id, name, entry)
+        return entry
+
+    def _wrap(self, name, value):
+        depth = self._nav.get(name)
+        if depth and isinstance(value, list):
+            return deque(value, maxlen=depth)
+        return value
+
+    def get(self, user_id, name, default=None):
+        with self._lock:
+            entry = self._live(user_id, name, time.monotonic())
+            return default if entry is None else entry.value
+
+    def access(self, user_id, name, default=None):
+        """مثل get لكن للتعديل في المكان: يجدد TTL ويُعلِّم المدخل للحفظ."""
+        with self._lock:
+            entry = self._live(user_id, name, time.monotonic(), modify=True)
+            return default if entry is None else entry.value
+
+    def contains(self, user_id, name) -> bool:
+        with self._lock:
+            return self._live(user_id, name, time.monotonic()) is not None
+
+    def set(self, user_id, name, value):
+        value = self._wrap(name, value)
+        now = time.monotonic()
+        with self._lock:
+            if user_id in self._db_users:
+                self._load_user(user_id)
+            session = self._sessions.get(user_id)
+            if session is None:
+                session = self._sessions[user_id] = {}
+            else:
+                self._sessions.move_to_end(user_id)
+            entry = session[name] = _Entry(value, now)
+            self._touch(user_id, name, entry)
+            while len(self._sessions) > self.max_users:
+                evicted, _ = self._sessions.popitem(last=False)
+                if self._db is not None:
+                    self._db_users.add(evicted)  # تبقى لقطته على القرص وتُحمَّل عند عودته
+                self._stats["evicted"] += 1
+            self._writes += 1
+            if self._writes % _SWEEP_EVERY == 0:
+                self._sweep(now)
+        return value
+
+    def setdefault(self, user_id, name, default=None):
+        with self._lock:
+            entry = self._live(user_id, name, time.monotonic(), modify=True)
+            if entry is not None:
+                return entry.value
+            return self.set(user_id, name, default)
+
+    def pop(self, user_id, name, *default):
+        with self._lock:
+            entry = self._live(user_id, name, time.monotonic())
+            if entry is None:
+                if default:
+                    return default[0]
+                raise KeyError(user_id)
+            session = self._sessions[user_id]
+            del session[name]
+            if not session:
+                del self._sessions[user_id]
+            self._touch(user_id, name, None)
+            return entry.value
+
+    def users(self, name):
+        """مستخدمو التدفق: من الذاكرة، ومن القرص لمن لم تُحمَّل لقطته (بلا تحميل)."""
+        with self._lock:
+            now = time.monotonic()
+            live = [uid for uid in list(self._sessions) if self._live(uid, name, now) is not None]
+            return live + self._unloaded_users(name, now)
+
+    def _unloaded_users(self, name, now):
+        """مستخدمو _db_users الذين لهم مدخل غير منتهٍ في التدفق (يُستدعى والقفل ممسوك)."""
+        if not self._db_users:
+            return []
+        ttl = self._ttls.get(name)
+        wall = time.time()
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT user_id, updated FROM sessions WHERE flow = ?", (name,)
+            ).fetchall()
+        found = {uid for uid, updated in rows
+                 if uid in self._db_users and (ttl is None or wall - updated <= ttl)}
+        # ما لم يُحفظ بعد (مستخدم أُخرج من LRU) أحدث من القرص
+        for (uid, flow), entry in self._dirty.items():
+            if flow != name or uid not in self._db_users:
+                continue
+            if entry is None or (ttl is not None and now - entry.stamp > ttl):
+                found.discard(uid)
+            else:
+                found.add(uid)
+        return list(found)
+
+    def clear_user(self, user_id):
+        with self._lock:
+            if user_id in self._db_users:
+                self._load_user(user_id)
+            for name in self._sessions.pop(user_id, {}):
+                self._touch(user_id, name, None)
+
+    # ---------- صيانة ومراقبة ----------
+    def _sweep(self, now):
+        for user_id in list(self._sessions):
+            session = self._sessions[user_id]
+            for name in [n for n, e in session.items()
+                         if self._ttls.get(n) is not None and now - e.stamp > self._ttls[n]]:
+                del session[name]
+                self._stats["expired"] += 1
+                self._touch(user_id, name, None)
+            if not session:
+                del self._sessions[user_id]
+
+    def sweep(self):
+        with self._lock:
+            self._sweep(time.monotonic())
+
+    def memory_usage(self) -> int:
+        """تقدير تقريبي بالبايت للسجلات المخزنة."""
+        with self._lock:
+            total = sys.getsizeof(self._sessions)
+            for user_id, session in self._sessions.items():
+                total += sys.getsizeof(user_id) + sys.getsizeof(session)
+                for entry in session.values():
+                    total += sys.getsizeof(entry) + _sizeof(entry.value)
+            return total
+
+    def counters(self) -> dict:
+        """مثل stats() بدون تفصيل التدفقات (O(1)، مناسب للسحب المتكرر)."""
+        with self._lock:
+            return dict(self._stats, users=len(self._sessions),
+                        unloaded=len(self._db_users), dirty=len(self._dirty))
+
+    def stats(self) -> dict:
+        with self._lock:
+            flows = {}
+            for session in self._sessions.values():
+                for name in session:
+                    flows[name] = flows.get(name, 0) + 1
+            return dict(self._stats, users=len(self._sessions), flows=flows,
+                        unloaded=len(self._db_users), dirty=len(self._dirty))
+
+
+class FlowState(MutableMapping):
+    """واجهة قاموس (user_id -> قيمة) فوق تدفق واحد في SessionStore.
+    flow[user_id] للتعديل في المكان (يجدد TTL)، و get/in للفحص فقط."""
+
+    __slots__ = ("_store", "name")
+
+    def __init__(self, store, name):
+        self._store = store
+        self.name = name
+
+    def __getitem__(self, user_id):
+        value = self._store.access(user_id, self.name, _MISSING)
+        if value is _MISSING:
+            raise KeyError(user_id)
+        return value
+
+    def __setitem__(self, user_id, value):
+        self._store.set(user_id, self.name, value)
+
+    def __delitem__(self, user_id):
+        self._store.pop(user_id, self.name)
+
+    def __contains__(self, user_id):
+        return self._store.contains(user_id, self.name)
+
+    def __iter__(self):
+        return iter(self._store.users(self.name))
+
+    def __len__(self):
+        return len(self._store.users(self.name))
+
+    def get(self, user_id, default=None):
+        return self._store.get(user_id, self.name, default)
+
+    def setdefault(self, user_id, default=None):
+        # تعيد القيمة المخزنة فعليًا (deque في تدفقات التنقل) لا default نفسه
+        return self._store.setdefault(user_id, self.name, default)
+
+    def pop(self, user_id, *default):
+        return self._store.pop(user_id, self.name, *default)
+
+    def __repr__(self):
+        return f"<FlowState {self.name}: {len(self)} users>"
+
+
+class FlowSet(MutableSet):
+    """واجهة مجموعة user_id فوق تدفق واحد (القيمة المخزنة True)."""
+
+    __slots__ = ("_store", "name")
+
+    def __init__(self, store, name):
+        self._store = store
+        self.name = name
+
+    def __contains__(self, user_id):
+        return self._store.contains(user_id, self.name)
+
+    def __iter__(self):
+        return iter(self._store.users(self.name))
+
+    def __len__(self):
+        return len(self._store.users(self.name))
+
+    def add(self, user_id):
+        self._store.set(user_id, self.name, True)
+
+    def discard(self, user_id):
+        self._store.pop(user_id, self.name, None)
+
+    def __repr__(self):
+        return f"<FlowSet {self.name}: {len(self)} users>"
+
+
+_MISSING = object()
+
+store = SessionStore()
+
+# حالة القوائم وسجل التنقل المشتركان بين كل المعالجات (كانا قاموسين في main.py)
+menu_state = store.flow("menu", ttl=ADMIN_WAIT_TTL, nav_depth=NAV_DEPTH)
+history = store.flow("history", ttl=ADMIN_WAIT_TTL, nav_depth=NAV_DEPTH)
@@ -53,11 +53,107 @@ CREATE TABLE public.pending_requests (
   status       text        DEFAULT 'pending',
   payload      jsonb
 );
+
+-- 6) دالة تعديل الرصيد الذرية apply_balance_delta (تُستدعى عبر RPC)
+--    تعدّل الرصيد وتسجّل الحركة في نفس المعاملة وترفض النزول تحت الصفر.
+CREATE OR REPLACE FUNCTION public.apply_balance_delta(
+  p_user_id     int8,
+  p_delta       int4,
+  p_description text
+) RETURNS TABLE (new_balance int4)
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_balance int4;
+BEGIN
+  UPDATE public.houssin363 AS u
+     SET balance = u.balance + p_delta
+   WHERE u.user_id = p_user_id
+     AND (p_delta >= 0 OR u.balance + p_delta >= 0)
+  RETURNING u.balance INTO v_balance;
+
+  IF NOT FOUND THEN
+    IF EXISTS (SELECT 1 FROM public.houssin363 WHERE user_id = p_user_id) THEN
+      RAISE EXCEPTION 'insufficient_balance' USING ERRCODE = 'P0001';
+    END IF;
+    RAISE EXCEPTION 'user_not_found' USING ERRCODE = 'P0002';
+  END IF;
+
+  INSERT INTO public.transactions (user_id, amount, description)
+  VALUES (p_user_id, p_delta, p_description);
+
+  RETURN QUERY SELECT v_balance;
+END;
+$$;
+
+-- 7) دالة التحويل الذرية transfer_balance (تُستدعى عبر RPC)
+--    خصم المرسل (المبلغ + الرسوم) وإضافة المبلغ للمستلم وحركتاهما في معاملة واحدة:
+--    أي فشل (رصيد غير كافٍ، مستلم غير موجود) يلغي الطرفين معًا.
+CREATE OR REPLACE FUNCTION public.transfer_balance(
+  p_from_user_id int8,
+  p_to_user_id   int8,
+  p_amount       int4,
+  p_fee          int4 DEFAULT 0
+) RETURNS TABLE (from_balance int4, to_balance int4)
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_from int4;
+  v_to   int4;
+BEGIN
+  -- قفل الصفين بترتيب ثابت: تحويلان متعاكسان لا يتبادلان القفل
+  PERFORM 1 FROM public.houssin363
+   WHERE user_id IN (p_from_user_id, p_to_user_id)
+   ORDER BY user_id
+   FOR UPDATE;
+
+  SELECT new_balance INTO v_from FROM public.apply_balance_delta(
+    p_from_user_id, -(p_amount + p_fee), 'تحويل إلى ' || p_to_user_id || ' (شامل الرسوم)');
+  SELECT new_balance INTO v_to FROM public.apply_balance_delta(
+    p_to_user_id, p_amount, 'تحويل من ' || p_from_user_id);
+
+  RETURN QUERY SELECT v_from, v_to;
+END;
+$$;
+
+-- 8) آخر نشاط لكل مستخدم user_last_activity (تصفح keyset على user_id)
+--    يعيد فقط من كان آخر نشاطه (إنشاء/حركة/شراء) قبل p_before.
+CREATE INDEX IF NOT EXISTS transactions_user_ts_idx ON public.transactions (user_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS purchases_user_created_idx ON public.purchases (user_id, created_at DESC);
+-- المشتريات المنتهية تحذفها cleanup_service.sweep_expired_purchases على دفعات
+CREATE INDEX IF NOT EXISTS purchases_expire_at_idx ON public.purchases (expire_at);
+
+CREATE OR REPLACE FUNCTION public.user_last_activity(
+  p_before        timestamptz,
+  p_after_user_id int8 DEFAULT 0,
+  p_limit         int4 DEFAULT 1000
+) RETURNS TABLE (user_id int8, last_activity timestamptz)
+LANGUAGE sql STABLE AS $$
+  SELECT u.user_id, a.last_activity
+    FROM public.houssin363 AS u
+   CROSS JOIN LATERAL (
+     SELECT GREATEST(
+       u.created_at,
+       (SELECT max(t.timestamp)  FROM public.transactions t WHERE t.user_id = u.user_id),
+       (SELECT max(p.created_at) FROM public.purchases    p WHERE p.user_id = u.user_id)
+     ) AS last_activity
+   ) AS a
+   WHERE u.user_id > p_after_user_id
+     AND a.last_activity < p_before
+   ORDER BY u.user_id
+   LIMIT p_limit;
+$$;
+
+-- 9) مفتاح التكرار لصفوف ledger_writer (upsert بـ ignore-duplicates على ledger_id)
+--    صفوف apply_balance_delta تبقى NULL (UNIQUE يسمح بعدة NULL).
+ALTER TABLE public.transactions ADD COLUMN IF NOT EXISTS ledger_id text UNIQUE;
+ALTER TABLE public.purchases    ADD COLUMN IF NOT EXISTS ledger_id text UNIQUE;
 ------------------------------------------------------------------
 """
 
 from datetime import datetime, timedelta
-from database.db import get_table
+from postgrest.exceptions import APIError
+from database.db import get_table, rpc
+from services import ledger_writer
+from services.recent_history import RecentHistory
 
 # أسماء الجداول
 USER_TABLE        = "houssin363"
@@ -65,6 +161,22 @@ TRANSACTION_TABLE = "transactions"
 PURCHASES_TABLE   = "purchases"
 PRODUCTS_TABLE    = "products"
 
+# دوال RPC لتعديل الرصيد ذرياً (انظر التعريف أعلاه)
+BALANCE_RPC = "apply_balance_delta"
+TRANSFER_RPC = "transfer_balance"
+
+# آخر المشتريات/الحركات لكل مستخدم في الذاكرة (شاشات المحفظة بلا استعلام)
+HISTORY_DEPTH = 20          # أكبر limit تعرضه الشاشات
+HISTORY_MAX_USERS = 20_000
+HISTORY_TTL = 3600
+_PURCHASE_COLUMNS = ("product_name", "price", "created_at", "player_id", "expire_at")
+_TRANSFER_COLUMNS = ("description", "amount", "timestamp")
+_recent_purchases = RecentHistory(HISTORY_DEPTH, HISTORY_MAX_USERS, HISTORY_TTL)
+_recent_transactions = RecentHistory(HISTORY_DEPTH, HISTORY_MAX_USERS, HISTORY_TTL)
+
+class InsufficientBalanceError(Exception):
+    """الخصم مرفوض من قاعدة البيانات لأن الرصيد لا يكفي."""
+
 # عمليات المستخدم
 def register_user_if_not_exist(user_id: int, name: str = "مستخدم") -> None:
     get_table(USER_TABLE).upsert(
@@ -75,6 +187,12 @@ def register_user_if_not_exist(user_id: int, name: str = "مستخدم") -> None
         on_conflict="user_id",
     ).execute()
 
+def forget_users(user_ids) -> None:
+    """بعد حذف مستخدمين من الجداول: إسقاط نسخهم من الذاكرة."""
+    user_ids = list(user_ids)
+    _recent_purchases.forget(user_ids)
+    _recent_transactions.forget(user_ids)
+
 def get_balance(user_id: int) -> int:
     response = (
         get_table(USER_TABLE)
@@ -85,62 +203,101 @@ def get_balance(user_id: int) -> int:
     )
     return response.data[0]["balance"] if response.data else 0
 
-def _update_balance(user_id: int, delta: int):
-    new_balance = get_balance(user_id) + delta
-    get_table(USER_TABLE).update({"balance": new_balance}).eq("user_id", user_id).execute()
+def _update_balance(user_id: int, delta: int, description: str) -> int:
+    """
+    يطبّق التغيير على الرصيد ويسجّل الحركة في استدعاء واحد ذري، ويعيد الرصيد الجديد.
+    يرفع InsufficientBalanceError إذا كان الخصم سيجعل الرصيد أقل من صفر.
+    """
+    try:
+        response = rpc(BALANCE_RPC, {
+            "p_user_id": user_id,
+            "p_delta": delta,
+            "p_description": description,
+        }).execute()
+    except APIError as e:
+        if e.message == "insufficient_balance":
+            raise InsufficientBalanceError(f"user {user_id}: balance too low for {delta}") from e
+        raise
+    # الحركة نفسها كتبتها الدالة في الجدول؛ هنا نسخة العرض فقط
+    _recent_transactions.add(user_id, {
+        "description": description,
+        "amount": delta,
+        "timestamp": datetime.utcnow().isoformat(),
+    })
+    return response.data[0]["new_balance"]
 
 def has_sufficient_balance(user_id: int, amount: int) -> bool:
     return get_balance(user_id) >= amount
 
-def add_balance(user_id: int, amount: int, description: str = "إيداع يدوي") -> None:
-    _update_balance(user_id, amount)
-    record_transaction(user_id, amount, description)
+def add_balance(user_id: int, amount: int, description: str = "إيداع يدوي") -> int:
+    return _update_balance(user_id, amount, description)
 
-def deduct_balance(user_id: int, amount: int, description: str = "خصم تلقائي") -> None:
-    _update_balance(user_id, -amount)
-    record_transaction(user_id, -amount, description)
-
-def record_transaction(user_id: int, amount: int, description: str) -> None:
-    data = {
-        "user_id": user_id,
-        "amount": amount,
-        "description": description,
-        "timestamp": datetime.utcnow().isoformat(),
-    }
-    get_table(TRANSACTION_TABLE).insert(data).execute()
+def deduct_balance(user_id: int, amount: int, description: str = "خصم تلقائي") -> int:
+    return _update_balance(user_id, -amount, description)
 
 def transfer_balance(from_user_id: int, to_user_id: int, amount: int, fee: int = 0) -> bool:
-    total = amount + fee
-    if not has_sufficient_balance(from_user_id, total):
-        return False
-    deduct_balance(from_user_id, total, f"تحويل إلى {to_user_id} (شامل الرسوم)")
-    add_balance(to_user_id, amount, f"تحويل من {from_user_id}")
+    """الطرفان وحركتاهما في استدعاء RPC واحد؛ False إن لم يكفِ الرصيد أو لم يوجد المستلم."""
+    try:
+        rpc(TRANSFER_RPC, {
+            "p_from_user_id": from_user_id,
+            "p_to_user_id": to_user_id,
+            "p_amount": amount,
+            "p_fee": fee,
+        }).execute()
+    except APIError as e:
+        if e.message in ("insufficient_balance", "user_not_found"):
+            return False
+        raise
+    now = datetime.utcnow().isoformat()
+    _recent_transactions.add(from_user_id, {
+        "description": f"تحويل إلى {to_user_id} (شامل الرسوم)",
+        "amount": -(amount + fee),
+        "timestamp": now,
+    })
+    _recent_transactions.add(to_user_id, {
+        "description": f"تحويل من {from_user_id}",
+        "amount": amount,
+        "timestamp": now,
+    })
     return True
 
 # المشتريات
+def _merge_pending(table, user_id, rows, columns, ts_column):
+    """صفوف الجدول + ما زال في ledger_writer ولم يُدرج بعد، الأحدث أولًا."""
+    pending = ledger_writer.pending_rows(table, user_id)
+    if not pending:
+        return rows
+    key = lambda row: tuple(str(row.get(c))[:19] for c in columns)
+    seen = {key(row) for row in rows}
+    rows = rows + [row for row in pending if key(row) not in seen]
+    rows.sort(key=lambda row: str(row.get(ts_column))[:26], reverse=True)
+    return rows
+
 def get_purchases(user_id: int, limit: int = 10):
-    # حذف السجلات الأقدم من 36 ساعة عند الاستعلام
     now = datetime.utcnow()
-    expire_time = now - timedelta(hours=36)
-    table = get_table(PURCHASES_TABLE)
-    # حذف القديم
-    table.delete().eq("user_id", user_id).lt("expire_at", now.isoformat()).execute()
-    # جلب المشتريات الفعالة فقط
-    response = (
-        table.select("product_name", "price", "created_at", "player_id", "expire_at")
-        .eq("user_id", user_id)
-        .gt("expire_at", now.isoformat())
-        .order("created_at", desc=True)
-        .limit(limit)
-        .execute()
-    )
+    rows = _recent_purchases.get(user_id)
+    if rows is None:
+        # جلب المشتريات الفعالة فقط (المنتهي يحذفه sweep_expired_purchases في الخلفية)
+        response = (
+            get_table(PURCHASES_TABLE).select(*_PURCHASE_COLUMNS)
+            .eq("user_id", user_id)
+            .gt("expire_at", now.isoformat())
+            .order("created_at", desc=True)
+            .limit(HISTORY_DEPTH)
+            .execute()
+        )
+        rows = _merge_pending(PURCHASES_TABLE, user_id, response.data or [], _PURCHASE_COLUMNS, "created_at")
+        _recent_purchases.fill(user_id, rows)
+    # المنتهي منذ التحميل يُستبعد هنا (expire_at بدون منطقة زمنية أو بـ +00:00)
+    now_iso = now.isoformat()
     items = []
-    for row in response.data or []:
+    for row in [r for r in rows if str(r.get("expire_at"))[:26] > now_iso][:limit]:
         ts = row["created_at"][:19].replace("T", " ")
         items.append(f"{row['product_name']} ({row['price']} ل.س) - آيدي/رقم: {row['player_id']} - بتاريخ {ts}")
     return items
 
-def add_purchase(user_id: int, product_id: int, product_name: str, price: int, player_id: str):
+def record_purchase(user_id: int, product_id: int, product_name: str, price: int, player_id: str):
+    """صف شراء بدون خصم: للطلبات التي حُجز مبلغها عند إرسالها (payload.reserved)."""
     expire_at = datetime.utcnow() + timedelta(hours=36)
     data = {
         "user_id": user_id,
@@ -151,21 +308,31 @@ def add_purchase(user_id: int, product_id: int, product_name: str, price: int, p
         "created_at": datetime.utcnow().isoformat(),
         "expire_at": expire_at.isoformat(),
     }
-    get_table(PURCHASES_TABLE).insert(data).execute()
+    ledger_writer.append(PURCHASES_TABLE, data)
+    _recent_purchases.add(user_id, data)
+
+def add_purchase(user_id: int, product_id: int, product_name: str, price: int, player_id: str):
+    """خصم السعر ثم تسجيل الشراء؛ يرفع InsufficientBalanceError بدون أي صف إن لم يكفِ الرصيد."""
+    # الخصم أولًا: إن رُفض لا يبقى صف شراء بلا خصم (الـ journal لا يُتراجع عنه)
     deduct_balance(user_id, price, f"شراء {product_name}")
+    record_purchase(user_id, product_id, product_name, price, player_id)
 
 # سجل التحويلات المالية (كل العمليات المالية)
 def get_transfers(user_id: int, limit: int = 10):
-    response = (
-        get_table(TRANSACTION_TABLE)
-        .select("description", "amount", "timestamp")
-        .eq("user_id", user_id)
-        .order("timestamp", desc=True)
-        .limit(limit)
-        .execute()
-    )
+    rows = _recent_transactions.get(user_id)
+    if rows is None:
+        response = (
+            get_table(TRANSACTION_TABLE)
+            .select(*_TRANSFER_COLUMNS)
+            .eq("user_id", user_id)
+            .order("timestamp", desc=True)
+            .limit(HISTORY_DEPTH)
+            .execute()
+        )
+        rows = _merge_pending(TRANSACTION_TABLE, user_id, response.data or [], _TRANSFER_COLUMNS, "timestamp")
+        _recent_transactions.fill(user_id, rows)
     transfers = []
-    for row in response.data or []:
+    for row in rows[:limit]:
         ts = row["timestamp"][:19].replace("T", " ")
         amount = row["amount"]
         desc = row["description"]
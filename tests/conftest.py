@@ -0,0 +1,7 @@
+# tests/conftest.py
+import os
+import sys
+
+# الاختبارات تعمل على الواجهة المحلية بدون شبكة (database/local_backend)
+os.environ.setdefault("DB_BACKEND", "local")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,91 @@
+# tests/test_agent_codes.py
+import os
+
+import pytest
+
+from services import agent_codes_service
+
+
+def _reset():
+    if agent_codes_service._log is not None:
+        agent_codes_service._log.close()
+    agent_codes_service._codes.clear()
+    agent_codes_service._log = None
+    agent_codes_service._path = None
+    agent_codes_service._lines = 0
+
+
+@pytest.fixture
+def codes(tmp_path, monkeypatch):
+    path = str(tmp_path / "agent_codes.jsonl")
+    monkeypatch.setattr(agent_codes_service, "LEGACY_CODES_FILE", str(tmp_path / "secret_codes.json"))
+    monkeypatch.setattr(agent_codes_service, "COMPACT_EVERY", 3)
+    _reset()
+    with agent_codes_service._lock:
+        agent_codes_service._open(path)
+    yield path
+    _reset()
+
+
+def _record(n, start=0):
+    for i in range(start, start + n):
+        agent_codes_service.record("A", f"u{i}", 10, "2025-01-01 10:00")
+
+
+def _reopen(path):
+    _reset()
+    with agent_codes_service._lock:
+        agent_codes_service._open(path)
+
+
+def _check(path, ops):
+    report = agent_codes_service.report()
+    assert report["A"]["count"] == ops
+    assert report["A"]["total"] == 10 * ops
+    assert [op["user"] for op in agent_codes_service.iter_operations()] == [f"u{i}" for i in range(ops)]
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_rotation_keeps_all_operations(codes):
+    _record(8)
+    assert agent_codes_service._archives(codes)
+    _reopen(codes)
+    _check(codes, 8)
+
+
+def test_crash_before_archive_rename(codes, monkeypatch):
+    _record(3)
+    real = os.rename
+
+    def crash(*_args):
+        raise OSError("crash")
+
+    monkeypatch.setattr(agent_codes_service.os, "rename", crash)
+    with pytest.raises(OSError):
+        _record(1, start=3)  # السطر الرابع يطلق التدوير
+    monkeypatch.setattr(agent_codes_service.os, "rename", real)
+    # الملف النشط كامل و.tmp بجانبه
+    assert os.path.exists(codes) and os.path.exists(codes + ".tmp")
+    _reopen(codes)
+    _check(codes, 4)
+    _record(1, start=4)
+    _check(codes, 5)
+
+
+def test_crash_after_archive_rename(codes, monkeypatch):
+    _record(3)
+    real = os.replace
+
+    def crash(*_args):
+        raise OSError("crash")
+
+    monkeypatch.setattr(agent_codes_service.os, "replace", crash)
+    with pytest.raises(OSError):
+        _record(1, start=3)  # السطر الرابع يطلق التدوير
+    monkeypatch.setattr(agent_codes_service.os, "replace", real)
+    # الملف النشط انتقل إلى الأرشيف والملخص ما زال في .tmp
+    assert not os.path.exists(codes) and os.path.exists(codes + ".tmp")
+    _reopen(codes)
+    _check(codes, 4)
+    _record(1, start=4)
+    _check(codes, 5)
@@ -0,0 +1,125 @@
+# tests/test_ledger_writer.py
+import pytest
+from postgrest.exceptions import APIError
+
+from database import db
+from database.local_backend import LocalClient
+from services import ledger_writer
+
+
+class _Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    """كاتب جديد على journal مؤقت وقاعدة محلية فارغة، بدون خيط الدفعات."""
+    monkeypatch.setattr(db, "client", LocalClient())
+    monkeypatch.setattr(ledger_writer, "_flush_loop", lambda: None)
+    _reset()
+    yield str(tmp_path / "ledger.jsonl")
+    _reset()
+
+
+def _reset():
+    """حالة العملية بعد إعادة التشغيل (الملفات على القرص تبقى)."""
+    if ledger_writer._journal is not None:
+        ledger_writer._journal.close()
+    ledger_writer._journal = None
+    ledger_writer._buffer.clear()
+    ledger_writer._attempts.clear()
+    ledger_writer._seq = 0
+    ledger_writer._idempotent = True
+    for key in ledger_writer._stats:
+        ledger_writer._stats[key] = 0
+
+
+def _rows(table="purchases"):
+    return db.get_table(table).select("*").execute().data
+
+
+def _append(n):
+    for i in range(n):
+        ledger_writer.append("purchases", {"user_id": 1, "product_name": f"p{i}", "price": i})
+
+
+def test_replay_after_crash_between_checkpoint_and_truncate(writer, monkeypatch):
+    ledger_writer.start(writer)
+    _append(3)
+    write_checkpoint = ledger_writer._write_checkpoint
+
+    def crash_after_checkpoint(seq):
+        write_checkpoint(seq)
+        raise _Crash()
+
+    monkeypatch.setattr(ledger_writer, "_write_checkpoint", crash_after_checkpoint)
+    with pytest.raises(_Crash):
+        ledger_writer.flush()
+    monkeypatch.setattr(ledger_writer, "_write_checkpoint", write_checkpoint)
+    # الـ journal لم يُفرَّغ لكن الـ checkpoint يغطي كل صفوفه
+    assert len(open(writer, encoding="utf-8").readlines()) == 3
+
+    _reset()
+    ledger_writer.start(writer)
+    assert ledger_writer.pending() == 0
+    _append(1)
+    ledger_writer.flush()
+    assert len(_rows()) == 4
+    assert ledger_writer.stats()["seq"] == 4
+
+
+def test_replay_after_crash_between_insert_and_checkpoint(writer, monkeypatch):
+    ledger_writer.start(writer)
+    _append(3)
+    write_checkpoint = ledger_writer._write_checkpoint
+
+    def crash_before_checkpoint(seq):
+        raise _Crash()
+
+    monkeypatch.setattr(ledger_writer, "_write_checkpoint", crash_before_checkpoint)
+    with pytest.raises(_Crash):
+        ledger_writer.flush()
+    monkeypatch.setattr(ledger_writer, "_write_checkpoint", write_checkpoint)
+    assert len(_rows()) == 3
+
+    _reset()
+    ledger_writer.start(writer)
+    assert ledger_writer.pending() == 3
+    ledger_writer.flush()
+    # الإعادة upsert بـ ignore-duplicates على ledger_id: لا صفوف مكررة
+    assert len(_rows()) == 3
+    assert ledger_writer.pending() == 0
+    assert open(writer, encoding="utf-8").read() == ""
+
+
+def test_missing_ledger_id_column_falls_back_to_sync_inserts(writer, monkeypatch):
+    ledger_writer.start(writer)
+    _append(2)
+    _reset()
+
+    get_table = ledger_writer.get_table
+
+    def without_ledger_id(table):
+        query = get_table(table)
+        select = query.select
+
+        def checked_select(*columns, **kwargs):
+            if ledger_writer.LEDGER_ID_COLUMN in columns:
+                raise APIError({"message": "column purchases.ledger_id does not exist", "code": "42703"})
+            return select(*columns, **kwargs)
+
+        query.select = checked_select
+        return query
+
+    monkeypatch.setattr(ledger_writer, "get_table", without_ledger_id)
+    ledger_writer.start(writer)
+    # ما بقي في الـ journal أُدرج مباشرة، والكاتب لا يفتح journal
+    assert ledger_writer.stats()["sync"] == 1
+    assert len(_rows()) == 2
+    assert open(writer, encoding="utf-8").read() == ""
+
+    _append(1)
+    rows = _rows()
+    assert len(rows) == 3
+    assert all(ledger_writer.LEDGER_ID_COLUMN not in row for row in rows)
+    assert ledger_writer.pending() == 0
@@ -0,0 +1,57 @@
+# tests/test_notification_service.py
+import json
+import os
+import time
+
+import pytest
+
+from services import notification_service
+
+
+@pytest.fixture
+def broadcasts(tmp_path, monkeypatch):
+    monkeypatch.setattr(notification_service, "BROADCAST_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _skip_all(_user_id):
+    return None  # لا إرسال فعلي: كل المستخدمين skipped
+
+
+def test_checkpoint_removed_on_completion(broadcasts):
+    counts = notification_service.broadcast(None, _skip_all, user_ids=[1, 2, 3], broadcast_id="b1", page_size=2)
+    assert counts["skipped"] == 3
+    assert not (broadcasts / "b1.json").exists()
+    completed = json.loads((broadcasts / "completed.json").read_text(encoding="utf-8"))
+    assert completed["b1"]["skipped"] == 3
+    # إعادة التشغيل بالاسم نفسه لا تعيد البث
+    assert notification_service.broadcast(None, lambda _u: "x", user_ids=[1], broadcast_id="b1") == counts
+
+
+def test_completed_ids_are_capped(broadcasts, monkeypatch):
+    monkeypatch.setattr(notification_service, "BROADCAST_KEEP_DONE", 3)
+    for day in range(5):
+        notification_service.broadcast(None, _skip_all, user_ids=[1], broadcast_id=f"inactive-warning-{day}")
+    completed = json.loads((broadcasts / "completed.json").read_text(encoding="utf-8"))
+    assert list(completed) == ["inactive-warning-2", "inactive-warning-3", "inactive-warning-4"]
+
+
+def test_stale_checkpoints_pruned(broadcasts):
+    stale = broadcasts / "inactive-warning-old.json"
+    stale.write_text(json.dumps({"after": 0, "offset": 1, "counts": {}}), encoding="utf-8")
+    old = time.time() - (notification_service.BROADCAST_STALE_DAYS + 1) * 86400
+    os.utime(stale, (old, old))
+    fresh = broadcasts / "running.json"
+    fresh.write_text("{}", encoding="utf-8")
+    notification_service.broadcast(None, _skip_all, user_ids=[1], broadcast_id="b2")
+    assert not stale.exists()
+    assert fresh.exists()
+
+
+def test_legacy_done_checkpoint(broadcasts):
+    counts = {"delivered": 4, "blocked": 0, "failed": 0, "skipped": 0}
+    (broadcasts / "b3.json").write_text(
+        json.dumps({"after": 0, "offset": 4, "done": True, "counts": counts}), encoding="utf-8"
+    )
+    assert notification_service.broadcast(None, lambda _u: "x", user_ids=[1], broadcast_id="b3") == counts
+    assert not (broadcasts / "b3.json").exists()
@@ -0,0 +1,82 @@
+# tests/test_router.py
+import pytest
+import telebot
+from telebot import types
+
+from handlers import router
+
+
+def _message(text, update_id=1):
+    return types.Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": 7, "type": "private"},
+            "from": {"id": 7, "is_bot": False, "first_name": "t"},
+        },
+    })
+
+
+def _callback(data, update_id=1):
+    return types.Update.de_json({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "data": data, "chat_instance": "c",
+            "from": {"id": 7, "is_bot": False, "first_name": "t"},
+        },
+    })
+
+
+@pytest.fixture
+def bot():
+    return telebot.TeleBot("1:X", threaded=False)
+
+
+def test_exact_text_beats_prefix(bot):
+    seen = []
+    router.on_text_prefix(bot, "/done")(lambda m: seen.append("prefix"))
+    router.on_text(bot, "/done_1")(lambda m: seen.append("exact"))
+    bot.process_new_updates([_message("/done_1"), _message("/done_2", 2)])
+    assert seen == ["exact", "prefix"]
+
+
+def test_longest_prefix_wins(bot):
+    seen = []
+    router.on_callback_prefix(bot, "admin_")(lambda c: seen.append("admin_"))
+    router.on_callback_prefix(bot, "admin_queue_")(lambda c: seen.append("admin_queue_"))
+    bot.process_new_updates([_callback("admin_queue_accept_5"), _callback("admin_stats", 2)])
+    assert seen == ["admin_queue_", "admin_"]
+
+
+def test_predicate_falls_through(bot):
+    seen = []
+    router.on_text(bot, "💰 محفظتي", func=lambda m: False)(lambda m: seen.append("blocked"))
+    router.on_text_prefix(bot, "💰")(lambda m: seen.append("prefix"))
+    bot.process_new_updates([_message("💰 محفظتي")])
+    assert seen == ["prefix"]
+
+
+def test_router_runs_before_earlier_handlers(bot):
+    seen = []
+
+    @bot.message_handler(func=lambda m: True)
+    def catch_all(msg):
+        seen.append("catch_all")
+
+    @bot.callback_query_handler(func=lambda c: True)
+    def catch_all_cb(call):
+        seen.append("catch_all_cb")
+
+    router.on_text(bot, "hi")(lambda m: seen.append("route"))
+    router.on_callback(bot, "go")(lambda c: seen.append("route_cb"))
+    assert bot.message_handlers[0]["function"] is not catch_all
+    assert bot.callback_query_handlers[0]["function"] is not catch_all_cb
+
+    bot.process_new_updates([_message("hi"), _message("other", 2), _callback("go", 3), _callback("x", 4)])
+    assert seen == ["route", "catch_all", "route_cb", "catch_all_cb"]
+
+
+def test_frozen_router_rejects_routes(bot):
+    router.get_router(bot).freeze()
+    with pytest.raises(RuntimeError):
+        router.on_text(bot, "late")(lambda m: None)
@@ -0,0 +1,106 @@
+# tests/test_session_store.py
+from services.session_store import SessionStore
+
+
+def _age(store, user_id, name, seconds):
+    store._sessions[user_id][name].stamp -= seconds
+
+
+def test_entry_expires_after_ttl():
+    store = SessionStore()
+    flow = store.flow("steps", ttl=60)
+    flow[1] = {"step": "amount"}
+    _age(store, 1, "steps", 61)
+    assert 1 not in flow
+    assert flow.get(1) is None
+    assert store.counters()["expired"] == 1
+
+
+def test_reads_do_not_refresh_ttl():
+    store = SessionStore()
+    flow = store.flow("steps", ttl=60)
+    flow[1] = {"step": "amount"}
+    _age(store, 1, "steps", 50)
+    assert flow.get(1) == {"step": "amount"}
+    assert 1 in flow
+    _age(store, 1, "steps", 11)
+    assert 1 not in flow
+
+
+def test_item_access_refreshes_ttl():
+    store = SessionStore()
+    flow = store.flow("steps", ttl=60)
+    flow[1] = {"step": "amount"}
+    _age(store, 1, "steps", 50)
+    flow[1]["step"] = "confirm"
+    _age(store, 1, "steps", 50)
+    assert flow.get(1) == {"step": "confirm"}
+
+
+def test_reads_do_not_mark_dirty(tmp_path):
+    store = SessionStore()
+    flow = store.flow("steps", ttl=60)
+    store.persist(str(tmp_path / "sessions.db"))
+    flow[1] = {"step": "amount"}
+    store.flush()
+    flow.get(1)
+    assert 1 in flow
+    assert store.counters()["dirty"] == 0
+    flow[1]["step"] = "confirm"
+    assert store.counters()["dirty"] == 1
+
+
+def test_restore_from_snapshot(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    old = SessionStore()
+    steps = old.flow("steps", ttl=60)
+    old.flow_set("pending", ttl=None)
+    old.persist(path)
+    steps[1] = {"step": "amount"}
+    steps[2] = {"step": "number"}
+    old.flow_set("pending", ttl=None).add(3)
+    old.flush()
+
+    new = SessionStore()
+    flow = new.flow("steps", ttl=60)
+    pending = new.flow_set("pending", ttl=None)
+    new.persist(path)
+    assert new.counters()["unloaded"] == 3
+    # العد والمرور لا يحمّلان اللقطات
+    assert len(flow) == 2
+    assert sorted(flow) == [1, 2]
+    assert list(pending) == [3]
+    assert new.counters()["unloaded"] == 3
+    # أول وصول يحمّل لقطة المستخدم
+    assert flow.get(1) == {"step": "amount"}
+    assert new.counters()["unloaded"] == 2
+
+
+def test_expired_rows_are_dropped_on_restore(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    old = SessionStore()
+    steps = old.flow("steps", ttl=60)
+    old.persist(path)
+    steps[1] = {"step": "amount"}
+    _age(old, 1, "steps", 120)
+    old.flush()
+
+    new = SessionStore()
+    flow = new.flow("steps", ttl=60)
+    new.persist(path)
+    assert len(flow) == 0
+    assert flow.get(1) is None
+
+
+def test_evicted_user_is_counted_and_reloaded(tmp_path):
+    store = SessionStore(max_users=2)
+    flow = store.flow("steps", ttl=60)
+    store.persist(str(tmp_path / "sessions.db"))
+    for user_id in (1, 2, 3):
+        flow[user_id] = {"step": user_id}
+    assert store.counters()["users"] == 2
+    # المستخدم 1 أُخرج من الذاكرة قبل الحفظ ← يُعد من _dirty
+    assert sorted(flow) == [1, 2, 3]
+    store.flush()
+    assert sorted(flow) == [1, 2, 3]
+    assert flow.get(1) == {"step": 1}